@@ -1,10 +1,30 @@
 import os
-import re
+import math
 import io
-from flask import Flask, request, jsonify, render_template, send_file
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, Response, g, request, jsonify, render_template, send_file, stream_with_context
 from flask_cors import CORS
-import yt_dlp
 import logging
+import http_cache
+import metrics
+from transcript_cache import TranscriptCache
+from transcript_handles import TranscriptHandleStore, export_fields
+from transcript_search import TranscriptIndex
+from singleflight import SingleFlight
+from extract_pool import ExtractionPool
+from extract_tasks import (CUE_BATCH, YDL_OPTS, batched, extract_info, parse_caption_content,  # noqa: F401
+                           parse_caption_cues, track_cues, upstream, ydl_pool)
+from upstream import UpstreamError
+from caption_sources import (MAX_TRACKS, TranscriptApiSource, YtDlpSource, build_caption_sources,
+                             parse_languages, select_caption_tracks)
+from youtube_urls import canonical_url, extract_video_id, is_youtube_url
+from batch import DEFAULT_LIMIT, DEFAULT_WORKERS, iter_batch_results, transcription_payload
+from jobs import DONE, JobQueue, store_from_env
+from cues import CueList, join_cue_text
+from docx_export import build_docx
+from exports import STREAM_CONTENT_TYPES, content_disposition, export_filename, iter_export
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,15 +33,68 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
+TRACE_LOG = os.environ.get('TRACE_LOG', '0') == '1'
+
+transcript_cache = TranscriptCache.from_env()
+transcript_handles = TranscriptHandleStore.from_env()
+transcript_index = TranscriptIndex.from_env()
+extraction_flights = SingleFlight()
+
+YTDL_POOL_WARM = int(os.environ.get('YTDL_POOL_WARM', 0))
+# yt-dlp extractions and caption downloads run in supervised child processes
+# (see extract_pool.py), which load only extract_tasks and its dependencies
+extraction_pool = ExtractionPool.from_env(preload=('extract_tasks', 'yt_dlp', 'requests'))
+# Concurrent track downloads per all-tracks request
+TRACK_WORKERS = int(os.environ.get('TRACK_WORKERS', 4))
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.trace_token = metrics.start_trace(method=request.method, path=request.path) if TRACE_LOG else None
+
+@app.after_request
+def note_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.after_request
+def set_cache_control(response):
+    if request.url_rule is not None and 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = http_cache.cache_control(request.method, request.url_rule.rule,
+                                                                     response.status_code)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    # Runs after a streamed body has been sent, so export time is included
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = str(g.pop('response_status', 500))
+    metrics.REGISTRY.observe('yt_http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+    metrics.inc('yt_http_requests_total', endpoint=endpoint, status=status)
+    token = g.pop('trace_token', None)
+    if token is not None:
+        metrics.end_trace(token, endpoint=endpoint, status=int(status))
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of stage timings and counters for all workers"""
+    return Response(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/transcribe', methods=['POST'])
+@app.route('/transcribe', methods=['GET', 'POST'])
 def transcribe_video():
+    """Extract a transcript; GET takes the same fields as query parameters so CDNs can cache it"""
     try:
-        data = request.get_json()
+        data = request.get_json() if request.method == 'POST' else query_options(request.args)
         youtube_url = data.get('url', '').strip()
+        include_cues = bool(data.get('include_cues'))
+        all_tracks = bool(data.get('all_tracks'))
         
         if not youtube_url:
             return jsonify({'error': 'No URL provided'}), 400
@@ -29,322 +102,635 @@ def transcribe_video():
         # Validate YouTube URL
         if not is_valid_youtube_url(youtube_url):
             return jsonify({'error': 'Invalid YouTube URL'}), 400
+
+        try:
+            languages = parse_languages(data.get('languages'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         logger.info(f"Processing YouTube URL: {youtube_url}")
+
+        if all_tracks:
+            result = get_all_tracks(youtube_url, languages)
+            if not result:
+                return jsonify({'error': no_captions_message(languages)}), 404
+            payload = all_tracks_payload(result, include_cues)
+            handle = payload['tracks'][0]['handle'] if payload['tracks'] else None
+            return transcript_response(payload, handle)
         
-        # Extract closed captions from YouTube video
-        captions_data = extract_youtube_captions(youtube_url)
+        # Extract closed captions and video info in a single yt-dlp pass
+        captions_data = get_captions(youtube_url, languages)
         
         if not captions_data:
-            return jsonify({'error': 'No closed captions found for this video. The video may not have captions available.'}), 404
+            return jsonify({'error': no_captions_message(languages)}), 404
         
-        # Extract video info for context
-        video_info = get_video_info(youtube_url)
-        
-        response_data = {
-            'transcription': captions_data['text'],
-            'title': video_info.get('title', 'Unknown Title'),
-            'duration': video_info.get('duration', 'Unknown Duration'),
-            'uploader': video_info.get('uploader', 'Unknown'),
-            'language': captions_data.get('language', 'Unknown'),
-            'caption_type': captions_data.get('type', 'Unknown'),
-            'success': True
-        }
+        response_data = transcription_payload(captions_data, include_cues=include_cues)
+        response_data['handle'] = transcript_handles.put(captions_data)
         
         logger.info("Captions extracted successfully")
-        return jsonify(response_data)
+        return transcript_response(response_data, response_data['handle'])
         
+    except UpstreamError as e:
+        logger.error(f"Upstream refused caption extraction: {str(e)}")
+        return upstream_error_response(e)
     except Exception as e:
         logger.error(f"Error during caption extraction: {str(e)}")
         return jsonify({'error': f'Caption extraction failed: {str(e)}'}), 500
 
-@app.route('/download/json', methods=['POST'])
-def download_json():
+def query_options(args):
+    """GET /transcribe query parameters shaped like a POST body"""
+    return {
+        'url': args.get('url', ''),
+        'languages': args.get('languages'),
+        'include_cues': args.get('include_cues', '') not in ('', '0', 'false'),
+        'all_tracks': args.get('all_tracks', '') not in ('', '0', 'false'),
+    }
+
+def precondition_response(tag, encoding=None, vary=True):
+    """304 (GET/HEAD) or 412 (POST) when If-None-Match names tag, else None"""
+    status = http_cache.precondition_status(request.method, request.headers.get('If-None-Match'), tag)
+    if status == 304:
+        return Response(status=304, headers=http_cache.validator_headers(tag, encoding, vary))
+    if status == 412:
+        return jsonify({'error': 'If-None-Match matches the current response'}), 412
+    return None
+
+def transcript_response(payload, handle):
+    """JSON response with an ETag, compressed once per transcript and served from the handle's artifacts
+
+    Answers 304 when a GET's If-None-Match names the body the client already has.
+    """
+    response = jsonify(payload)
+    body = response.get_data()
+    tag = http_cache.etag(body)
+    encoding = http_cache.choose_encoding(len(body), request.headers.get('Accept-Encoding'))
+    precondition = precondition_response(tag, encoding)
+    if precondition is not None:
+        return precondition
+    response.set_data(http_cache.encode(body, tag, encoding, transcript_handles, handle, 'transcribe'))
+    response.headers.update(http_cache.representation_headers(tag, encoding))
+    return response
+
+@app.route('/transcribe/stream', methods=['GET', 'POST'])
+def transcribe_stream():
+    """Server-Sent Events: video metadata, then caption text as it is parsed, then a done event
+
+    Takes the same fields as /transcribe, except all_tracks. Invalid requests
+    get a JSON error; failures after the stream has started arrive as an
+    error event.
+    """
+    data = (request.get_json(silent=True) or {}) if request.method == 'POST' else query_options(request.args)
+    youtube_url = str(data.get('url') or '').strip()
+    if not youtube_url:
+        return jsonify({'error': 'No URL provided'}), 400
+    if not is_valid_youtube_url(youtube_url):
+        return jsonify({'error': 'Invalid YouTube URL'}), 400
     try:
-        data = request.get_json()
-        transcription = data.get('transcription', '')
-        meta = {
-            'title': data.get('title', ''),
-            'duration': data.get('duration', ''),
-            'uploader': data.get('uploader', ''),
-            'language': data.get('language', ''),
-            'caption_type': data.get('caption_type', ''),
-        }
+        languages = parse_languages(data.get('languages'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-        payload = {
-            'transcription': transcription,
-            'metadata': meta,
-        }
+    logger.info(f"Streaming YouTube URL: {youtube_url}")
+    events = iter_transcript_events(extract_video_id(youtube_url), languages, bool(data.get('include_cues')))
+    # X-Accel-Buffering stops nginx-style proxies from holding events back
+    return Response(stream_with_context(events), content_type='text/event-stream',
+                    headers={'X-Accel-Buffering': 'no'})
+
+@app.route('/transcribe/batch', methods=['POST'])
+def transcribe_batch():
+    """Stream NDJSON results for a list of URLs or a playlist/channel URL"""
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls') or []
+    if isinstance(urls, str):
+        urls = [urls]
+    if data.get('url'):
+        urls = [data['url']] + list(urls)
+    urls = [u.strip() for u in urls if isinstance(u, str) and u.strip()]
+
+    if not urls:
+        return jsonify({'error': 'No URLs provided'}), 400
+
+    try:
+        max_workers = min(int(data.get('max_workers') or DEFAULT_WORKERS), DEFAULT_WORKERS)
+        limit = int(data.get('limit') or DEFAULT_LIMIT)
+        if DEFAULT_LIMIT:
+            limit = min(limit, DEFAULT_LIMIT)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_workers and limit must be integers'}), 400
+
+    logger.info(f"Processing batch of {len(urls)} URL(s)")
+
+    def generate():
+        for item in iter_batch_results(urls, get_captions, fetch_playlist_info,
+                                       max_workers=max_workers, limit=limit):
+            yield json.dumps(item, ensure_ascii=False) + '\n'
 
-        import json
-        json_bytes = json.dumps(payload, ensure_ascii=False, indent=2).encode('utf-8')
-        filename = f"{slugify(meta.get('title') or 'youtube_captions')}.json"
-        return send_file(
-            io.BytesIO(json_bytes),
-            mimetype='application/json',
-            as_attachment=True,
-            download_name=filename
-        )
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a caption extraction and return its job ID without waiting"""
+    data = request.get_json(silent=True) or {}
+    youtube_url = (data.get('url') or '').strip()
+
+    if not youtube_url:
+        return jsonify({'error': 'No URL provided'}), 400
+    if not is_valid_youtube_url(youtube_url):
+        return jsonify({'error': 'Invalid YouTube URL'}), 400
+
+    job_id = job_queue.submit(youtube_url)
+    logger.info(f"Queued job {job_id} for {youtube_url}")
+    return jsonify({
+        'job_id': job_id,
+        'status': 'pending',
+        'status_url': f"/jobs/{job_id}",
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    response_data = {'job_id': job_id, 'status': job['status']}
+    if job['status'] == DONE:
+        response_data['result'] = transcription_payload(job['result'])
+    elif job['error']:
+        response_data['error'] = job['error']
+    return jsonify(response_data)
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(dict(transcript_cache.stats(), coalescing=extraction_flights.stats(),
+                        ydl_pool=ydl_pool.stats(), extraction_pool=extraction_pool.stats(),
+                        upstream=upstream.stats(), caption_sources=caption_sources.stats(),
+                        search_index=transcript_index.stats()))
+
+@app.route('/search', methods=['GET'])
+def search_transcripts():
+    """Full-text search over transcripts this host has already extracted"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'No search query provided'}), 400
+    if not transcript_index.enabled:
+        return jsonify({'error': 'Transcript search is disabled on this server'}), 503
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        per_video = min(max(int(request.args.get('snippets', 3)), 1), 20)
+        results = transcript_index.search(query, limit=limit, per_video=per_video)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logger.error(f"Error generating JSON: {str(e)}")
-        return jsonify({'error': 'Failed to generate JSON'}), 500
+        logger.error(f"Error searching transcripts: {str(e)}")
+        return jsonify({'error': f'Search failed: {str(e)}'}), 500
+    return jsonify({'query': query, 'results': results, 'count': len(results)})
+
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
 
 @app.route('/download/docx', methods=['POST'])
 def download_docx():
     try:
-        from docx import Document
-        from docx.shared import Pt, Inches
-
+        tag = http_cache.export_etag('docx', body=request.get_data())
+        precondition = precondition_response(tag, vary=False)
+        if precondition is not None:
+            return precondition
         data = request.get_json()
-        transcription = data.get('transcription', '')
-        title = data.get('title', 'YouTube Captions')
-        duration = data.get('duration', '')
-        uploader = data.get('uploader', '')
-        language = data.get('language', '')
-        caption_type = data.get('caption_type', '')
-
-        document = Document()
-        heading = document.add_heading(title, level=0)
-        heading.style.font.size = Pt(18)
-
-        meta_para = document.add_paragraph()
-        meta_para.add_run(f"Uploader: {uploader}\n").bold = True
-        meta_para.add_run(f"Duration: {duration}\n").bold = True
-        meta_para.add_run(f"Language: {language} | Type: {caption_type}\n").bold = True
-
-        document.add_paragraph("")
-        document.add_heading('Captions', level=1)
-
-        # Write transcription in paragraphs, splitting on sentence-ish breaks
-        for chunk in split_into_paragraphs(transcription):
-            document.add_paragraph(chunk)
-
-        buffer = io.BytesIO()
-        document.save(buffer)
-        buffer.seek(0)
-
-        filename = f"{slugify(title or 'youtube_captions')}.docx"
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        )
+        meta = export_metadata(data)
+        docx_bytes = build_docx(data.get('transcription', ''), meta)
+        return send_export(docx_bytes, 'docx', meta, tag)
     except Exception as e:
         logger.error(f"Error generating DOCX: {str(e)}")
         return jsonify({'error': 'Failed to generate DOCX'}), 500
 
-def split_into_paragraphs(text: str):
-    if not text:
-        return []
-    # Split on double newlines or sentence boundaries for readability
-    parts = re.split(r"\n\n+|(?<=[.!?])\s+(?=[A-Z])", text)
-    return [p.strip() for p in parts if p.strip()]
+@app.route('/download/<fmt>', methods=['POST'])
+def download_export(fmt):
+    """Stream a JSON, TXT, SRT or VTT export of a posted transcript
 
-def slugify(value: str) -> str:
-    value = value or ''
-    value = value.lower()
-    value = re.sub(r"[^a-z0-9\-\_\s]", '', value)
-    value = re.sub(r"\s+", '_', value).strip('_')
-    return value or 'file'
+    SRT and VTT need the timing from a /transcribe response made with
+    include_cues, posted back under "cues".
+    """
+    if fmt not in STREAM_CONTENT_TYPES:
+        return jsonify({'error': f'Unsupported download format: {fmt}'}), 404
+    tag = http_cache.export_etag(fmt, body=request.get_data())
+    encoding = http_cache.negotiate(request.headers.get('Accept-Encoding'))
+    precondition = precondition_response(tag, encoding)
+    if precondition is not None:
+        return precondition
+    try:
+        data = request.get_json()
+        meta = export_metadata(data)
+        chunks = iter_export(fmt, data.get('transcription', ''), meta, CueList.coerce(data.get('cues')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error generating {fmt.upper()}: {str(e)}")
+        return jsonify({'error': f'Failed to generate {fmt.upper()}'}), 500
+    return stream_export(chunks, fmt, meta, tag, encoding)
 
-def is_valid_youtube_url(url):
-    """Check if the URL is a valid YouTube URL"""
-    youtube_domains = ['youtube.com', 'youtu.be', 'www.youtube.com', 'm.youtube.com']
-    return any(domain in url for domain in youtube_domains)
+@app.route('/download/<fmt>/<handle>', methods=['GET'])
+def download_by_handle(fmt, handle):
+    """Serve an export for a transcript handle returned by /transcribe"""
+    if fmt not in STREAM_CONTENT_TYPES and fmt not in EXPORT_BUILDERS:
+        return jsonify({'error': f'Unsupported download format: {fmt}'}), 404
+
+    tag = http_cache.export_etag(fmt, handle)
+    encoding = http_cache.negotiate(request.headers.get('Accept-Encoding')) if fmt in STREAM_CONTENT_TYPES else None
+    precondition = precondition_response(tag, encoding, vary=fmt in STREAM_CONTENT_TYPES)
+    if precondition is not None:
+        return precondition
+
+    captions_data = transcript_handles.get(handle)
+    if not captions_data:
+        return jsonify({'error': 'Transcript not found or expired. Please extract the captions again.'}), 404
+
+    data = export_fields(captions_data)
+    meta = export_metadata(data)
+    if fmt in STREAM_CONTENT_TYPES:
+        # Uncompressed they are cheap to regenerate and stream; compressed
+        # variants are built whole once and kept with the handle
+        body = http_cache.stored_variant(transcript_handles, handle, fmt, tag, encoding) if encoding else None
+        try:
+            if body is None:
+                chunks = iter_export(fmt, data['transcription'], meta, CueList.coerce(captions_data.get('cues')))
+                if not encoding:
+                    return stream_export(chunks, fmt, meta, tag)
+                body = http_cache.store_variant(transcript_handles, handle, fmt, tag, encoding, b''.join(chunks))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return Response(body, content_type=STREAM_CONTENT_TYPES[fmt],
+                        headers={'Content-Disposition': content_disposition(meta.get('title'), fmt),
+                                 **http_cache.representation_headers(tag, encoding)})
 
-def extract_youtube_captions(url):
-    """Extract closed captions from YouTube video using yt-dlp"""
     try:
-        ydl_opts = {
-            'writesubtitles': True,
-            'writeautomaticsub': True,
-            'subtitleslangs': ['en', 'en-US', 'en-GB'],  # Prefer English
-            'skip_download': True,
-            'quiet': True,
-            'no_warnings': True,
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Extract video info and subtitles
-            info = ydl.extract_info(url, download=False)
-            
-            # Get available subtitles
-            subtitles = info.get('subtitles', {})
-            automatic_captions = info.get('automatic_captions', {})
-            
-            # Try to get the best available captions
-            caption_data = None
-            caption_type = None
-            language = None
-            
-            # Priority: manual subtitles first, then automatic
-            for lang_code in ['en', 'en-US', 'en-GB']:
-                if lang_code in subtitles:
-                    caption_data = subtitles[lang_code]
-                    caption_type = 'Manual'
-                    language = lang_code
-                    break
-            
-            if not caption_data:
-                for lang_code in ['en', 'en-US', 'en-GB']:
-                    if lang_code in automatic_captions:
-                        caption_data = automatic_captions[lang_code]
-                        caption_type = 'Automatic'
-                        language = lang_code
-                        break
-            
-            # If no English captions, try any available language
-            if not caption_data:
-                if subtitles:
-                    first_lang = list(subtitles.keys())[0]
-                    caption_data = subtitles[first_lang]
-                    caption_type = 'Manual'
-                    language = first_lang
-                elif automatic_captions:
-                    first_lang = list(automatic_captions.keys())[0]
-                    caption_data = automatic_captions[first_lang]
-                    caption_type = 'Automatic'
-                    language = first_lang
-            
-            if not caption_data:
-                return None
-            
-            # Find the best format (prefer json3 or vtt, then others)
-            best_format = None
-            preferred_exts = ['json3', 'vtt', 'ttml', 'srv3', 'srv2', 'srv1']
-            for fmt in caption_data:
-                if fmt.get('ext') in preferred_exts:
-                    best_format = fmt
-                    break
-            
-            if not best_format:
-                best_format = caption_data[0]  # Fallback to first available
-            
-            # Download the caption content using yt-dlp urlopen to include headers/cookies
-            caption_url = best_format['url']
-            caption_bytes = ydl.urlopen(caption_url).read()
-            caption_content = caption_bytes.decode('utf-8', errors='ignore')
-            
-            # Parse the caption content
-            parsed_text = parse_caption_content(caption_content, best_format.get('ext', ''))
-            
-            return {
-                'text': parsed_text,
-                'language': language,
-                'type': caption_type,
-                'format': best_format['ext']
-            }
-            
+        body = transcript_handles.get_artifact(handle, fmt)
+        if body is None:
+            body = EXPORT_BUILDERS[fmt](data['transcription'], meta)
+            transcript_handles.put_artifact(handle, fmt, body)
+        return send_export(body, fmt, meta, tag)
     except Exception as e:
-        logger.error(f"Error extracting captions: {str(e)}")
-        return None
+        logger.error(f"Error generating {fmt.upper()} for {handle}: {str(e)}")
+        return jsonify({'error': f'Failed to generate {fmt.upper()}'}), 500
+
+def export_metadata(data):
+    """Pick the export metadata fields out of a request or transcription payload"""
+    return {
+        'title': data.get('title', ''),
+        'duration': data.get('duration', ''),
+        'uploader': data.get('uploader', ''),
+        'language': data.get('language', ''),
+        'caption_type': data.get('caption_type', ''),
+    }
+
+# Binary exports built whole and cached per handle; the rest stream
+EXPORT_BUILDERS = {
+    'docx': build_docx,
+}
+EXPORT_CONTENT_TYPES = {**STREAM_CONTENT_TYPES, 'docx': DOCX_MIMETYPE}
+
+def send_export(body, fmt, meta, tag):
+    """Send a whole export body as an attachment of its format's content type"""
+    content_type = EXPORT_CONTENT_TYPES[fmt]
+    response = send_file(
+        io.BytesIO(body),
+        mimetype=content_type.split(';')[0],
+        as_attachment=True,
+        download_name=export_filename(meta.get('title'), fmt),
+        etag=False
+    )
+    # Sent as built; DOCX is a zip archive already, so compressing gains nothing
+    response.headers.update(http_cache.validator_headers(tag, vary=False))
+    # send_file marks every file no-cache; the route's policy applies instead
+    del response.headers['Cache-Control']
+    # and adds its own charset to text types; the table's header is exact
+    response.headers['Content-Type'] = content_type
+    return response
+
+def stream_export(chunks, fmt, meta, tag, encoding=None):
+    """Send export chunks as a chunked attachment response, compressing them on the fly"""
+    if encoding:
+        chunks = http_cache.iter_compress(chunks, encoding)
+    return Response(
+        stream_with_context(chunks),
+        content_type=STREAM_CONTENT_TYPES[fmt],
+        headers={'Content-Disposition': content_disposition(meta.get('title'), fmt),
+                 **http_cache.representation_headers(tag, encoding)}
+    )
+
+def no_captions_message(languages=None):
+    if languages:
+        return 'No closed captions found for this video in the requested languages.'
+    return 'No closed captions found for this video. The video may not have captions available.'
 
-def parse_caption_content(content, format_type):
-    """Parse caption content based on format type"""
+def all_tracks_payload(result, include_cues=False):
+    """/transcribe response for a get_all_tracks result, with a download handle per track"""
+    tracks = []
+    for track in result['tracks']:
+        payload = transcription_payload(track, include_cues=include_cues)
+        payload['handle'] = transcript_handles.put(track)
+        tracks.append(payload)
+    return {
+        'title': result['title'],
+        'duration': result['duration'],
+        'uploader': result['uploader'],
+        'tracks': tracks,
+        'count': len(tracks),
+        'missing_languages': result['missing'],
+        'success': True
+    }
+
+def sse_event(event, data):
+    """One Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+def stream_metadata(captions_data):
+    """The metadata event: everything in a /transcribe response but the text"""
+    payload = transcription_payload(dict(captions_data, text=''))
+    del payload['transcription'], payload['success']
+    return payload
+
+def cue_event(batch, include_cues=False):
+    """A cues event: the batch's text, to append after a space, and optionally its timing"""
+    data = {'text': join_cue_text(batch)}
+    if include_cues:
+        data['cues'] = {
+            'start': [cue.start for cue in batch],
+            'end': [cue.end for cue in batch],
+            'text': [cue.text for cue in batch],
+        }
+    return sse_event('cues', data)
+
+def iter_transcript_events(video_id, languages=None, include_cues=False):
+    """Yield the /transcribe/stream messages for a video
+
+    A cached transcript is replayed in batches. Otherwise the metadata event
+    goes out as soon as yt-dlp has the video details, and the caption track
+    is parsed and sent while it downloads. The finished transcript is cached
+    and indexed like a /transcribe result, and the done event carries its
+    download handle.
+    """
+    # Opens the stream before yt-dlp starts, which can take seconds
+    yield ': extracting\n\n'
+    preference = ','.join(languages) if languages else ''
     try:
-        if format_type == 'vtt':
-            return parse_vtt_content(content)
-        elif format_type == 'json3':
-            return parse_json3_content(content)
-        elif format_type in ['ttml', 'srv3', 'srv2', 'srv1']:
-            return parse_xml_content(content)
+        captions_data = transcript_cache.get(video_id, preference)
+        if captions_data:
+            logger.info(f"Transcript cache hit for {video_id}")
+            yield sse_event('metadata', stream_metadata(captions_data))
+            cues = CueList.coerce(captions_data.get('cues')) or CueList.from_text(captions_data['text'])
+            for batch in batched(cues, CUE_BATCH):
+                yield cue_event(batch, include_cues)
         else:
-            # Fallback: try to extract text from any format
-            return clean_caption_text(content)
+            captions_data = yield from iter_extraction_events(video_id, languages, include_cues)
+            if not captions_data:
+                yield sse_event('error', {'error': no_captions_message(languages), 'status': 404})
+                return
+            cache_captions(video_id, captions_data, preference)
+        transcript_index.add(video_id, captions_data)
+        done = transcription_payload(captions_data)
+        del done['transcription']
+        done['handle'] = transcript_handles.put(captions_data)
+        yield sse_event('done', done)
+    except UpstreamError as e:
+        logger.error(f"Upstream refused caption extraction: {str(e)}")
+        yield sse_event('error', {'error': str(e), 'status': e.status_code, 'retry_after': e.retry_after})
     except Exception as e:
-        logger.error(f"Error parsing caption content: {str(e)}")
-        return clean_caption_text(content)
+        logger.error(f"Error during streamed caption extraction: {str(e)}")
+        yield sse_event('error', {'error': f'Caption extraction failed: {str(e)}', 'status': 500})
 
-def parse_vtt_content(vtt_content):
-    """Parse WebVTT format captions"""
-    lines = vtt_content.split('\n')
-    text_lines = []
-    
-    for line in lines:
-        line = line.strip()
-        # Skip empty lines, timestamps, and WebVTT headers
-        if (line and 
-            not line.startswith('WEBVTT') and 
-            not line.startswith('NOTE') and 
-            not '-->' in line and 
-            not line.isdigit() and
-            not line.startswith('STYLE') and
-            not line.startswith('::cue')):
-            
-            # Clean HTML tags and formatting
-            clean_line = re.sub(r'<[^>]+>', '', line)
-            clean_line = re.sub(r'&[a-zA-Z]+;', ' ', clean_line)  # Remove HTML entities
-            clean_line = clean_line.strip()
-            
-            if clean_line:
-                text_lines.append(clean_line)
-    
-    return ' '.join(text_lines)
+def iter_extraction_events(video_id, languages=None, include_cues=False):
+    """Yield metadata and cues events for a fresh extraction; return the transcript dict or None
 
-def parse_json3_content(json_content):
-    """Parse YouTube json3 automatic caption format"""
+    The metadata event goes out as soon as yt-dlp has the video details.
+    The captions then come from the caption sources exactly as for
+    /transcribe, with the same extraction processes, timeouts and fallback,
+    and are sent in batches. Their language and type arrive with done.
+    """
+    url = canonical_url(video_id)
     try:
-        import json
-        # Some responses are prefixed with )]}' to prevent XSSI
-        cleaned = json_content.lstrip() \
-            .removeprefix(")]}'") \
-            .lstrip()  # remove any leading newlines/spaces
-        data = json.loads(cleaned)
-        texts = []
-        for event in data.get('events', []):
-            for seg in event.get('segs', []) or []:
-                t = seg.get('utf8', '')
-                if t:
-                    texts.append(t)
-        # Join and normalize whitespace/newlines
-        text = ''.join(texts)
-        text = text.replace('\n', ' ')
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text
-    except Exception:
-        return clean_caption_text(json_content)
-
-def parse_xml_content(xml_content):
-    """Parse XML-based caption formats (TTML, SRV, etc.)"""
-    # Remove XML tags and extract text content
-    text = re.sub(r'<[^>]+>', ' ', xml_content)
-    # Clean up HTML entities
-    text = re.sub(r'&[a-zA-Z]+;', ' ', text)
-    # Clean up extra whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
-
-def clean_caption_text(content):
-    """Fallback method to clean any caption format"""
-    # Remove common caption formatting
-    text = re.sub(r'<[^>]+>', ' ', content)  # Remove HTML/XML tags
-    text = re.sub(r'&[a-zA-Z]+;', ' ', text)  # Remove HTML entities
-    text = re.sub(r'\d{2}:\d{2}:\d{2}[.,]\d{3}', ' ', text)  # Remove timestamps
-    text = re.sub(r'-->', ' ', text)  # Remove arrow separators
-    text = re.sub(r'WEBVTT', ' ', text)  # Remove WebVTT headers
-    text = re.sub(r'NOTE.*', ' ', text)  # Remove NOTE lines
-    text = re.sub(r'\s+', ' ', text).strip()  # Clean up whitespace
-    return text
-
-def get_video_info(url):
-    """Get video information without downloading"""
+        info = fetch_video_info(url)
+    except UpstreamError:
+        raise
+    except Exception as e:
+        # The transcript API can succeed where yt-dlp fails
+        logger.error(f"Error getting video info: {str(e)}")
+        info = {}
+    details = video_details(info)
+    yield sse_event('metadata', details)
+    captions, _ = caption_sources.fetch(video_id, lambda: info, languages)
+    if not captions:
+        return None
+    captions_data = caption_record(captions, details)
+    for batch in batched(captions_data['cues'], CUE_BATCH):
+        yield cue_event(batch, include_cues)
+    return captions_data
+
+def upstream_error_response(error):
+    """429/503 JSON error with a Retry-After header when YouTube is throttling us"""
+    response = jsonify({'error': str(error)})
+    response.status_code = error.status_code
+    if error.retry_after:
+        response.headers['Retry-After'] = str(int(math.ceil(error.retry_after)))
+    return response
+
+def is_valid_youtube_url(url):
+    """Check if the URL is a YouTube URL that names a single video"""
+    return is_youtube_url(url) and extract_video_id(url) is not None
+
+def get_captions(url, languages=None):
+    """Return captions for a video, serving repeats from the transcript cache
+
+    languages is a preference list (None = the default English preferences).
+    Concurrent requests for the same video and preferences share a single
+    upstream extraction, and every transcript returned is queued for the
+    search index under its language.
+    """
+    video_id = extract_video_id(url)
+    if not video_id:
+        return extract_youtube_captions(url, languages)
+
+    preference = ','.join(languages) if languages else ''
+    cached = transcript_cache.get(video_id, preference)
+    if cached:
+        logger.info(f"Transcript cache hit for {video_id}")
+    else:
+        flight_key = f"{video_id}:{preference}" if preference else video_id
+        cached = extraction_flights.do(flight_key, _extract_and_cache, video_id, languages)
+    # Queued for the search index's background writer; costs nothing here
+    transcript_index.add(video_id, cached)
+    return cached
+
+def _extract_and_cache(video_id, languages=None):
+    # Another flight may have filled the cache while this one was queued
+    preference = ','.join(languages) if languages else ''
+    cached = transcript_cache.get(video_id, preference)
+    if cached:
+        return cached
+    captions_data = extract_youtube_captions(canonical_url(video_id), languages)
+    if captions_data:
+        cache_captions(video_id, captions_data, preference)
+    return captions_data
+
+def cache_captions(video_id, captions_data, preference=''):
+    """Cache a transcript under the requested preference and under its own language and type"""
+    transcript_cache.set(video_id, captions_data, preference)
+    transcript_cache.set(video_id, captions_data, captions_data.get('language'), captions_data.get('type'))
+
+def get_all_tracks(url, languages=None):
+    """Return video details plus every requested caption track, or None without captions
+
+    One extract_info result drives concurrent downloads of the tracks picked
+    by select_caption_tracks. Each track is cached under its own language and
+    caption type, so only tracks missing from the cache are downloaded.
+    """
+    video_id = extract_video_id(url)
+    preference = ','.join(languages) if languages else ''
+    result = extraction_flights.do(f"{video_id}:all:{preference}", _extract_all_tracks, video_id, languages)
+    index_tracks(video_id, result)
+    return result
+
+def index_tracks(video_id, result):
+    """Queue every track of a get_all_tracks result for the search index"""
+    for track in (result or {}).get('tracks', ()):
+        transcript_index.add(video_id, track)
+
+def _extract_all_tracks(video_id, languages=None):
     try:
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            return {
-                'title': info.get('title', 'Unknown Title'),
-                'duration': format_duration(info.get('duration', 0)),
-                'uploader': info.get('uploader', 'Unknown'),
+        info = fetch_video_info(canonical_url(video_id))
+    except UpstreamError:
+        raise
+    except Exception as e:
+        logger.error(f"Error extracting captions: {str(e)}")
+        return None
+    details = video_details(info)
+    selected = select_caption_tracks(info, languages, limit=MAX_TRACKS)
+    if not selected:
+        return None
+
+    tracks, missing = cached_tracks(video_id, selected)
+    errors = []
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(len(missing), TRACK_WORKERS)) as executor:
+            futures = {
+                executor.submit(metrics.propagate(download_track_cues), selected[i][0]['url'], selected[i][0].get('ext', ''),
+                                selected[i][2] == 'Automatic'): i
+                for i in missing
             }
+            for future in as_completed(futures):
+                i = futures[future]
+                caption_format, language, caption_type = selected[i]
+                try:
+                    cues = future.result()
+                except Exception as e:
+                    logger.error(f"Error downloading {language} {caption_type} captions: {str(e)}")
+                    errors.append(e)
+                    continue
+                track = tracks[i] = track_record(cues, selected[i], details)
+                transcript_cache.set(video_id, track, language, caption_type)
+    return collect_tracks(info, languages, details, tracks, errors)
+
+def cached_tracks(video_id, selected):
+    """Return (tracks, missing): cached transcripts by position and the positions to download"""
+    tracks = [None] * len(selected)
+    missing = []
+    for i, (caption_format, language, caption_type) in enumerate(selected):
+        cached = transcript_cache.get(video_id, language, caption_type)
+        if cached:
+            tracks[i] = cached
+        else:
+            missing.append(i)
+    return tracks, missing
+
+def track_record(cues, selected_track, details):
+    """Transcript dict for one downloaded track picked by select_caption_tracks"""
+    caption_format, language, caption_type = selected_track
+    return {
+        'text': cues.text(),
+        'cues': cues,
+        'language': language,
+        'type': caption_type,
+        'format': caption_format.get('ext', ''),
+        'source': YtDlpSource.name,
+        **details,
+    }
+
+def collect_tracks(info, languages, details, tracks, errors):
+    """get_all_tracks result from the tracks found; raises an upstream error if none were"""
+    tracks = [track for track in tracks if track and track.get('text')]
+    if not tracks:
+        upstream_errors = [e for e in errors if isinstance(e, UpstreamError)]
+        if upstream_errors:
+            raise upstream_errors[-1]
+        return None
+    found = {(track['language'], track['type']) for track in tracks}
+    missing = [language for language in languages or []
+               if not any(track[1:] in found for track in select_caption_tracks(info, [language]))]
+    return dict(details, tracks=tracks, missing=missing)
+
+def extract_youtube_captions(url, languages=None):
+    """Extract closed captions through the caption sources and details from yt-dlp"""
+    try:
+        captions, info_future = caption_sources.fetch(extract_video_id(url), lambda: fetch_video_info(url),
+                                                      languages)
+        if not captions:
+            return None
+
+        try:
+            details = video_details(info_future.result())
+        except Exception as e:
+            # The transcript API can succeed where yt-dlp fails; keep its captions
+            logger.error(f"Error getting video info: {str(e)}")
+            details = video_details({})
+
+        return caption_record(captions, details)
+
+    except UpstreamError:
+        raise
     except Exception as e:
-        logger.error(f"Error getting video info: {str(e)}")
-        return {'title': 'Unknown Title', 'duration': 'Unknown Duration'}
+        logger.error(f"Error extracting captions: {str(e)}")
+        return None
+
+def caption_record(captions, details):
+    """Transcript dict from a caption source result and the video details"""
+    cues = captions['cues']
+    return {
+        'text': cues.text(),
+        'cues': cues,
+        'language': captions['language'],
+        'type': captions['type'],
+        'format': captions['format'],
+        'source': captions['source'],
+        **details,
+    }
+
+def fetch_video_info(url):
+    """Run one rate-limited yt-dlp extraction on a pooled instance, in the extraction pool if enabled"""
+    if extraction_pool.enabled:
+        return extraction_pool.run('extract_tasks:extract_video_info', url)
+    return extract_info(url)
+
+def fetch_playlist_info(url):
+    """List a playlist or channel for /transcribe/batch: one rate-limited flat extraction on a pooled instance"""
+    with ydl_pool.acquire() as ydl, metrics.span('extract_info'):
+        return upstream.call(ydl.extract_flat, url)
+
+def download_track_cues(caption_url, caption_ext, rolling):
+    """Stream a caption track through the incremental parsers on a pooled session
+
+    The pooled session reuses the connection to the caption host and carries
+    yt-dlp's headers/cookies, and the whole document is never held in memory.
+    With the extraction pool enabled this runs in one of its processes.
+    """
+    if extraction_pool.enabled:
+        return extraction_pool.run('extract_tasks:track_cues', caption_url, caption_ext, rolling)
+    return track_cues(caption_url, caption_ext, rolling)
+
+def video_details(info):
+    """Pick title, duration and uploader out of an extract_info result"""
+    return {
+        'title': info.get('title', 'Unknown Title'),
+        'duration': format_duration(info.get('duration', 0)),
+        'uploader': info.get('uploader', 'Unknown'),
+    }
 
 def format_duration(seconds):
     """Format duration from seconds to HH:MM:SS"""
@@ -360,6 +746,27 @@ def format_duration(seconds):
     else:
         return f"{minutes:02d}:{seconds:02d}"
 
+def warm_up(instances=None):
+    """Import yt-dlp and the caption source libraries, fill the YoutubeDL pool and start the extraction processes
+
+    They are imported lazily, so a worker that only serves cached transcripts
+    never loads them. gunicorn.conf.py calls this with instances=0 in the
+    master, where the imports are shared with every forked worker, and again
+    in each worker to create its YTDL_POOL_WARM instances. Extraction
+    processes are started only by the default call, never in the master.
+    """
+    ydl_pool.warm(YTDL_POOL_WARM if instances is None else instances)
+    if instances is None:
+        extraction_pool.start()
+    if any(source.name == TranscriptApiSource.name for source in caption_sources.sources):
+        import youtube_transcript_api  # noqa: F401
+
+# yt-dlp first, the transcript API as fallback; see caption_sources.py for race mode
+caption_sources = build_caption_sources(download_track_cues, upstream,
+                                        default_order=(YtDlpSource.name, TranscriptApiSource.name))
+job_queue = JobQueue(get_captions, store_from_env(), max_workers=int(os.environ.get('JOB_WORKERS', 4)))
+
 if __name__ == '__main__':
+    warm_up()
     # Disable reloader to avoid connection resets while streaming captions
     app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=False)
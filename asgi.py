@@ -0,0 +1,485 @@
+"""Async serving mode: the routes of app.py behind an ASGI server.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+GET and POST /transcribe are served natively on the event loop, so a request
+waiting on YouTube holds a coroutine rather than a thread. The calls that can only
+block (yt-dlp's extract_info and youtube-transcript-api) run on a bounded
+executor of ASYNC_EXTRACT_WORKERS threads; caption tracks are downloaded with
+httpx, up to ASYNC_HTTP_CONNECTIONS at once without a thread each. One process can
+therefore hold hundreds of extractions, limited by the executor for the
+yt-dlp step and by the host-wide upstream rate limit, not by its threads.
+With the extraction pool enabled (see extract_pool.py), each executor thread
+hands extract_info to one of its processes, so EXTRACT_PROCESSES caps the
+yt-dlp step as well.
+
+Every other route is the Flask app itself, run through a WSGI adapter. The
+transcript cache, download handles, search index, caption source stats,
+upstream scheduler and metrics are the same objects app.py uses.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from a2wsgi import WSGIMiddleware
+
+import app as flask_module
+import http_cache
+import metrics
+from batch import transcription_payload
+from caption_dedup import dedupe_rolling_cues
+from caption_sources import (MAX_TRACKS, RACE, CaptionRequest, YtDlpSource, parse_languages,
+                             select_caption_track, select_caption_tracks)
+from caption_stream import STREAMING_FORMATS, iter_caption_cues
+from cues import CueList
+from singleflight import AsyncSingleFlight
+from upstream import UpstreamError
+from youtube_urls import canonical_url, extract_video_id
+
+logger = logging.getLogger(__name__)
+
+EXTRACT_WORKERS = int(os.environ.get('ASYNC_EXTRACT_WORKERS', 64))
+HTTP_CONNECTIONS = int(os.environ.get('ASYNC_HTTP_CONNECTIONS', 256))
+# httpcore scans every connection in a pool each time it hands one out, which
+# gets expensive at hundreds of connections; several small pools stay cheap
+HTTP_POOL_CONNECTIONS = 16
+HTTP_TIMEOUT = float(os.environ.get('ASYNC_HTTP_TIMEOUT', 30))
+WSGI_WORKERS = int(os.environ.get('ASYNC_WSGI_WORKERS', 16))
+
+flask_app = flask_module.app
+upstream = flask_module.upstream
+caption_sources = flask_module.caption_sources
+transcript_cache = flask_module.transcript_cache
+transcript_index = flask_module.transcript_index
+extraction_flights = AsyncSingleFlight()
+# Every executor thread may hold a YoutubeDL at once
+flask_module.ydl_pool.size = max(flask_module.ydl_pool.size, EXTRACT_WORKERS)
+
+_executor = None
+_clients = None
+_next_client = None
+_download_slots = None
+
+
+def extraction_executor():
+    global _executor
+    # Created lazily so that the threads belong to the serving process
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix='extract')
+    return _executor
+
+
+def http_client():
+    """The next of the caption download clients, which share HTTP_CONNECTIONS between them"""
+    global _clients, _next_client
+    if _clients is None:
+        headers = dict(flask_module.YDL_OPTS.get('http_headers') or {})
+        try:
+            from yt_dlp.utils import std_headers
+            headers = {**std_headers, **headers}
+        except ImportError:
+            pass
+        ssl_context = httpx.create_ssl_context()
+        limits = httpx.Limits(max_connections=HTTP_POOL_CONNECTIONS, max_keepalive_connections=HTTP_POOL_CONNECTIONS)
+        _clients = [
+            httpx.AsyncClient(headers=headers, timeout=HTTP_TIMEOUT, follow_redirects=True, verify=ssl_context,
+                              limits=limits)
+            for _ in range(max(1, math.ceil(HTTP_CONNECTIONS / HTTP_POOL_CONNECTIONS)))
+        ]
+        _next_client = itertools.cycle(_clients)
+    return next(_next_client)
+
+
+def download_slots():
+    global _download_slots
+    # Waiting here is cheap; waiting in an httpx pool's queue is not
+    if _download_slots is None:
+        _download_slots = asyncio.Semaphore(HTTP_CONNECTIONS)
+    return _download_slots
+
+
+async def run_blocking(fn, *args):
+    """Run a call that waits on YouTube on the bounded extraction executor"""
+    loop = asyncio.get_running_loop()
+    # propagate() carries the request's trace into the executor thread
+    return await loop.run_in_executor(extraction_executor(), metrics.propagate(fn), *args)
+
+
+# Caption downloads
+
+async def fetch_caption_chunks(caption_url):
+    """GET a caption track; returns the body as a list of chunks"""
+    try:
+        async with download_slots(), http_client().stream('GET', caption_url) as response:
+            response.raise_for_status()
+            return [chunk async for chunk in response.aiter_bytes()]
+    except httpx.TransportError as e:
+        # Connection failures and timeouts are transient to the upstream scheduler
+        raise ConnectionError(f"Caption download failed: {str(e)}") from e
+
+
+def parse_caption_chunks(chunks, format_type, rolling=False):
+    """Parse a downloaded caption track into a CueList, like download_caption_cues"""
+    dedupe = rolling and format_type == 'vtt'
+    with metrics.span('parse', format=format_type):
+        if format_type in STREAMING_FORMATS:
+            try:
+                cues = iter_caption_cues(chunks, format_type)
+                return CueList(dedupe_rolling_cues(cues) if dedupe else cues)
+            except (ET.ParseError, ValueError) as e:
+                logger.error(f"Streaming caption parse failed, re-reading whole file: {str(e)}")
+        content = b''.join(chunks).decode('utf-8', errors='ignore')
+        cues = flask_module.parse_caption_cues(content, format_type)
+        return CueList(dedupe_rolling_cues(cues)) if dedupe else cues
+
+
+async def download_track_cues(caption_url, caption_ext, rolling):
+    """Download a caption track over async HTTP and parse it off the event loop"""
+    if not caption_url.startswith(('http://', 'https://')):
+        # Only yt-dlp itself can open other URLs
+        return await run_blocking(flask_module.download_track_cues, caption_url, caption_ext, rolling)
+    with metrics.span('caption_fetch', format=caption_ext):
+        chunks = await upstream.acall(fetch_caption_chunks, caption_url)
+    metrics.inc('yt_caption_bytes_total', sum(len(chunk) for chunk in chunks))
+    return await asyncio.to_thread(parse_caption_chunks, chunks, caption_ext, rolling)
+
+
+# Caption sources
+
+async def fetch_from_source(source, video_id, languages, info_task):
+    if isinstance(source, YtDlpSource):
+        # Shielded: a racer cancelled by the winner must not cancel the shared info
+        info = await asyncio.shield(info_task)
+        track = select_caption_track(info, languages or source.languages, fallback_any=languages is None)
+        if not track:
+            return None
+        best_format, language, caption_type = track
+        ext = best_format.get('ext', '')
+        cues = await download_track_cues(best_format['url'], ext, caption_type == 'Automatic')
+        return {'cues': cues, 'language': language, 'type': caption_type, 'format': ext}
+    # Any other source is a blocking client library
+    return await run_blocking(source.fetch, CaptionRequest(video_id, None, languages))
+
+
+async def run_source(source, video_id, languages, info_task):
+    """Await one source within its budget, recording the outcome in the caption source stats"""
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(fetch_from_source(source, video_id, languages, info_task), source.timeout)
+        error = None
+    except asyncio.TimeoutError:
+        logger.warning(f"Caption source {source.name} gave no answer within {source.timeout}s")
+        result = error = None
+    except Exception as e:
+        result, error = None, e
+    return caption_sources.record_attempt(source, result, error, time.perf_counter() - start)
+
+
+async def fetch_captions(video_id, url, languages=None):
+    """Async counterpart of CaptionSourceChain.fetch, in the chain's order and mode"""
+    info_task = asyncio.ensure_future(run_blocking(flask_module.fetch_video_info, url))
+    info_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+    sources = caption_sources.ordered()
+    result = None
+    errors = []
+    if caption_sources.mode == RACE:
+        tasks = [asyncio.ensure_future(run_source(source, video_id, languages, info_task)) for source in sources]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result, error = await next_done
+                if result:
+                    break
+                if error:
+                    errors.append(error)
+        finally:
+            for task in tasks:
+                task.cancel()
+    else:
+        for source in sources:
+            result, error = await run_source(source, video_id, languages, info_task)
+            if result:
+                break
+            if error:
+                errors.append(error)
+    if result is None:
+        upstream_errors = [e for e in errors if isinstance(e, UpstreamError)]
+        if upstream_errors:
+            raise upstream_errors[-1]
+    return result, info_task
+
+
+async def extract_youtube_captions(url, languages=None):
+    try:
+        captions, info_task = await fetch_captions(extract_video_id(url), url, languages)
+        if not captions:
+            return None
+        try:
+            details = flask_module.video_details(await info_task)
+        except Exception as e:
+            logger.error(f"Error getting video info: {str(e)}")
+            details = flask_module.video_details({})
+        return flask_module.caption_record(captions, details)
+    except UpstreamError:
+        raise
+    except Exception as e:
+        logger.error(f"Error extracting captions: {str(e)}")
+        return None
+
+
+async def get_captions(url, languages=None):
+    """app.get_captions on the event loop: cache, coalescing and search indexing included"""
+    video_id = extract_video_id(url)
+    preference = ','.join(languages) if languages else ''
+    cached = await asyncio.to_thread(transcript_cache.get, video_id, preference)
+    if cached:
+        logger.info(f"Transcript cache hit for {video_id}")
+    else:
+        flight_key = f"{video_id}:{preference}" if preference else video_id
+        cached = await extraction_flights.do(flight_key, _extract_and_cache, video_id, languages)
+    transcript_index.add(video_id, cached)
+    return cached
+
+
+async def _extract_and_cache(video_id, languages=None):
+    preference = ','.join(languages) if languages else ''
+    cached = await asyncio.to_thread(transcript_cache.get, video_id, preference)
+    if cached:
+        return cached
+    captions_data = await extract_youtube_captions(canonical_url(video_id), languages)
+    if captions_data:
+        await asyncio.to_thread(_cache_captions, video_id, captions_data, preference)
+    return captions_data
+
+
+def _cache_captions(video_id, captions_data, preference):
+    transcript_cache.set(video_id, captions_data, preference)
+    transcript_cache.set(video_id, captions_data, captions_data.get('language'), captions_data.get('type'))
+
+
+async def get_all_tracks(url, languages=None):
+    video_id = extract_video_id(url)
+    preference = ','.join(languages) if languages else ''
+    result = await extraction_flights.do(f"{video_id}:all:{preference}", _extract_all_tracks, video_id, languages)
+    flask_module.index_tracks(video_id, result)
+    return result
+
+
+async def _extract_all_tracks(video_id, languages=None):
+    try:
+        info = await run_blocking(flask_module.fetch_video_info, canonical_url(video_id))
+    except UpstreamError:
+        raise
+    except Exception as e:
+        logger.error(f"Error extracting captions: {str(e)}")
+        return None
+    details = flask_module.video_details(info)
+    selected = select_caption_tracks(info, languages, limit=MAX_TRACKS)
+    if not selected:
+        return None
+
+    tracks, missing = await asyncio.to_thread(flask_module.cached_tracks, video_id, selected)
+    # Same per-request cap on track downloads as the threaded path
+    limit = asyncio.Semaphore(flask_module.TRACK_WORKERS)
+
+    async def download(i):
+        caption_format, language, caption_type = selected[i]
+        async with limit:
+            return await download_track_cues(caption_format['url'], caption_format.get('ext', ''),
+                                             caption_type == 'Automatic')
+
+    results = await asyncio.gather(*(download(i) for i in missing), return_exceptions=True)
+    errors = []
+    downloaded = []
+    for i, cues in zip(missing, results):
+        caption_format, language, caption_type = selected[i]
+        if isinstance(cues, Exception):
+            logger.error(f"Error downloading {language} {caption_type} captions: {str(cues)}")
+            errors.append(cues)
+            continue
+        tracks[i] = flask_module.track_record(cues, selected[i], details)
+        downloaded.append(tracks[i])
+    if downloaded:
+        await asyncio.to_thread(_cache_tracks, video_id, downloaded)
+    return flask_module.collect_tracks(info, languages, details, tracks, errors)
+
+
+def _cache_tracks(video_id, tracks):
+    for track in tracks:
+        transcript_cache.set(video_id, track, track['language'], track['type'])
+
+
+# HTTP
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def json_body(payload):
+    # Same encoding as Flask's jsonify outside debug mode
+    return (flask_app.json.dumps(payload, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+async def send_response(send, status, body, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            *([(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+              if status != 304 else []),
+            (b'access-control-allow-origin', b'*'),
+            *headers,
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+    return status
+
+
+async def send_json(send, status, payload, headers=()):
+    """An error response, which nothing may cache"""
+    return await send_response(send, status, json_body(payload),
+                               [(b'cache-control', http_cache.NO_STORE.encode()), *headers])
+
+
+def header_list(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+
+
+async def send_transcript(request, send, payload, handle):
+    """Send a transcript the way app.transcript_response does: ETag, 304 and stored compressed variants"""
+    body = json_body(payload)
+    tag = http_cache.etag(body)
+    encoding = http_cache.choose_encoding(len(body), request['headers'].get('accept-encoding'))
+    cache_control = {'Cache-Control': http_cache.cache_control(request['method'], '/transcribe', 200)}
+    precondition = http_cache.precondition_status(request['method'], request['headers'].get('if-none-match'), tag)
+    if precondition == 304:
+        return await send_response(send, 304, b'',
+                                   header_list({**http_cache.validator_headers(tag, encoding), **cache_control}))
+    if precondition == 412:
+        return await send_json(send, 412, {'error': 'If-None-Match matches the current response'})
+    if encoding:
+        body = await asyncio.to_thread(http_cache.encode, body, tag, encoding, flask_module.transcript_handles,
+                                       handle, 'transcribe')
+    return await send_response(send, 200, body,
+                               header_list({**http_cache.representation_headers(tag, encoding), **cache_control}))
+
+
+async def transcribe(scope, receive, send):
+    """GET or POST /transcribe, answering exactly as app.transcribe_video does"""
+    request = {
+        'method': scope['method'],
+        'headers': {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']},
+    }
+    try:
+        if scope['method'] == 'GET':
+            query = urllib.parse.parse_qs(scope.get('query_string', b'').decode('latin-1'))
+            data = flask_module.query_options({name: values[0] for name, values in query.items()})
+        else:
+            body = await read_body(receive)
+            if body is None:
+                return 499
+            try:
+                data = json.loads(body or b'null')
+            except ValueError:
+                return await send_json(send, 400, {'error': 'Request body must be JSON'})
+        if not isinstance(data, dict):
+            return await send_json(send, 400, {'error': 'No URL provided'})
+        youtube_url = str(data.get('url') or '').strip()
+        include_cues = bool(data.get('include_cues'))
+        all_tracks = bool(data.get('all_tracks'))
+
+        if not youtube_url:
+            return await send_json(send, 400, {'error': 'No URL provided'})
+        if not flask_module.is_valid_youtube_url(youtube_url):
+            return await send_json(send, 400, {'error': 'Invalid YouTube URL'})
+        try:
+            languages = parse_languages(data.get('languages'))
+        except ValueError as e:
+            return await send_json(send, 400, {'error': str(e)})
+
+        logger.info(f"Processing YouTube URL: {youtube_url}")
+
+        if all_tracks:
+            result = await get_all_tracks(youtube_url, languages)
+            if not result:
+                return await send_json(send, 404, {'error': flask_module.no_captions_message(languages)})
+            payload = await asyncio.to_thread(flask_module.all_tracks_payload, result, include_cues)
+            handle = payload['tracks'][0]['handle'] if payload['tracks'] else None
+            return await send_transcript(request, send, payload, handle)
+
+        captions_data = await get_captions(youtube_url, languages)
+        if not captions_data:
+            return await send_json(send, 404, {'error': flask_module.no_captions_message(languages)})
+
+        payload = transcription_payload(captions_data, include_cues=include_cues)
+        payload['handle'] = await asyncio.to_thread(flask_module.transcript_handles.put, captions_data)
+        logger.info("Captions extracted successfully")
+        return await send_transcript(request, send, payload, payload['handle'])
+
+    except UpstreamError as e:
+        logger.error(f"Upstream refused caption extraction: {str(e)}")
+        headers = [(b'retry-after', str(int(math.ceil(e.retry_after))).encode())] if e.retry_after else []
+        return await send_json(send, e.status_code, {'error': str(e)}, headers)
+    except Exception as e:
+        logger.error(f"Error during caption extraction: {str(e)}")
+        return await send_json(send, 500, {'error': f'Caption extraction failed: {str(e)}'})
+
+
+async def serve_transcribe(scope, receive, send):
+    started = time.perf_counter()
+    token = metrics.start_trace(method=scope['method'], path=scope['path']) if flask_module.TRACE_LOG else None
+    status = 500
+    try:
+        status = await transcribe(scope, receive, send)
+    finally:
+        metrics.REGISTRY.observe('yt_http_request_duration_seconds', time.perf_counter() - started,
+                                 endpoint='/transcribe')
+        metrics.inc('yt_http_requests_total', endpoint='/transcribe', status=str(status))
+        if token is not None:
+            metrics.end_trace(token, endpoint='/transcribe', status=status)
+
+
+async def lifespan(receive, send):
+    global _clients, _executor
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Heavy imports and YTDL_POOL_WARM instances before the first request, off the loop
+            await asyncio.to_thread(flask_module.warm_up)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _clients is not None:
+                for client in _clients:
+                    await client.aclose()
+                _clients = None
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+                _executor = None
+            flask_module.extraction_pool.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+wsgi = WSGIMiddleware(flask_app, workers=WSGI_WORKERS)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http' and scope['path'] == '/transcribe' and scope['method'] in ('GET', 'POST'):
+        return await serve_transcribe(scope, receive, send)
+    return await wsgi(scope, receive, send)
@@ -0,0 +1,164 @@
+"""Batch transcription of video lists, playlists and channels.
+
+Inputs are expanded to individual videos with yt-dlp's flat playlist
+extraction (one cheap listing request per playlist, no per-video page
+loads, made through the caller's rate limiter and YoutubeDL pool) and then
+fanned out over a bounded thread pool. Results are yielded
+as each video finishes, so one slow video never holds back the rest.
+
+Usage:
+    python batch.py URL [URL ...] [--workers 4] [--limit 500] [-o out.ndjson]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cues import CueList
+from youtube_urls import VIDEO_ID_RE, canonical_url, extract_video_id, is_youtube_url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 4))
+DEFAULT_LIMIT = int(os.environ.get('BATCH_MAX_VIDEOS', 500))
+
+# Channel pages list their tabs (Videos, Shorts, Live) as nested playlists
+MAX_EXPAND_DEPTH = 2
+
+
+def _flat_entries(url, list_entries, depth=0):
+    """Yield video IDs listed by a playlist or channel URL"""
+    info = list_entries(url)
+    for entry in info.get('entries') or []:
+        if not entry:
+            continue
+        entry_id = entry.get('id') or ''
+        if entry.get('ie_key', 'Youtube') == 'Youtube' and VIDEO_ID_RE.match(entry_id):
+            yield entry_id
+        elif entry.get('url') and depth < MAX_EXPAND_DEPTH:
+            yield from _flat_entries(entry['url'], list_entries, depth + 1)
+
+
+def expand_urls(urls, list_entries, limit=DEFAULT_LIMIT):
+    """Expand video, playlist and channel URLs into unique video URLs
+
+    list_entries is called with a playlist or channel URL and returns its
+    flat yt-dlp info (as produced by fetch_playlist_info). Returns (videos, errors) where videos is a list of (video_id, url) pairs
+    and errors is a list of (url, message) pairs for inputs that failed.
+    """
+    videos = []
+    errors = []
+    seen = set()
+
+    def add(video_id):
+        if video_id not in seen and (not limit or len(videos) < limit):
+            seen.add(video_id)
+            videos.append((video_id, canonical_url(video_id)))
+
+    for url in urls:
+        url = (url or '').strip()
+        if not url:
+            continue
+        if not is_youtube_url(url):
+            errors.append((url, 'Invalid YouTube URL'))
+            continue
+        video_id = extract_video_id(url)
+        if video_id:
+            add(video_id)
+            continue
+        try:
+            for entry_id in _flat_entries(url, list_entries):
+                add(entry_id)
+        except Exception as e:
+            logger.error(f"Error expanding playlist {url}: {str(e)}")
+            errors.append((url, f'Playlist expansion failed: {str(e)}'))
+
+    return videos, errors
+
+
+def iter_batch_results(urls, extract, list_entries, max_workers=DEFAULT_WORKERS, limit=DEFAULT_LIMIT):
+    """Yield one result dict per video, in completion order
+
+    extract is called with a video URL and returns a captions dict (as
+    produced by extract_youtube_captions) or None when no captions exist;
+    list_entries expands playlists (see expand_urls).
+    """
+    videos, errors = expand_urls(urls, list_entries, limit=limit)
+    for url, message in errors:
+        yield {'url': url, 'success': False, 'error': message}
+
+    if not videos:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {pool.submit(extract, url): (index, video_id, url)
+                   for index, (video_id, url) in enumerate(videos)}
+        try:
+            for future in as_completed(futures):
+                index, video_id, url = futures[future]
+                item = {'index': index, 'video_id': video_id, 'url': url}
+                try:
+                    captions_data = future.result()
+                except Exception as e:
+                    logger.error(f"Error during batch extraction of {url}: {str(e)}")
+                    item.update(success=False, error=f'Caption extraction failed: {str(e)}')
+                else:
+                    if captions_data:
+                        item.update(transcription_payload(captions_data))
+                    else:
+                        item.update(success=False, error='No closed captions found for this video.')
+                yield item
+        finally:
+            # A client that disconnects mid-stream should not leave queued work behind
+            for future in futures:
+                future.cancel()
+
+
+def transcription_payload(captions_data, include_cues=False):
+    """Shape a captions dict the way /transcribe returns it
+
+    With include_cues, timed cues are added as parallel start/end/text arrays.
+    """
+    payload = {
+        'transcription': captions_data['text'],
+        'title': captions_data.get('title', 'Unknown Title'),
+        'duration': captions_data.get('duration', 'Unknown Duration'),
+        'uploader': captions_data.get('uploader', 'Unknown'),
+        'language': captions_data.get('language', 'Unknown'),
+        'caption_type': captions_data.get('type', 'Unknown'),
+        'success': True
+    }
+    if include_cues:
+        cues = CueList.coerce(captions_data.get('cues'))
+        payload['cues'] = cues.to_json() if cues is not None else None
+    return payload
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Extract captions for many YouTube videos, playlists or channels.')
+    parser.add_argument('urls', nargs='+', help='video, playlist or channel URLs')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='concurrent extractions')
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help='maximum number of videos (0 = no limit)')
+    parser.add_argument('-o', '--output', help='write NDJSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    # Imported here so that app.py can import this module at startup
+    from app import fetch_playlist_info, get_captions
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    failures = 0
+    try:
+        for item in iter_batch_results(args.urls, get_captions, fetch_playlist_info, max_workers=args.workers, limit=args.limit):
+            failures += not item['success']
+            out.write(json.dumps(item, ensure_ascii=False) + '\n')
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""Load-test /transcribe on the threaded and the async server against a stub upstream.
+
+Starts a stub caption host that answers every GET after --caption-latency,
+then runs the app in a subprocess under gunicorn (app:app, gthread) and
+under uvicorn (asgi:app), with yt-dlp replaced by a stub whose extract_info
+sleeps for --info-latency and points at the caption host. Every server gets
+one process. The caption host is asyncio-based rather than
+benchmarks/fake_upstream.py: with a thread per connection it would become the
+bottleneck at a few hundred connections. At each
+concurrency level the client keeps that many /transcribe requests in flight,
+each for a different video so nothing is cached or coalesced, and reports
+throughput and latency percentiles.
+
+Usage:
+    python benchmarks/bench_asgi.py [--concurrency 10 100 300] [--servers gunicorn uvicorn]
+                                    [--info-latency 0.1] [--caption-latency 0.2] [--threads 32]
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, '..')
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402
+
+from fake_upstream import DEFAULT_BODY  # noqa: E402
+
+SERVERS = ('gunicorn', 'uvicorn')
+CLIENT_POOL_CONNECTIONS = 10
+
+
+class StubYoutubeDL:
+    """Stands in for yt_dlp.YoutubeDL: a slow extract_info pointing at the fake caption host"""
+
+    def __init__(self, opts=None):
+        self.params = dict(opts or {})
+
+    def extract_info(self, url, download=False):
+        time.sleep(float(os.environ['STUB_INFO_LATENCY']))
+        video_id = url.rsplit('=', 1)[-1]
+        return {
+            'id': video_id,
+            'title': 'Load Test',
+            'duration': 60,
+            'uploader': 'bench',
+            'subtitles': {},
+            'automatic_captions': {'en': [{'ext': 'vtt', 'url': f"{os.environ['STUB_CAPTION_URL']}/{video_id}.vtt"}]},
+        }
+
+    def close(self):
+        pass
+
+
+def serve_captions(port, latency):
+    """Answer every request with DEFAULT_BODY after latency seconds, keeping connections open"""
+    response = (b'HTTP/1.1 200 OK\r\nContent-Type: text/vtt\r\nContent-Length: %d\r\n\r\n'
+                % len(DEFAULT_BODY)) + DEFAULT_BODY
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                await reader.readuntil(b'\r\n\r\n')
+                if latency:
+                    await asyncio.sleep(latency)
+                writer.write(response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def run():
+        server = await asyncio.start_server(handle, '127.0.0.1', port, backlog=4096)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+def serve(server, port, threads):
+    """Run the app in this process with yt-dlp stubbed out"""
+    mock.patch('yt_dlp.YoutubeDL', StubYoutubeDL).start()
+    logging.disable(logging.INFO)
+    if server == 'uvicorn':
+        import uvicorn
+
+        import asgi
+        uvicorn.run(asgi.app, host='127.0.0.1', port=port, log_level='warning', backlog=4096)
+        return
+
+    from gunicorn.app.base import BaseApplication
+
+    import app
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in {'bind': f"127.0.0.1:{port}", 'workers': 1, 'threads': threads,
+                               'worker_class': 'gthread', 'backlog': 4096, 'loglevel': 'warning'}.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app.app
+
+    Server().run()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(process, url, name):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=30)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{name} did not start at {url}")
+
+
+def start_captions(args):
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', 'captions',
+                                '--port', str(port), '--caption-latency', str(args.caption_latency)])
+    url = f"http://127.0.0.1:{port}"
+    wait_for(process, f"{url}/ready", 'caption host')
+    return process, url
+
+
+def start_server(server, args, caption_url, workdir):
+    port = free_port()
+    env = dict(
+        os.environ,
+        STUB_INFO_LATENCY=str(args.info_latency),
+        STUB_CAPTION_URL=caption_url,
+        CAPTION_SOURCES='yt_dlp',
+        # The threaded chain holds two executor threads per request (info and track)
+        CAPTION_SOURCE_WORKERS=str(args.threads * 2),
+        # The stub needs no protecting; the harness measures the server, not the token bucket
+        UPSTREAM_RATE='0',
+        UPSTREAM_STATE_PATH='',
+        TRANSCRIPT_CACHE_PATH='',
+        TRANSCRIPT_CACHE_MEMORY_ITEMS='0',
+        TRANSCRIPT_HANDLE_PATH=os.path.join(workdir, f"{server}-handles.sqlite3"),
+        TRANSCRIPT_INDEX_PATH='',
+        METRICS_PATH='',
+        JOB_STORE='memory',
+        YTDL_POOL_SIZE=str(args.threads),
+        # StubYoutubeDL is patched into the server process only
+        EXTRACT_PROCESSES='0',
+    )
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', server,
+                                '--port', str(port), '--threads', str(args.threads)], env=env, cwd=ROOT)
+    base_url = f"http://127.0.0.1:{port}"
+    wait_for(process, f"{base_url}/cache/stats", server)
+    return process, base_url
+
+
+async def load(base_url, concurrency, total, prefix):
+    samples = []
+    failures = 0
+    counter = iter(range(total))
+    # Small pools: httpcore's cost per request grows with the connections in a pool
+    ssl_context = httpx.create_ssl_context()
+    limits = httpx.Limits(max_connections=CLIENT_POOL_CONNECTIONS, max_keepalive_connections=CLIENT_POOL_CONNECTIONS)
+    clients = [httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300, verify=ssl_context)
+               for _ in range(math.ceil(concurrency / CLIENT_POOL_CONNECTIONS))]
+
+    async def worker(client):
+        nonlocal failures
+        for n in counter:
+            video_id = f"{prefix}{n:09d}"
+            start = time.perf_counter()
+            try:
+                response = await client.post('/transcribe', json={'url': f"https://www.youtube.com/watch?v={video_id}"})
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                samples.append(time.perf_counter() - start)
+            else:
+                failures += 1
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker(clients[i % len(clients)]) for i in range(concurrency)))
+    finally:
+        for client in clients:
+            await client.aclose()
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    quantiles = statistics.quantiles(samples, n=100, method='inclusive') if len(samples) > 1 else samples * 99
+    return {
+        'requests': total,
+        'failures': failures,
+        'seconds': elapsed,
+        'rps': len(samples) / elapsed,
+        'p50_ms': statistics.median(samples) * 1000 if samples else None,
+        'p99_ms': quantiles[98] * 1000 if samples else None,
+    }
+
+
+def run_levels(server, args, caption_url, workdir):
+    process, base_url = start_server(server, args, caption_url, workdir)
+    try:
+        for level, concurrency in enumerate(args.concurrency):
+            total = args.requests or concurrency * 2
+            result = asyncio.run(load(base_url, concurrency, total, f"{server[0]}{level}"))
+            p50 = f"{result['p50_ms']:8.1f}" if result['p50_ms'] is not None else '       -'
+            p99 = f"{result['p99_ms']:8.1f}" if result['p99_ms'] is not None else '       -'
+            print(f"{server:<9} concurrency {concurrency:4d}  {result['requests']:5d} requests  "
+                  f"{result['rps']:7.1f} req/s  p50 {p50} ms  p99 {p99} ms  failures {result['failures']}")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[10, 100, 300])
+    parser.add_argument('--requests', type=int, default=0, help='requests per level (default: 2 x concurrency)')
+    parser.add_argument('--servers', nargs='+', choices=SERVERS, default=list(SERVERS))
+    parser.add_argument('--info-latency', type=float, default=0.1, help='seconds each stub extract_info sleeps')
+    parser.add_argument('--caption-latency', type=float, default=0.2, help='seconds the fake caption host waits')
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn threads and YoutubeDL pool size')
+    parser.add_argument('--serve', choices=SERVERS + ('captions',), help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve == 'captions':
+        serve_captions(args.port, args.caption_latency)
+        return
+    if args.serve:
+        serve(args.serve, args.port, args.threads)
+        return
+
+    captions, caption_url = start_captions(args)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for server in args.servers:
+                run_levels(server, args, caption_url, workdir)
+    finally:
+        captions.terminate()
+        captions.wait(timeout=30)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Micro-benchmark text_cleaning against the old multi-pass regex cleaners.
+
+The legacy functions below are the pre-text_cleaning implementations, kept
+here only as a baseline. Each case runs on a multi-MB synthetic caption
+document and reports throughput in MB/s.
+
+Usage:
+    python benchmarks/bench_cleaning.py [--lines 40000] [--repeat 5]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_dedup import rolling_vtt  # noqa: E402
+from text_cleaning import clean_caption_text, clean_cue_text  # noqa: E402
+
+
+def legacy_clean_caption_text(content):
+    text = re.sub(r'<[^>]+>', ' ', content)
+    text = re.sub(r'&[a-zA-Z]+;', ' ', text)
+    text = re.sub(r'\d{2}:\d{2}:\d{2}[.,]\d{3}', ' ', text)
+    text = re.sub(r'-->', ' ', text)
+    text = re.sub(r'WEBVTT', ' ', text)
+    text = re.sub(r'NOTE.*', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def legacy_clean_line(line):
+    clean_line = re.sub(r'<[^>]+>', '', line)
+    clean_line = re.sub(r'&[a-zA-Z]+;', ' ', clean_line)
+    return clean_line.strip()
+
+
+def legacy_clean_xml(xml_content):
+    text = re.sub(r'<[^>]+>', ' ', xml_content)
+    text = re.sub(r'&[a-zA-Z]+;', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def srv3_document(vtt):
+    """Re-express the VTT cue lines as an srv3-style XML document"""
+    lines = [line for line in vtt.split('\n') if line and '-->' not in line][3:]
+    body = ''.join(f'<p t="{i * 1000}" d="1000"><s>{line.replace("&", "&amp;")}</s></p>'
+                   for i, line in enumerate(lines))
+    return f'<?xml version="1.0" encoding="utf-8" ?><timedtext format="3"><body>{body}</body></timedtext>'
+
+
+def best_of(fn, arg, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=40000, help='caption lines in the synthetic track')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per case (best is reported)')
+    args = parser.parse_args(argv)
+
+    vtt, _ = rolling_vtt(args.lines)
+    vtt = vtt.replace(' you ', ' you &amp; me ')
+    xml = srv3_document(vtt)
+    vtt_lines = vtt.split('\n')
+
+    cases = [
+        ('document (fallback)', vtt, legacy_clean_caption_text, clean_caption_text),
+        ('xml fallback', xml, legacy_clean_xml, clean_caption_text),
+        ('vtt per-line', vtt_lines,
+         lambda lines: [legacy_clean_line(line) for line in lines],
+         lambda lines: [clean_cue_text(line) for line in lines]),
+    ]
+    for name, data, legacy, current in cases:
+        size_mb = (len(data) if isinstance(data, str) else sum(len(line) + 1 for line in data)) / 1e6
+        old = best_of(legacy, data, args.repeat)
+        new = best_of(current, data, args.repeat)
+        print(f"{name:<20} {size_mb:6.2f} MB  legacy {size_mb / old:7.1f} MB/s  "
+              f"text_cleaning {size_mb / new:7.1f} MB/s  speedup {old / new:4.2f}x")
+
+
+if __name__ == '__main__':
+    main()
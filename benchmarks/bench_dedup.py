@@ -0,0 +1,80 @@
+"""Benchmark rolling auto-caption deduplication on growing VTT tracks.
+
+Generates YouTube-style automatic captions (each line shown in a timed cue,
+repeated in a 10ms cue, then carried into the next cue) at doubling lengths
+and reports time per cue. A flat per-cue cost across sizes confirms the
+dedup stage is linear.
+
+Usage:
+    python benchmarks/bench_dedup.py [--cues 5000] [--steps 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from caption_dedup import dedupe_rolling_cues  # noqa: E402
+from caption_stream import iter_vtt_cues  # noqa: E402
+
+WORDS = ('the a we you this that video going to really just so and know like '
+         'think about what right okay well here there time people actually').split()
+
+
+def clock(seconds):
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:06.3f}"
+
+
+def rolling_vtt(lines, seed=0):
+    """Build an auto-caption VTT with the rolling two-line window"""
+    rng = random.Random(seed)
+    out = ['WEBVTT', 'Kind: captions', 'Language: en', '']
+    previous = ''
+    t = 0.0
+    for _ in range(lines):
+        line = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 9)))
+        words = line.split()
+        timed = ''.join(f"<{clock(t + 0.3 * i)}><c> {w}</c>" for i, w in enumerate(words[1:], 1))
+        out += [f"{clock(t)} --> {clock(t + 2.5)} align:start position:0%",
+                previous, f"{words[0]}{timed}", '']
+        out += [f"{clock(t + 2.5)} --> {clock(t + 2.51)} align:start position:0%",
+                previous, line, '']
+        previous = line
+        t += 2.51
+    return '\n'.join(out), lines
+
+
+def run(cues, steps):
+    results = []
+    for step in range(steps):
+        lines = cues * 2 ** step
+        vtt, _ = rolling_vtt(lines)
+        parsed = list(iter_vtt_cues([vtt]))
+        start = time.perf_counter()
+        deduped = list(dedupe_rolling_cues(parsed))
+        elapsed = time.perf_counter() - start
+        words_in = sum(len(c.text.split()) for c in parsed)
+        words_out = sum(len(c.text.split()) for c in deduped)
+        results.append((len(parsed), len(vtt), elapsed, words_in, words_out))
+        print(f"{len(parsed):>9} cues {len(vtt) / 1e6:7.2f} MB  {elapsed * 1000:9.1f} ms  "
+              f"{elapsed / len(parsed) * 1e6:6.2f} us/cue  words {words_in} -> {words_out}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cues', type=int, default=5000, help='caption lines in the smallest track')
+    parser.add_argument('--steps', type=int, default=5, help='number of doublings')
+    args = parser.parse_args(argv)
+    results = run(args.cues, args.steps)
+    first, last = results[0], results[-1]
+    ratio = (last[2] / last[0]) / (first[2] / first[0])
+    print(f"per-cue cost ratio largest/smallest: {ratio:.2f} (about 1.0 means linear)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Compare the template DOCX writer with the python-docx fallback.
+
+Both writers export the recorded fixture transcripts plus a synthetic
+multi-hour transcript; each case reports the best time, output size and the
+speedup. The two documents are also checked for identical paragraphs, styles
+and bold runs, since the fast writer must keep the python-docx layout.
+
+Usage:
+    python benchmarks/bench_docx.py [--sentences 40000] [--repeat 3]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from run_benchmarks import SIZES, load_fixture  # noqa: E402
+from docx_export import build_docx_fast, build_docx_python  # noqa: E402
+
+META = {'title': 'Benchmark Fixture', 'duration': '03:00:00', 'uploader': 'bench',
+        'language': 'en', 'caption_type': 'Automatic'}
+
+
+def fixture_text(size):
+    from app import parse_caption_content
+    return parse_caption_content(load_fixture(size, 'json3').decode('utf-8'), 'json3')
+
+
+def synthetic_text(sentences):
+    words = ('so', 'the', 'caption', 'track', 'keeps', 'going', 'and', 'we', 'talk', 'about', 'it')
+    return ' '.join(f"{' '.join(words[i % 5:i % 5 + 6]).capitalize()} number {i}." for i in range(sentences))
+
+
+def layout(body):
+    from docx import Document
+    document = Document(io.BytesIO(body))
+    return [(p.style.name, p.text, [run.bold for run in p.runs]) for p in document.paragraphs]
+
+
+def best_of(fn, text, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn(text, META)
+        best = min(best, time.perf_counter() - start)
+    return best, body
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sentences', type=int, default=40000, help='sentences in the synthetic transcript')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case (best is reported)')
+    args = parser.parse_args(argv)
+
+    cases = [(size, fixture_text(size)) for size in SIZES]
+    cases.append((f"synthetic-{args.sentences}", synthetic_text(args.sentences)))
+    for name, text in cases:
+        size_mb = len(text.encode('utf-8')) / 1e6
+        old, old_body = best_of(build_docx_python, text, args.repeat)
+        new, new_body = best_of(build_docx_fast, text, args.repeat)
+        same = 'same layout' if layout(old_body) == layout(new_body) else 'LAYOUT DIFFERS'
+        print(f"{name:<18} {size_mb:6.2f} MB  python-docx {old * 1000:9.1f} ms  template {new * 1000:8.1f} ms  "
+              f"speedup {old / new:6.1f}x  {len(new_body) / 1e3:7.1f} KB  {same}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Benchmark the cost of running extraction in the supervised process pool.
+
+Compares a task run in an extraction process (see extract_pool.py) with the
+same call made in-process: an empty task, which measures the round trip
+alone, and parsing each recorded VTT fixture into a CueList. For the parse,
+"transfer" is the pool time less the time the task took in the child: the
+cost of sending the transcript back. Also times how long the pool takes to
+kill a task past its timeout and serve the next one from a fresh process.
+
+Usage:
+    python benchmarks/bench_extract_pool.py [--repeat 50] [--sizes small medium long]
+"""
+import argparse
+import io
+import logging
+import os
+import pickle
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+from caption_dedup import dedupe_rolling_cues  # noqa: E402
+from caption_stream import iter_caption_cues, iter_chunks  # noqa: E402
+from cues import CueList  # noqa: E402
+from extract_pool import ExtractionPool, ExtractionTimeout  # noqa: E402
+from run_benchmarks import SIZES, load_fixture  # noqa: E402
+
+
+def noop():
+    return None
+
+
+def parse_fixture(size):
+    """What download_caption_cues does with an automatic VTT track, minus the download"""
+    chunks = iter_chunks(io.BytesIO(load_fixture(size, 'vtt')))
+    return CueList(dedupe_rolling_cues(iter_caption_cues(chunks, 'vtt')))
+
+
+def timed_parse(size):
+    """parse_fixture plus the milliseconds it took in this process"""
+    start = time.perf_counter()
+    cues = parse_fixture(size)
+    return (time.perf_counter() - start) * 1000, cues
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def timings(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentiles(samples)
+
+
+def report(name, local, pooled, note=''):
+    print(f"{name:<16} in-process {local[0]:8.2f} ms  pool {pooled[0]:8.2f} ms  (p99 {pooled[1]:8.2f}){note}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure extraction pool overhead.')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--sizes', nargs='+', choices=SIZES, default=list(SIZES))
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.ERROR)
+    # The forkserver starts from PYTHONPATH, not this sys.path; with the tasks
+    # preloaded there, a replacement process starts the way the app's do
+    os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, [BENCH_DIR, os.path.join(BENCH_DIR, '..'),
+                                                            os.environ.get('PYTHONPATH')]))
+    pool = ExtractionPool(processes=1, max_tasks=0, preload=['bench_extract_pool'])
+    pool.start()
+    pool.run('bench_extract_pool:noop')
+
+    report('round trip', timings(noop, args.repeat), timings(lambda: pool.run('bench_extract_pool:noop'), args.repeat))
+    for size in args.sizes:
+        cues = parse_fixture(size)
+        payload = len(pickle.dumps(cues, protocol=pickle.HIGHEST_PROTOCOL))
+        local = timings(lambda: parse_fixture(size), args.repeat)
+        totals, transfers = [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            inside, _ = pool.run('bench_extract_pool:timed_parse', size)
+            totals.append((time.perf_counter() - start) * 1000)
+            transfers.append(totals[-1] - inside)
+        report(f"parse {size}", local, percentiles(totals),
+               f"  transfer {statistics.median(transfers):6.2f} ms for {len(cues)} cues, {payload / 1024:.0f} KiB")
+
+    def kill_and_replace():
+        try:
+            pool.run('bench_extract_pool:sleep', 10, timeout=0.05)
+        except ExtractionTimeout:
+            pass
+        pool.run('bench_extract_pool:noop')
+
+    # The 50ms timeout is part of every sample; the rest is the kill and the new process
+    replace = timings(kill_and_replace, min(args.repeat, 20))
+    print(f"{'kill + replace':<16} {replace[0] - 50:8.2f} ms after the timeout  (p99 {replace[1] - 50:8.2f})")
+    pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""Import-time and cold-start benchmark for every entry point.
+
+Each entry point (the Flask app as a gunicorn worker imports it, the ASGI
+app and each Netlify function) is imported in a fresh interpreter, then
+answers one request that the transcript cache can serve, the way a cold
+container or a fresh worker would. The run reports:
+
+* import and first-request time, and the whole process from exec to exit;
+* which heavy dependencies (yt-dlp, requests, the transcript API, httpx,
+  python-docx) were loaded along the way; a cache hit should need none;
+* the slowest packages from a `python -X importtime` run of the import.
+
+"app (forked)" is a worker forked from a master that preloaded the app, as
+gunicorn.conf.py does. Results are written as JSON; with --baseline the run
+exits non-zero when an entry point's import got slower by more than
+--tolerance or started loading a heavy dependency it did not load before:
+
+    python benchmarks/bench_startup.py                    # writes results/startup-<commit>.json
+    python benchmarks/bench_startup.py --baseline benchmarks/results/startup-abc1234.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from run_benchmarks import RESULTS_DIR, git_commit  # noqa: E402
+
+HEAVY = ('yt_dlp', 'requests', 'youtube_transcript_api', 'httpx', 'docx')
+VIDEO_ID = 'dQw4w9WgXcQ'
+URL = f"https://www.youtube.com/watch?v={VIDEO_ID}"
+FUNCTIONS = os.path.join(ROOT, 'netlify', 'functions')
+BODY = json.dumps({'transcription': 'Cold start check.', 'title': 'Cold start'})
+
+# name: (module, setup run before the import, first request given the module as `entry`)
+ENTRY_POINTS = {
+    'app': ('app', '', f"assert entry.app.test_client().post('/transcribe', json={{'url': {URL!r}}}).status_code == 200"),
+    'asgi': ('asgi', '', ''),
+    'netlify/transcribe': (
+        'transcribe', f"sys.path.insert(0, {FUNCTIONS!r})",
+        f"assert entry.handler({{'body': json.dumps({{'url': {URL!r}}})}}, None)['statusCode'] == 200"),
+    'netlify/download_docx': (
+        'download_docx', f"sys.path.insert(0, {FUNCTIONS!r})",
+        f"assert entry.handler({{'body': {BODY!r}}}, None)['statusCode'] == 200"),
+    'netlify/download_export': (
+        'download_export', f"sys.path.insert(0, {FUNCTIONS!r})",
+        f"assert entry.handler({{'queryStringParameters': {{'format': 'txt'}}, 'body': {BODY!r}}}, None)['statusCode'] == 200"),
+    'netlify/download_json': (
+        'download_json', f"sys.path.insert(0, {FUNCTIONS!r})",
+        f"assert entry.handler({{'body': {BODY!r}}}, None)['statusCode'] == 200"),
+}
+
+CHILD = '''
+import json, os, sys, time
+t0 = time.perf_counter()
+{setup}
+import {module} as entry
+t1 = time.perf_counter()
+{request}
+t2 = time.perf_counter()
+print(json.dumps({{'import_ms': (t1 - t0) * 1000, 'request_ms': (t2 - t1) * 1000,
+                  'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+# The master imports and warms the app; the timing starts at the fork
+FORKED = '''
+import json, os, sys, time
+import app as entry
+entry.warm_up(instances=0)
+read_end, write_end = os.pipe()
+t0 = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    t1 = time.perf_counter()
+    {request}
+    t2 = time.perf_counter()
+    os.write(write_end, json.dumps({{'import_ms': (t1 - t0) * 1000, 'request_ms': (t2 - t1) * 1000,
+                                     'heavy': [m for m in {heavy!r} if m in sys.modules]}}).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+print(os.read(read_end, 65536).decode())
+'''
+
+
+def child_env(workdir):
+    return dict(
+        os.environ,
+        TRANSCRIPT_CACHE_PATH=os.path.join(workdir, 'cache.sqlite3'),
+        TRANSCRIPT_HANDLE_PATH=os.path.join(workdir, 'handles.sqlite3'),
+        TRANSCRIPT_INDEX_PATH='',
+        UPSTREAM_STATE_PATH='',
+        METRICS_PATH='',
+        JOB_STORE='memory',
+        YTDL_POOL_WARM='0',
+        PYTHONDONTWRITEBYTECODE='',
+    )
+
+
+def seed_cache(workdir):
+    """Store one transcript so the first request of every run is a cache hit"""
+    os.environ['TRANSCRIPT_CACHE_PATH'] = os.path.join(workdir, 'cache.sqlite3')
+    from cues import CueList
+    from transcript_cache import TranscriptCache
+
+    cache = TranscriptCache.from_env()
+    cues = CueList.from_text('Cold start check.')
+    cache.set(VIDEO_ID, {'text': cues.text(), 'cues': cues, 'title': 'Cold start', 'duration': '00:10',
+                         'uploader': 'bench', 'language': 'en', 'type': 'Manual', 'format': 'vtt'})
+
+
+def run_child(code, env):
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = (time.perf_counter() - started) * 1000
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else 'child failed')
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result['process_ms'] = elapsed
+    return result
+
+
+def import_breakdown(module, setup, env, top):
+    """Slowest packages (cumulative ms, including what they import) in a -X importtime run"""
+    code = f"import sys\n{setup}\nimport {module}"
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=env,
+                         capture_output=True, text=True)
+    packages = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        root = name.strip().split('.')[0]
+        if root != module:
+            packages[root] = max(packages.get(root, 0), int(cumulative) / 1000)
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+
+def measure(name, code, env, repeat):
+    runs = [run_child(code, env) for _ in range(repeat)]
+    return {
+        'name': name,
+        'import_ms': statistics.median(r['import_ms'] for r in runs),
+        'request_ms': statistics.median(r['request_ms'] for r in runs),
+        'process_ms': statistics.median(r['process_ms'] for r in runs),
+        'heavy': runs[-1]['heavy'],
+    }
+
+
+def report(result):
+    heavy = ', '.join(result['heavy']) or '-'
+    print(f"{result['name']:<24} import {result['import_ms']:8.1f} ms  first request {result['request_ms']:7.1f} ms  "
+          f"process {result['process_ms']:8.1f} ms  loaded: {heavy}")
+    for package, ms in result.get('packages', []):
+        print(f"{'':<26}{package:<28} {ms:8.1f} ms")
+
+
+def compare(results, baseline_path, tolerance):
+    """Print changes against a baseline; return the entry points that regressed"""
+    with open(baseline_path, encoding='utf-8') as fh:
+        baseline = {r['name']: r for r in json.load(fh)['results']}
+    print(f"\nchange in import time against {baseline_path}:")
+    regressions = []
+    for result in results:
+        old = baseline.get(result['name'])
+        if not old:
+            continue
+        delta = (result['import_ms'] - old['import_ms']) / old['import_ms'] * 100 if old['import_ms'] else 0.0
+        added = sorted(set(result['heavy']) - set(old['heavy']))
+        # A few milliseconds of noise is not a regression, however small the baseline
+        slower = result['import_ms'] > old['import_ms'] * (1 + tolerance) + 5
+        flag = '  REGRESSION' if slower or added else ''
+        print(f"  {result['name']:<24} {old['import_ms']:8.1f} -> {result['import_ms']:8.1f} ms  {delta:+6.1f}%"
+              f"{'  now loads ' + ', '.join(added) if added else ''}{flag}")
+        if flag:
+            regressions.append(result['name'])
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure import time and cold start of every entry point.')
+    parser.add_argument('--only', nargs='+', choices=list(ENTRY_POINTS) + ['app (forked)'],
+                        default=list(ENTRY_POINTS) + ['app (forked)'])
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per entry point')
+    parser.add_argument('--top', type=int, default=8, help='slowest packages to list per entry point')
+    parser.add_argument('-o', '--output', help='result file (default: benchmarks/results/startup-<commit>.json)')
+    parser.add_argument('--baseline', help='earlier result file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown of an import')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        seed_cache(workdir)
+        env = child_env(workdir)
+        for name in args.only:
+            if name == 'app (forked)':
+                request = ENTRY_POINTS['app'][2]
+                result = measure(name, FORKED.format(request=request, heavy=HEAVY), env, args.repeat)
+            else:
+                module, setup, request = ENTRY_POINTS[name]
+                code = CHILD.format(setup=setup or 'pass', module=module, request=request or 'pass', heavy=HEAVY)
+                result = measure(name, code, env, args.repeat)
+                result['packages'] = import_breakdown(module, setup, env, args.top)
+            report(result)
+            results.append(result)
+
+    commit = git_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f"startup-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as fh:
+        json.dump({'commit': commit, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                   'python': sys.version.split()[0], 'repeat': args.repeat, 'results': results}, fh, indent=2)
+    print(f"\nwrote {output}")
+
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
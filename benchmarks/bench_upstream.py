@@ -0,0 +1,109 @@
+"""Drive the upstream scheduler from several processes against the fake upstream.
+
+Starts benchmarks/fake_upstream.py with a server-side rate limit, then
+forks worker processes (standing in for gunicorn workers), each with a few
+threads fetching captions. The run is repeated without the scheduler and
+with it; the shared SQLite token bucket should keep the 429 count near zero
+while finishing every request.
+
+Usage:
+    python benchmarks/bench_upstream.py [--processes 4] [--threads 4] [--requests 15]
+                                        [--limit 20] [--rate 15] [--burst 5] [--error-rate 0.05]
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import requests  # noqa: E402
+
+from fake_upstream import FakeUpstream  # noqa: E402
+from upstream import UpstreamError, UpstreamScheduler  # noqa: E402
+
+
+def fetch(url):
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+    return response.content
+
+
+def worker(url, state_path, args, scheduled, results):
+    scheduler = UpstreamScheduler(path=state_path, rate=args.rate, burst=args.burst, max_wait=60,
+                                  max_attempts=5, backoff_base=0.1, rate_limit_pause=1,
+                                  breaker_threshold=50)
+    counts = {'ok': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    def run():
+        for _ in range(args.requests):
+            try:
+                scheduler.call(fetch, url) if scheduled else fetch(url)
+                key = 'ok'
+            except (UpstreamError, requests.RequestException):
+                key = 'failed'
+            with lock:
+                counts[key] += 1
+
+    threads = [threading.Thread(target=run) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((counts, scheduler.stats()))
+
+
+def run_mode(url, args, scheduled):
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    with tempfile.TemporaryDirectory() as tmp:
+        state_path = os.path.join(tmp, 'upstream.sqlite3')
+        UpstreamScheduler(path=state_path, rate=args.rate, burst=args.burst)
+        start = time.perf_counter()
+        processes = [context.Process(target=worker, args=(url, state_path, args, scheduled, results))
+                     for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        totals = {'ok': 0, 'failed': 0, 'retries': 0}
+        for _ in processes:
+            counts, stats = results.get()
+            totals['ok'] += counts['ok']
+            totals['failed'] += counts['failed']
+            totals['retries'] += stats['retries']
+        for process in processes:
+            process.join()
+        totals['elapsed'] = time.perf_counter() - start
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4, help='threads per process')
+    parser.add_argument('--requests', type=int, default=15, help='requests per thread')
+    parser.add_argument('--limit', type=float, default=20, help='fake upstream requests/second before 429')
+    parser.add_argument('--rate', type=float, default=15, help='scheduler token rate (requests/second)')
+    parser.add_argument('--burst', type=int, default=5, help='scheduler bucket capacity')
+    parser.add_argument('--error-rate', type=float, default=0.05, help='fraction of 503 responses')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    total = args.processes * args.threads * args.requests
+    for scheduled in (False, True):
+        with FakeUpstream(limit=args.limit, error_rate=args.error_rate) as upstream:
+            totals = run_mode(f"{upstream.url}/api/timedtext", args, scheduled)
+            counts = dict(upstream.counts)
+        name = 'scheduled' if scheduled else 'direct'
+        print(f"{name:<10} {totals['ok']:4d}/{total} ok  {totals['failed']:4d} failed  "
+              f"upstream 429s {counts['rate_limited']:4d}  503s {counts['errors']:3d}  "
+              f"retries {totals['retries']:4d}  {totals['elapsed']:6.2f}s  "
+              f"{(counts['ok'] + counts['errors']) / totals['elapsed']:6.1f} req/s admitted")
+
+
+if __name__ == '__main__':
+    main()
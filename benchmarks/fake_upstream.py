@@ -0,0 +1,131 @@
+"""A local stand-in for YouTube's caption endpoints, for rate-limit and load tests.
+
+Serves a caption fixture on every GET, but enforces its own requests-per-
+second limit the way YouTube does: requests over the limit get a 429 with a
+Retry-After header. A fraction of requests can also fail with a 503, and a
+fixed latency can be added per response. Counters are available at /stats.
+
+    python benchmarks/fake_upstream.py --port 8765 --limit 20 --error-rate 0.05
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BODY = b'WEBVTT\n\n00:00:01.000 --> 00:00:02.000\nhello from the fake upstream\n\n'
+
+
+class _Server(ThreadingHTTPServer):
+    # Load tests open hundreds of connections at once
+    request_queue_size = 1024
+
+
+class FakeUpstream:
+    """Threaded HTTP server with a server-side rate limit, run in the background"""
+
+    def __init__(self, limit=20.0, error_rate=0.0, latency=0.0, retry_after=1, body=DEFAULT_BODY,
+                 host='127.0.0.1', port=0):
+        self.limit = limit
+        self.error_rate = error_rate
+        self.latency = latency
+        self.retry_after = retry_after
+        self.body = body
+        self._lock = threading.Lock()
+        self._window = []
+        self.counts = {'ok': 0, 'rate_limited': 0, 'errors': 0}
+        self.server = _Server((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _admit(self):
+        """Return 200, 429 or 503 for a request arriving now"""
+        now = time.monotonic()
+        with self._lock:
+            self._window = [t for t in self._window if now - t < 1.0]
+            if self.limit and len(self._window) >= self.limit:
+                self.counts['rate_limited'] += 1
+                return 429
+            self._window.append(now)
+            if self.error_rate and random.random() < self.error_rate:
+                self.counts['errors'] += 1
+                return 503
+            self.counts['ok'] += 1
+            return 200
+
+    def _handler_class(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; don't let Nagle hold the body back
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if self.path == '/stats':
+                    return self._send(200, json.dumps(upstream.counts).encode(), 'application/json')
+                status = upstream._admit()
+                if upstream.latency:
+                    time.sleep(upstream.latency)
+                if status == 429:
+                    return self._send(429, b'Too Many Requests', 'text/plain',
+                                      {'Retry-After': str(upstream.retry_after)})
+                if status == 503:
+                    return self._send(503, b'Service Unavailable', 'text/plain')
+                self._send(200, upstream.body, 'text/vtt')
+
+            def _send(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--limit', type=float, default=20, help='requests per second before 429s (0 = unlimited)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    args = parser.parse_args(argv)
+
+    upstream = FakeUpstream(args.limit, args.error_rate, args.latency, port=args.port)
+    print(f"fake upstream on {upstream.url}")
+    try:
+        upstream.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Regenerate the recorded caption fixtures in benchmarks/fixtures.
+
+The fixtures are synthetic but shaped like real YouTube downloads: the VTT
+files use the rolling two-line automatic-caption layout with per-word
+timing tags, json3 uses word segments with newline append events, srv3 uses
+<p>/<s> word elements and TTML uses timed <p> lines. Output is deterministic
+(seeded), gzip-compressed and checked in, so benchmark runs are offline and
+comparable between commits. Only rerun this when the fixture shapes change.
+
+Usage:
+    python benchmarks/make_fixtures.py
+"""
+import gzip
+import json
+import os
+import random
+from xml.sax.saxutils import escape
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Name -> spoken minutes covered by the track
+SIZES = {'small': 5, 'medium': 45, 'long': 180}
+LINE_SECONDS = 2.5
+
+WORDS = ('the a we you this that video going to really just so and know like think '
+         'about what right okay well here there time people actually because '
+         "it's don't I'm they're can't won't let's we'll gonna data model "
+         'first second next result & question answer example').split()
+
+
+def clock(seconds):
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:06.3f}"
+
+
+def caption_lines(minutes, seed):
+    """Return (start, end, words) for each spoken caption line"""
+    rng = random.Random(seed)
+    lines = []
+    t = 0.0
+    while t < minutes * 60:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(4, 10))]
+        if rng.random() < 0.08:
+            words[-1] += rng.choice('.?!')
+            words.append(rng.choice(['So', 'And', 'Now', 'Okay']))
+        lines.append((t, t + LINE_SECONDS, words))
+        t += LINE_SECONDS
+    return lines
+
+
+def to_vtt(lines):
+    # YouTube fills the empty half of the two-line window with a line holding
+    # one space, which is cue text and not the blank line that ends a cue
+    out = ['WEBVTT', 'Kind: captions', 'Language: en', '']
+    previous = ' '
+    for start, end, words in lines:
+        step = (end - start) / len(words)
+        timed = ''.join(f"<{clock(start + step * i)}><c> {escape(w)}</c>" for i, w in enumerate(words[1:], 1))
+        out += [f"{clock(start)} --> {clock(end - 0.01)} align:start position:0%",
+                previous, f"{escape(words[0])}{timed}", '']
+        line = escape(' '.join(words))
+        out += [f"{clock(end - 0.01)} --> {clock(end)} align:start position:0%", line, ' ', '']
+        previous = line
+    return '\n'.join(out) + '\n'
+
+
+def to_json3(lines):
+    events = []
+    for start, end, words in lines:
+        step = int((end - start) * 1000 / len(words))
+        segs = [{'utf8': words[0]}] + [{'utf8': f" {w}", 'tOffsetMs': step * i} for i, w in enumerate(words[1:], 1)]
+        events.append({'tStartMs': int(start * 1000), 'dDurationMs': int((end - start) * 1000),
+                       'wWinId': 1, 'segs': segs})
+        events.append({'tStartMs': int(end * 1000) - 10, 'dDurationMs': 10, 'wWinId': 1,
+                       'aAppend': 1, 'segs': [{'utf8': '\n'}]})
+    return json.dumps({'wireMagic': 'pb3', 'pens': [{}], 'wsWinStyles': [{}], 'wpWinPositions': [{}],
+                       'events': events}, separators=(',', ':'))
+
+
+def to_srv3(lines):
+    body = []
+    for start, end, words in lines:
+        step = int((end - start) * 1000 / len(words))
+        segs = f"<s>{escape(words[0])}</s>" + ''.join(
+            f'<s t="{step * i}"> {escape(w)}</s>' for i, w in enumerate(words[1:], 1))
+        body.append(f'<p t="{int(start * 1000)}" d="{int((end - start) * 1000)}" w="1">{segs}</p>')
+    return ('<?xml version="1.0" encoding="utf-8" ?><timedtext format="3">\n<body>\n'
+            + '\n'.join(body) + '\n</body>\n</timedtext>\n')
+
+
+def to_ttml(lines):
+    body = [f'<p begin="{clock(start)}" end="{clock(end)}" style="s2">{escape(" ".join(words))}</p>'
+            for start, end, words in lines]
+    return ('<?xml version="1.0" encoding="utf-8" ?>\n'
+            '<tt xml:lang="en" xmlns="http://www.w3.org/ns/ttml"><head/><body><div>\n'
+            + '\n'.join(body) + '\n</div></body></tt>\n')
+
+
+WRITERS = {'vtt': to_vtt, 'json3': to_json3, 'srv3': to_srv3, 'ttml': to_ttml}
+
+
+def main():
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for size, minutes in SIZES.items():
+        lines = caption_lines(minutes, seed=minutes)
+        for ext, writer in WRITERS.items():
+            path = os.path.join(FIXTURE_DIR, f"{size}.{ext}.gz")
+            data = writer(lines).encode('utf-8')
+            # mtime=0 keeps the compressed bytes identical between runs
+            with open(path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as fh:
+                fh.write(data)
+            print(f"{path}: {len(data) / 1e6:.2f} MB raw, {os.path.getsize(path) / 1e6:.2f} MB gzipped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""Offline benchmark suite for parsing, export and the /transcribe request path.
+
+Runs against the recorded fixtures in benchmarks/fixtures (see
+make_fixtures.py) with yt-dlp replaced by an in-process stub, so no network
+access is needed. Every case reports throughput, p50/p90/p99 latency and
+peak traced memory, and the whole run is written as JSON so two commits can
+be compared:
+
+    python benchmarks/run_benchmarks.py                    # writes results/<commit>.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/results/abc1234.json
+    python benchmarks/run_benchmarks.py --sizes small medium --only parse
+"""
+import argparse
+import gzip
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+SIZES = ('small', 'medium', 'long')
+FORMATS = ('vtt', 'json3', 'srv3', 'ttml')
+GROUPS = ('parse', 'stream', 'paragraphs', 'export_json', 'export_srt', 'export_docx', 'transcribe')
+
+
+def load_fixture(size, fmt):
+    with gzip.open(os.path.join(FIXTURE_DIR, f"{size}.{fmt}.gz"), 'rb') as fh:
+        return fh.read()
+
+
+class FakeYoutubeDL:
+    """Stands in for yt_dlp.YoutubeDL: serves one fixture as automatic captions"""
+
+    fixture = None
+    fmt = 'vtt'
+
+    def __init__(self, opts=None):
+        self.opts = self.params = opts or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+    def extract_info(self, url, download=False):
+        return {
+            'id': url.rsplit('=', 1)[-1],
+            'title': 'Benchmark Fixture',
+            'duration': 10800,
+            'uploader': 'bench',
+            'subtitles': {},
+            'automatic_captions': {'en': [{'ext': self.fmt, 'url': f"fixture://{self.fmt}"}]},
+        }
+
+    def urlopen(self, url):
+        return io.BytesIO(self.fixture)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_case(name, fn, nbytes, repeat):
+    """Time fn repeat times (after one warm-up) and trace one extra run for peak memory"""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples.sort()
+    quantiles = statistics.quantiles(samples, n=100, method='inclusive') if len(samples) > 1 else samples * 99
+    p50 = statistics.median(samples)
+    result = {
+        'name': name,
+        'bytes': nbytes,
+        'runs': repeat,
+        'mean_s': statistics.fmean(samples),
+        'min_s': samples[0],
+        'p50_s': p50,
+        'p90_s': quantiles[89],
+        'p99_s': quantiles[98],
+        'mb_per_s': nbytes / 1e6 / p50 if p50 else None,
+        'peak_mb': peak / 1e6,
+    }
+    print(f"{name:<32} {nbytes / 1e6:7.2f} MB  p50 {p50 * 1000:9.2f} ms  p99 {result['p99_s'] * 1000:9.2f} ms  "
+          f"{result['mb_per_s'] or 0:8.1f} MB/s  peak {result['peak_mb']:7.2f} MB")
+    return result
+
+
+def build_cases(app_module, sizes, groups):
+    """Yield (name, fn, nbytes) for every selected benchmark case"""
+    from caption_stream import iter_caption_cues
+    from cues import CueList
+    from text_cleaning import split_into_paragraphs
+
+    client = app_module.app.test_client()
+    counter = iter(range(10 ** 9))
+
+    for size in sizes:
+        texts = {}
+        for fmt in FORMATS:
+            raw = load_fixture(size, fmt)
+            content = raw.decode('utf-8')
+
+            if 'parse' in groups:
+                yield (f"parse/{size}.{fmt}",
+                       lambda c=content, f=fmt: app_module.parse_caption_content(c, f), len(raw))
+            if 'stream' in groups:
+                chunks = [raw[i:i + 65536] for i in range(0, len(raw), 65536)]
+                yield (f"stream/{size}.{fmt}",
+                       lambda ch=chunks, f=fmt: CueList(iter_caption_cues(ch, f)).text(), len(raw))
+            if 'transcribe' in groups:
+                def transcribe(r=raw, f=fmt):
+                    FakeYoutubeDL.fixture, FakeYoutubeDL.fmt = r, f
+                    # A fresh video ID per request keeps every call a cache miss
+                    video_id = f"b{next(counter):010d}"
+                    response = client.post('/transcribe', json={'url': f"https://www.youtube.com/watch?v={video_id}"})
+                    assert response.status_code == 200, response.get_data(as_text=True)[:200]
+                yield f"transcribe/{size}.{fmt}", transcribe, len(raw)
+            texts[fmt] = app_module.parse_caption_content(content, fmt)
+            if fmt == 'json3':
+                cues = app_module.parse_caption_cues(content, fmt).to_json()
+
+        text = texts['json3']
+        payload = {'transcription': text, 'title': 'Benchmark Fixture', 'duration': '03:00:00',
+                   'uploader': 'bench', 'language': 'en', 'caption_type': 'Automatic'}
+        nbytes = len(text.encode('utf-8'))
+        if 'paragraphs' in groups:
+            yield f"paragraphs/{size}", lambda t=text: split_into_paragraphs(t), nbytes
+        if 'export_json' in groups:
+            yield (f"export_json/{size}",
+                   lambda p=payload: client.post('/download/json', json=p).get_data(), nbytes)
+        if 'export_srt' in groups:
+            yield (f"export_srt/{size}",
+                   lambda p=dict(payload, cues=cues): client.post('/download/srt', json=p).get_data(), nbytes)
+        if 'export_docx' in groups:
+            yield (f"export_docx/{size}",
+                   lambda p=payload: client.post('/download/docx', json=p).get_data(), nbytes)
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as fh:
+        baseline = {r['name']: r for r in json.load(fh)['results']}
+    print(f"\nchange in p50 against {baseline_path}:")
+    for result in results:
+        old = baseline.get(result['name'])
+        if old and old['p50_s']:
+            delta = (result['p50_s'] - old['p50_s']) / old['p50_s'] * 100
+            print(f"  {result['name']:<32} {old['p50_s'] * 1000:9.2f} -> {result['p50_s'] * 1000:9.2f} ms  {delta:+6.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the offline parser/export benchmark suite.')
+    parser.add_argument('--sizes', nargs='+', choices=SIZES, default=list(SIZES))
+    parser.add_argument('--only', nargs='+', choices=GROUPS, default=list(GROUPS), help='benchmark groups to run')
+    parser.add_argument('--repeat', type=int, default=7, help='timed runs per case')
+    parser.add_argument('-o', '--output', help='result file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--baseline', help='earlier result file to compare against')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    os.environ.setdefault('TRANSCRIPT_CACHE_PATH', '')
+    os.environ.setdefault('TRANSCRIPT_CACHE_MEMORY_ITEMS', '0')
+    os.environ.setdefault('JOB_STORE', 'memory')
+    # The stubbed upstream needs no protecting; keep the token bucket out of the timings
+    os.environ.setdefault('UPSTREAM_STATE_PATH', '')
+    os.environ.setdefault('UPSTREAM_RATE', '0')
+    os.environ.setdefault('TRANSCRIPT_INDEX_PATH', '')
+    os.environ.setdefault('METRICS_PATH', '')
+    # FakeYoutubeDL is patched into this process only
+    os.environ.setdefault('EXTRACT_PROCESSES', '0')
+
+    with mock.patch('yt_dlp.YoutubeDL', FakeYoutubeDL):
+        import app as app_module
+        results = [run_case(name, fn, nbytes, args.repeat)
+                   for name, fn, nbytes in build_cases(app_module, args.sizes, args.only)]
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\nwrote {output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
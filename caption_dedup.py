@@ -0,0 +1,51 @@
+"""Remove the rolling repetition from YouTube automatic captions.
+
+Auto-generated VTT tracks repeat every line two or three times as the
+caption window scrolls: each cue starts with the tail of the previous one.
+dedupe_rolling_cues drops the longest prefix of each cue that matches the
+suffix of what was already emitted, so every spoken word appears once.
+
+The overlap is found with a KMP prefix function over the new cue's words and
+a bounded tail of emitted words, so each cue costs O(len(cue) + MAX_OVERLAP)
+and a whole track is processed in linear time.
+"""
+from collections import deque
+
+from cues import Cue
+
+# Rolling windows are at most a couple of caption lines; longer runs are real speech
+MAX_OVERLAP = 64
+
+_SENTINEL = object()
+
+
+def _overlap(words, tail):
+    """Length of the longest prefix of words that is also a suffix of tail"""
+    pattern = words + [_SENTINEL] + tail
+    prefix = [0] * len(pattern)
+    k = 0
+    for i in range(1, len(pattern)):
+        while k and pattern[i] != pattern[k]:
+            k = prefix[k - 1]
+        if pattern[i] == pattern[k]:
+            k += 1
+        prefix[i] = k
+    return prefix[-1]
+
+
+def dedupe_rolling_cues(cues, max_overlap=MAX_OVERLAP):
+    """Yield cues with text already shown by the previous cues removed
+
+    Cues that only repeat earlier text are dropped entirely.
+    """
+    tail = deque(maxlen=max_overlap)
+    for cue in cues:
+        words = cue.text.split()
+        if not words:
+            continue
+        skip = _overlap(words[:max_overlap], list(tail)) if tail else 0
+        new_words = words[skip:]
+        if not new_words:
+            continue
+        tail.extend(new_words)
+        yield Cue(cue.start, cue.end, ' '.join(new_words))
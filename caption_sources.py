@@ -0,0 +1,431 @@
+"""Pluggable caption sources with ordered fallback or racing.
+
+A caption source turns a video into cues. Two ship here:
+
+* TranscriptApiSource asks youtube-transcript-api for the transcript;
+  it needs nothing but the video ID.
+* YtDlpSource picks a track from the yt-dlp extract_info result and
+  downloads it through a caller-supplied function.
+
+CaptionSourceChain runs a list of sources either in order, falling back on
+failure (mode "fallback"), or all at once, taking the first good result
+(mode "race"). Every source gets its own timeout budget. The yt-dlp info is
+fetched once per video alongside the sources, because it also supplies the
+title, duration and uploader whichever source wins.
+
+Each source's attempts, outcomes and latency (an exponentially weighted
+average) are recorded. With adaptive ordering, once every source has enough
+samples the fallback order follows success rate per second of latency.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import metrics
+from cues import CueList
+from text_cleaning import collapse_whitespace
+from upstream import UpstreamError
+
+logger = logging.getLogger(__name__)
+
+LANGUAGES = ['en', 'en-US', 'en-GB']
+LANGUAGE_RE = re.compile(r'^[A-Za-z]{2,3}(?:-[A-Za-z0-9]{1,8})*$')
+MAX_LANGUAGES = 10
+MAX_TRACKS = 20
+PREFERRED_EXTS = ['json3', 'vtt', 'ttml', 'srv3', 'srv2', 'srv1']
+FALLBACK = 'fallback'
+RACE = 'race'
+# Samples each source needs before adaptive ordering trusts its numbers
+MIN_SAMPLES = 5
+EWMA_WEIGHT = 0.2
+
+
+def parse_languages(value):
+    """Normalize a language preference list from a request, or None for the default
+
+    Accepts a list or a comma-separated string of codes such as "de" or "pt-BR".
+    Raises ValueError for anything that is not a language code.
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, (list, tuple)):
+        raise ValueError('languages must be a list of language codes')
+    languages = []
+    for code in value:
+        code = str(code).strip()
+        if not LANGUAGE_RE.match(code):
+            raise ValueError(f"Invalid language code: {code[:20]}")
+        if code not in languages:
+            languages.append(code)
+    if len(languages) > MAX_LANGUAGES:
+        raise ValueError(f"At most {MAX_LANGUAGES} languages may be requested")
+    return languages or None
+
+
+def best_format(formats):
+    """The preferred caption format of one track (json3 or vtt first)"""
+    ranks = {ext: rank for rank, ext in enumerate(PREFERRED_EXTS)}
+    return min(formats, key=lambda fmt: ranks.get(fmt.get('ext'), len(ranks)))
+
+
+def _find_language(tracks, language):
+    """Track key for a language: an exact match, else the same base language (de for de-DE)"""
+    if tracks.get(language):
+        return language
+    base = language.split('-')[0].lower()
+    return next((code for code, formats in tracks.items() if formats and code.split('-')[0].lower() == base), None)
+
+
+def select_caption_track(info, languages=LANGUAGES, fallback_any=True):
+    """Pick (format entry, language, caption type) from an extract_info result, or None
+
+    Manual subtitles in a preferred language win over automatic captions.
+    With fallback_any, a video without any preferred language gets its first
+    track in any language instead of None.
+    """
+    subtitles = info.get('subtitles') or {}
+    automatic_captions = info.get('automatic_captions') or {}
+
+    for tracks, caption_type in ((subtitles, 'Manual'), (automatic_captions, 'Automatic')):
+        for language in languages:
+            code = _find_language(tracks, language)
+            if code:
+                return best_format(tracks[code]), code, caption_type
+    if fallback_any:
+        for tracks, caption_type in ((subtitles, 'Manual'), (automatic_captions, 'Automatic')):
+            for code, formats in tracks.items():
+                if formats:
+                    return best_format(formats), code, caption_type
+    return None
+
+
+def select_caption_tracks(info, languages=None, limit=MAX_TRACKS):
+    """Every track to fetch in all-tracks mode, as (format entry, language, caption type)
+
+    With languages, one track per language (manual before automatic). Without,
+    every manual track; automatic captions come in dozens of machine
+    translations, so only the default pick is used when there are no manual
+    tracks.
+    """
+    if languages:
+        tracks = []
+        for language in languages:
+            track = select_caption_track(info, [language], fallback_any=False)
+            if track and all(track[1:] != other[1:] for other in tracks):
+                tracks.append(track)
+    else:
+        tracks = [(best_format(formats), code, 'Manual')
+                  for code, formats in (info.get('subtitles') or {}).items() if formats]
+        if not tracks:
+            track = select_caption_track(info)
+            tracks = [track] if track else []
+    return tracks[:limit]
+
+
+class CaptionRequest:
+    """What each source sees: video ID, requested languages, extract_info future, finished flag
+
+    languages is None when the caller asked for the default preferences.
+    """
+
+    def __init__(self, video_id, info_future, languages=None):
+        self.video_id = video_id
+        self.languages = languages
+        self._info_future = info_future
+        self._finished = threading.Event()
+
+    def info(self, timeout=None):
+        return self._info_future.result(timeout)
+
+    def finish(self):
+        self._finished.set()
+
+    def finished(self):
+        """True once another source has won or the caller stopped waiting"""
+        return self._finished.is_set()
+
+
+class TranscriptApiSource:
+    """Transcript from youtube-transcript-api, manual tracks before generated ones"""
+
+    name = 'transcript_api'
+
+    def __init__(self, languages=LANGUAGES, timeout=10.0, call=None):
+        self.languages = list(languages)
+        self.timeout = timeout
+        self.call = call
+
+    def _fetch(self, video_id, languages):
+        from youtube_transcript_api import NoTranscriptFound, TranscriptsDisabled, YouTubeTranscriptApi
+
+        try:
+            transcripts = YouTubeTranscriptApi.list_transcripts(video_id)
+            try:
+                transcript = transcripts.find_manually_created_transcript(languages)
+            except NoTranscriptFound:
+                transcript = transcripts.find_generated_transcript(languages)
+            entries = transcript.fetch()
+        except (TranscriptsDisabled, NoTranscriptFound):
+            return None
+
+        cues = CueList()
+        for entry in entries:
+            start = entry.get('start')
+            duration = entry.get('duration')
+            end = start + duration if start is not None and duration is not None else None
+            cues.append(start, end, collapse_whitespace(entry.get('text') or ''))
+        return {
+            'cues': cues,
+            'language': transcript.language_code,
+            'type': 'Automatic' if transcript.is_generated else 'Manual',
+            'format': 'transcript_api',
+        }
+
+    def fetch(self, request):
+        languages = request.languages or self.languages
+        if self.call:
+            return self.call(self._fetch, request.video_id, languages)
+        return self._fetch(request.video_id, languages)
+
+
+class YtDlpSource:
+    """Caption track chosen from the yt-dlp info and fetched with download(url, ext, rolling)"""
+
+    name = 'yt_dlp'
+
+    def __init__(self, download, languages=LANGUAGES, timeout=30.0):
+        self.download = download
+        self.languages = list(languages)
+        self.timeout = timeout
+
+    def fetch(self, request):
+        # An explicit preference list must not silently fall back to another language
+        track = select_caption_track(request.info(), request.languages or self.languages,
+                                     fallback_any=request.languages is None)
+        if not track or request.finished():
+            # A losing racer skips the download rather than spend an upstream request
+            return None
+        best_format, language, caption_type = track
+        ext = best_format.get('ext', '')
+        cues = self.download(best_format['url'], ext, caption_type == 'Automatic')
+        return {'cues': cues, 'language': language, 'type': caption_type, 'format': ext}
+
+
+class SourceStats:
+    """Attempt outcomes and smoothed latency for one source"""
+
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.empty = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.latency = None
+
+    def record(self, outcome, elapsed):
+        self.attempts += 1
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        if outcome != 'timeouts':
+            self.latency = elapsed if self.latency is None else (
+                EWMA_WEIGHT * elapsed + (1 - EWMA_WEIGHT) * self.latency)
+
+    def score(self):
+        """Successes per second of latency; higher sorts earlier"""
+        if self.attempts < MIN_SAMPLES or self.latency is None:
+            return None
+        return (self.successes / self.attempts) / max(self.latency, 0.05)
+
+    def as_dict(self):
+        return {
+            'attempts': self.attempts,
+            'successes': self.successes,
+            'empty': self.empty,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'success_rate': round(self.successes / self.attempts, 4) if self.attempts else 0.0,
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+        }
+
+
+class CaptionSourceChain:
+    """Run caption sources in fallback or race mode and record how each performs"""
+
+    def __init__(self, sources, mode=FALLBACK, adaptive=True, max_workers=8):
+        if mode not in (FALLBACK, RACE):
+            raise ValueError(f"Unknown caption source mode: {mode}")
+        self.sources = list(sources)
+        self.mode = mode
+        self.adaptive = adaptive
+        self.max_workers = max_workers
+        self._stats = {source.name: SourceStats() for source in self.sources}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _executor(self):
+        # Created lazily so that the pool's threads belong to the forked worker
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='source')
+            return self._pool
+
+    def _record(self, source, outcome, elapsed):
+        with self._lock:
+            self._stats[source.name].record(outcome, elapsed)
+
+    def ordered(self):
+        """Sources in configured order, or by score once every source has enough samples"""
+        if not self.adaptive:
+            return list(self.sources)
+        with self._lock:
+            scores = {name: stats.score() for name, stats in self._stats.items()}
+        if any(score is None for score in scores.values()):
+            return list(self.sources)
+        return sorted(self.sources, key=lambda source: -scores[source.name])
+
+    def _run(self, source, request):
+        """Call one source, returning (result, error) and recording the outcome
+
+        A source that answers after its budget is recorded as a timeout, once,
+        when its thread finally returns; the caller has moved on by then.
+        """
+        start = time.perf_counter()
+        try:
+            result = source.fetch(request)
+            error = None
+        except Exception as e:
+            result, error = None, e
+        return self.record_attempt(source, result, error, time.perf_counter() - start)
+
+    def record_attempt(self, source, result, error, elapsed):
+        """Record how one attempt went; returns (captions tagged with the source or None, error)
+
+        Public so that callers running sources some other way (the ASGI
+        server awaits them) still feed the stats and adaptive ordering.
+        """
+        good = bool(result and result.get('cues') is not None and len(result['cues']))
+        if elapsed >= source.timeout:
+            outcome = 'timeouts'
+        elif error is not None:
+            outcome = 'errors'
+            logger.error(f"Caption source {source.name} failed: {str(error)}")
+        else:
+            outcome = 'successes' if good else 'empty'
+        self._record(source, outcome, elapsed)
+        metrics.inc('yt_caption_source_total', source=source.name, outcome=outcome)
+        metrics.record_span('caption_source', elapsed, source=source.name)
+        return (dict(result, source=source.name) if good else None), error
+
+    def fetch(self, video_id, load_info, languages=None):
+        """Return (captions, info_future) for a video in the preferred languages
+
+        captions is a dict with cues, language, type, format and source, or
+        None when no source found captions. load_info() returns the yt-dlp
+        info; it runs once, concurrently with the sources. If every source
+        failed and at least one hit an upstream limit, that UpstreamError is
+        raised so the caller can answer 429/503.
+        """
+        executor = self._executor()
+        # propagate() carries the request's trace into the pool threads
+        info_future = executor.submit(metrics.propagate(load_info))
+        request = CaptionRequest(video_id, info_future, languages)
+        sources = self.ordered()
+        try:
+            if self.mode == RACE:
+                result, errors = self._race(sources, request, executor)
+            else:
+                result, errors = self._fallback(sources, request, executor)
+        finally:
+            request.finish()
+        if result is None:
+            upstream_errors = [e for e in errors if isinstance(e, UpstreamError)]
+            if upstream_errors:
+                raise upstream_errors[-1]
+        return result, info_future
+
+    def _timed_out(self, source):
+        logger.warning(f"Caption source {source.name} gave no answer within {source.timeout}s")
+
+    def _fallback(self, sources, request, executor):
+        errors = []
+        for source in sources:
+            future = executor.submit(metrics.propagate(self._run), source, request)
+            try:
+                result, error = future.result(timeout=source.timeout)
+            except FutureTimeout:
+                # The thread cannot be interrupted; its late result is discarded
+                self._timed_out(source)
+                continue
+            if result:
+                return result, errors
+            if error:
+                errors.append(error)
+        return None, errors
+
+    def _race(self, sources, request, executor):
+        started = time.perf_counter()
+        pending = {executor.submit(metrics.propagate(self._run), source, request): source for source in sources}
+        errors = []
+        while pending:
+            now = time.perf_counter()
+            budget = min(started + source.timeout for source in pending.values()) - now
+            done, _ = wait(pending, timeout=max(budget, 0), return_when=FIRST_COMPLETED)
+            if not done:
+                # The tightest budget ran out; give up on every source past its deadline
+                for future, source in list(pending.items()):
+                    if started + source.timeout <= time.perf_counter():
+                        del pending[future]
+                        self._timed_out(source)
+                continue
+            for future in done:
+                source = pending.pop(future)
+                result, error = future.result()
+                if result:
+                    return result, errors
+                if error:
+                    errors.append(error)
+        return None, errors
+
+    def stats(self):
+        with self._lock:
+            sources = {name: stats.as_dict() for name, stats in self._stats.items()}
+        return {
+            'mode': self.mode,
+            'order': [source.name for source in self.ordered()],
+            'sources': sources,
+        }
+
+
+def build_caption_sources(download, upstream, default_order=(YtDlpSource.name, TranscriptApiSource.name),
+                          default_mode=FALLBACK):
+    """Create a CaptionSourceChain configured from CAPTION_SOURCE* environment variables
+
+    CAPTION_SOURCES lists source names in order, CAPTION_SOURCE_MODE is
+    "fallback" or "race" and CAPTION_SOURCE_TIMEOUT_<NAME> sets a source's
+    budget in seconds. download(url, ext, rolling) fetches a yt-dlp track.
+    """
+    factories = {
+        TranscriptApiSource.name: lambda: TranscriptApiSource(call=upstream.call),
+        YtDlpSource.name: lambda: YtDlpSource(download),
+    }
+    names = [n.strip() for n in os.environ.get('CAPTION_SOURCES', ','.join(default_order)).split(',') if n.strip()]
+    sources = []
+    for name in names:
+        if name not in factories:
+            raise ValueError(f"Unknown caption source: {name}")
+        source = factories[name]()
+        timeout = os.environ.get(f"CAPTION_SOURCE_TIMEOUT_{name.upper()}")
+        if timeout:
+            source.timeout = float(timeout)
+        sources.append(source)
+    return CaptionSourceChain(
+        sources,
+        mode=os.environ.get('CAPTION_SOURCE_MODE', default_mode),
+        adaptive=os.environ.get('CAPTION_SOURCE_ADAPTIVE', '1') != '0',
+        max_workers=int(os.environ.get('CAPTION_SOURCE_WORKERS', 8)),
+    )
@@ -0,0 +1,257 @@
+"""Incremental caption parsers that turn a byte stream into cues.
+
+Each parser accepts an iterable of chunks (bytes or str) and yields Cue
+objects as soon as they are complete, so a multi-hour caption file never has
+to be held in memory as one document or copied through several full-string
+passes. Feed them from iter_chunks(response) for a live download, or from
+[content] for a string that is already in memory.
+"""
+import codecs
+import json
+import re
+import xml.etree.ElementTree as ET
+
+from cues import Cue
+from text_cleaning import clean_cue_text, collapse_whitespace
+
+CHUNK_SIZE = 64 * 1024
+
+# Formats with a streaming parser; anything else needs the whole document
+STREAMING_FORMATS = {'vtt', 'json3', 'ttml', 'srv3', 'srv2', 'srv1'}
+
+VTT_TIMING_RE = re.compile(
+    r'((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})'
+)
+
+# Elements that carry one cue in each XML flavour (TTML/srv3 <p>, srv1/srv2 <text>)
+XML_CUE_TAGS = {'p', 'text'}
+
+
+def iter_chunks(response, chunk_size=CHUNK_SIZE):
+    """Yield a file-like response body in fixed-size chunks"""
+    while True:
+        chunk = response.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _iter_text(chunks):
+    """Decode byte chunks to text without splitting multi-byte characters"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    for chunk in chunks:
+        text = decoder.decode(chunk) if isinstance(chunk, (bytes, bytearray)) else chunk
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def _iter_lines(chunks):
+    pending = ''
+    for text in _iter_text(chunks):
+        lines = (pending + text).split('\n')
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def parse_clock(value):
+    """Parse HH:MM:SS.mmm / MM:SS.mmm into seconds"""
+    seconds = 0.0
+    for part in value.replace(',', '.').split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def iter_vtt_cues(chunks):
+    """Yield cues from a WebVTT stream
+
+    Only lines that follow a timing line are cue text; headers, NOTE and
+    STYLE blocks and cue identifiers are skipped. Only a truly empty line
+    ends a cue: YouTube's automatic captions put a line of one space inside
+    their cues.
+    """
+    start = end = None
+    text_lines = []
+    for raw in _iter_lines(chunks):
+        if not raw.rstrip('\r\n'):
+            if text_lines:
+                yield Cue(start, end, ' '.join(text_lines))
+                text_lines = []
+            start = end = None
+            continue
+        line = raw.strip()
+        if not line:
+            continue
+
+        if '-->' in line:
+            match = VTT_TIMING_RE.search(line)
+            if match:
+                if text_lines:
+                    yield Cue(start, end, ' '.join(text_lines))
+                    text_lines = []
+                start, end = parse_clock(match.group(1)), parse_clock(match.group(2))
+            continue
+
+        if start is None:
+            continue
+
+        clean_line = clean_cue_text(line)
+        if clean_line:
+            text_lines.append(clean_line)
+
+    if text_lines:
+        yield Cue(start, end, ' '.join(text_lines))
+
+
+def _json3_cue(event):
+    text = ''.join(seg.get('utf8', '') for seg in event.get('segs') or [])
+    text = collapse_whitespace(text)
+    if not text:
+        return None
+    start = event.get('tStartMs')
+    duration = event.get('dDurationMs')
+    start = start / 1000 if start is not None else None
+    end = start + duration / 1000 if start is not None and duration is not None else None
+    return Cue(start, end, text)
+
+
+def iter_json3_cues(chunks):
+    """Yield cues from a YouTube json3 stream, decoding one event at a time"""
+    decoder = json.JSONDecoder()
+    texts = _iter_text(chunks)
+    buf = ''
+
+    # Skip the XSSI prefix and header fields up to the start of the events array
+    while True:
+        idx = buf.find('"events"')
+        if idx != -1:
+            bracket = buf.find('[', idx)
+            if bracket != -1:
+                buf = buf[bracket + 1:]
+                break
+            buf = buf[idx:]
+        else:
+            buf = buf[-8:]
+        text = next(texts, None)
+        if text is None:
+            return
+        buf += text
+
+    pos = 0
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(buf):
+            text = next(texts, None)
+            if text is None:
+                return
+            buf, pos = text, 0
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            event, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # The event is split across chunks; read more and retry
+            text = next(texts, None)
+            if text is None:
+                raise
+            buf, pos = buf[pos:] + text, 0
+            continue
+        cue = _json3_cue(event)
+        if cue:
+            yield cue
+        if pos > CHUNK_SIZE:
+            buf, pos = buf[pos:], 0
+
+
+def _xml_time(attrib, tag):
+    """Read cue start/end seconds from TTML, srv3/srv2 or srv1 attributes"""
+    try:
+        if 'begin' in attrib:
+            start = _ttml_clock(attrib['begin'])
+            if 'end' in attrib:
+                return start, _ttml_clock(attrib['end'])
+            if 'dur' in attrib:
+                return start, start + _ttml_clock(attrib['dur'])
+            return start, None
+        if 't' in attrib:
+            start = int(attrib['t']) / 1000
+            return start, start + int(attrib['d']) / 1000 if 'd' in attrib else None
+        if tag == 'text' and 'start' in attrib:
+            start = float(attrib['start'])
+            return start, start + float(attrib['dur']) if 'dur' in attrib else None
+    except ValueError:
+        pass
+    return None, None
+
+
+def _ttml_clock(value):
+    value = value.strip()
+    if value.endswith('ms'):
+        return float(value[:-2]) / 1000
+    if value.endswith('s'):
+        return float(value[:-1])
+    return parse_clock(value)
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _element_text(elem):
+    """Collect an element's text, turning <br/> into a space"""
+    parts = [elem.text or '']
+    for child in elem:
+        if _local_name(child.tag) == 'br':
+            parts.append(' ')
+        else:
+            parts.append(_element_text(child))
+        parts.append(child.tail or '')
+    return ''.join(parts)
+
+
+def _xml_cues(parser, stack):
+    for event, elem in parser.read_events():
+        if event == 'start':
+            stack.append(elem)
+            continue
+        stack.pop()
+        tag = _local_name(elem.tag)
+        if tag in XML_CUE_TAGS:
+            # The XML parser decodes one level of entities; srv1 escapes its
+            # <font> markup once more, and clean_cue_text strips it after
+            # decoding that second level
+            text = clean_cue_text(_element_text(elem))
+            if text:
+                start, end = _xml_time(elem.attrib, tag)
+                yield Cue(start, end, text)
+            # Detach finished cues so the tree never grows with the document
+            if stack:
+                stack[-1].remove(elem)
+
+
+def iter_xml_cues(chunks):
+    """Yield cues from a TTML or srv1/srv2/srv3 stream"""
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    stack = []
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from _xml_cues(parser, stack)
+    parser.close()
+    yield from _xml_cues(parser, stack)
+
+
+def iter_caption_cues(chunks, format_type):
+    """Dispatch to the streaming parser for a caption format"""
+    if format_type == 'vtt':
+        return iter_vtt_cues(chunks)
+    if format_type == 'json3':
+        return iter_json3_cues(chunks)
+    if format_type in ('ttml', 'srv3', 'srv2', 'srv1'):
+        return iter_xml_cues(chunks)
+    raise ValueError(f"No streaming parser for caption format: {format_type}")
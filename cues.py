@@ -0,0 +1,144 @@
+"""Caption cue objects shared by the parsers and exporters.
+
+Parsers yield individual Cue objects; whole transcripts are kept in a
+CueList, which stores timings in parallel float arrays and all cue texts in
+one joined string, so tens of thousands of auto-caption cues cost a few
+bytes of overhead each instead of a Python object apiece.
+"""
+from array import array
+
+NAN = float('nan')
+
+
+class Cue:
+    """One caption cue: start/end in seconds (None when unknown) and its text"""
+
+    __slots__ = ('start', 'end', 'text')
+
+    def __init__(self, start, end, text):
+        self.start = start
+        self.end = end
+        self.text = text
+
+    def __repr__(self):
+        return f"Cue({self.start!r}, {self.end!r}, {self.text!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Cue):
+            return NotImplemented
+        return (self.start, self.end, self.text) == (other.start, other.end, other.text)
+
+
+def _time(value):
+    return None if value != value else value
+
+
+class CueList:
+    """Compact list of cues: start/end arrays plus one space-joined text buffer
+
+    The joined buffer doubles as the plain transcript, so text() costs
+    nothing once built. Cue i occupies text[offsets[i]:offsets[i + 1] - 1].
+    """
+
+    __slots__ = ('starts', 'ends', '_offsets', '_pieces', '_text')
+
+    def __init__(self, cues=()):
+        self.starts = array('d')
+        self.ends = array('d')
+        self._offsets = array('Q', [0])
+        self._pieces = []
+        self._text = ''
+        self.extend(cues)
+
+    @classmethod
+    def from_text(cls, text):
+        """Wrap untimed text (e.g. from the fallback cleaner) as a single cue"""
+        return cls([Cue(None, None, text)])
+
+    def append(self, start, end, text):
+        if not text:
+            return
+        if self._pieces is None:
+            self._pieces = [self._text] if self._text else []
+        self.starts.append(NAN if start is None else start)
+        self.ends.append(NAN if end is None else end)
+        self._offsets.append(self._offsets[-1] + len(text) + 1)
+        self._pieces.append(text)
+
+    def extend(self, cues):
+        for cue in cues:
+            self.append(cue.start, cue.end, cue.text)
+
+    def text(self):
+        """Return the transcript: every cue text joined by single spaces"""
+        if self._pieces is not None:
+            self._text = ' '.join(self._pieces)
+            self._pieces = None
+        return self._text
+
+    def __getstate__(self):
+        # Pickled (e.g. back from an extraction process) as three arrays and one string
+        return self.starts, self.ends, self._offsets, self.text()
+
+    def __setstate__(self, state):
+        self.starts, self.ends, self._offsets, self._text = state
+        self._pieces = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('cue index out of range')
+        text = self.text()
+        return Cue(
+            _time(self.starts[index]),
+            _time(self.ends[index]),
+            text[self._offsets[index]:self._offsets[index + 1] - 1],
+        )
+
+    def __iter__(self):
+        text = self.text()
+        offsets = self._offsets
+        for i in range(len(self.starts)):
+            yield Cue(_time(self.starts[i]), _time(self.ends[i]), text[offsets[i]:offsets[i + 1] - 1])
+
+    def timed(self):
+        """Whether any cue carries timing information"""
+        return any(start == start for start in self.starts)
+
+    def to_json(self):
+        """Serialize as parallel start/end/text arrays"""
+        return {
+            'start': [_time(v) for v in self.starts],
+            'end': [_time(v) for v in self.ends],
+            'text': [cue.text for cue in self],
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        cue_list = cls()
+        for start, end, text in zip(data.get('start', []), data.get('end', []), data.get('text', [])):
+            cue_list.append(start, end, text)
+        return cue_list
+
+    @classmethod
+    def coerce(cls, value):
+        """Return value as a CueList whether it is one already or its JSON form"""
+        if value is None or isinstance(value, cls):
+            return value
+        return cls.from_json(value)
+
+
+def join_cue_text(cues):
+    """Join cue texts into a single transcript string"""
+    return ' '.join(cue.text for cue in cues if cue.text)
+
+
+def json_default(obj):
+    """json.dumps hook that serializes CueList values"""
+    if isinstance(obj, CueList):
+        return obj.to_json()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,178 @@
+"""Word (.docx) export: a direct WordprocessingML writer with python-docx as fallback.
+
+python-docx builds an object per paragraph and serializes the whole tree at
+the end, which costs seconds of CPU on a multi-hour transcript. The fast
+writer instead copies a precomputed template package (transcript_template.docx,
+produced by python-docx with the same layout: Title heading, metadata block,
+"Captions" heading) and streams the caption paragraphs as XML text straight
+into the deflated word/document.xml entry, so the only per-export work is
+escaping and compressing the transcript itself.
+
+Regenerate the template after changing the python-docx layout:
+
+    python docx_export.py
+"""
+import io
+import logging
+import os
+import re
+import threading
+import zipfile
+from xml.sax.saxutils import escape
+
+import metrics
+from text_cleaning import iter_paragraphs
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'transcript_template.docx')
+DOCUMENT_PART = 'word/document.xml'
+DEFAULT_TITLE = 'YouTube Captions'
+
+# Tokens the template carries where the metadata and caption paragraphs go
+PLACEHOLDERS = {
+    'title': '__TITLE__',
+    'uploader': '__UPLOADER__',
+    'duration': '__DURATION__',
+    'language': '__LANGUAGE__',
+    'caption_type': '__CAPTION_TYPE__',
+}
+CAPTIONS_PLACEHOLDER = '__CAPTIONS__'
+
+PARAGRAPH_XML = '<w:p><w:r><w:t>%s</w:t></w:r></w:p>'
+# Characters XML 1.0 cannot carry; python-docx rejects them outright
+INVALID_XML_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+PARAGRAPH_BATCH = 256
+
+WRITER = os.environ.get('DOCX_WRITER', 'fast')
+
+
+def _xml_text(value):
+    return escape(INVALID_XML_RE.sub('', str(value)))
+
+
+def build_docx_python(transcription, meta):
+    """Build the Word export with python-docx (the reference layout)"""
+    from docx import Document
+    from docx.shared import Pt
+
+    title = meta.get('title') or DEFAULT_TITLE
+    document = Document()
+    heading = document.add_heading(title, level=0)
+    heading.style.font.size = Pt(18)
+
+    meta_para = document.add_paragraph()
+    meta_para.add_run(f"Uploader: {meta.get('uploader', '')}\n").bold = True
+    meta_para.add_run(f"Duration: {meta.get('duration', '')}\n").bold = True
+    meta_para.add_run(f"Language: {meta.get('language', '')} | Type: {meta.get('caption_type', '')}\n").bold = True
+
+    document.add_paragraph("")
+    document.add_heading('Captions', level=1)
+
+    # Write transcription in paragraphs, splitting on sentence-ish breaks
+    for chunk in metrics.timed_iter(iter_paragraphs(transcription), 'paragraph_split'):
+        document.add_paragraph(INVALID_XML_RE.sub('', chunk))
+
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+class DocxTemplate:
+    """A template package split around the caption placeholder paragraph
+
+    Every part except word/document.xml is deflated once, at load time, into
+    a prebuilt zip; each export appends only its own document part to a copy.
+    """
+
+    def __init__(self, package, head, tail):
+        self.package = package
+        self.head = head
+        self.tail = tail
+
+    @classmethod
+    def load(cls, path=TEMPLATE_PATH):
+        buffer = io.BytesIO()
+        document = None
+        with zipfile.ZipFile(path) as source, zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as package:
+            for info in source.infolist():
+                if info.filename == DOCUMENT_PART:
+                    document = source.read(info).decode('utf-8')
+                else:
+                    package.writestr(info, source.read(info))
+        if document is None:
+            raise ValueError(f"{path} has no {DOCUMENT_PART}")
+
+        marker = document.index(f'>{CAPTIONS_PLACEHOLDER}<')
+        start = document.rindex('<w:p>', 0, marker)
+        end = document.index('</w:p>', marker) + len('</w:p>')
+        return cls(buffer.getvalue(), document[:start], document[end:])
+
+    def render(self, transcription, meta):
+        """Return the .docx bytes for a transcript"""
+        head = self.head
+        for field, token in PLACEHOLDERS.items():
+            value = meta.get(field) or (DEFAULT_TITLE if field == 'title' else '')
+            head = head.replace(token, _xml_text(value))
+
+        buffer = io.BytesIO(self.package)
+        buffer.seek(0, io.SEEK_END)
+        with zipfile.ZipFile(buffer, 'a', zipfile.ZIP_DEFLATED) as package:
+            with package.open(DOCUMENT_PART, 'w') as part:
+                part.write(head.encode('utf-8'))
+                batch = []
+                for paragraph in metrics.timed_iter(iter_paragraphs(transcription), 'paragraph_split'):
+                    batch.append(PARAGRAPH_XML % _xml_text(paragraph))
+                    if len(batch) >= PARAGRAPH_BATCH:
+                        part.write(''.join(batch).encode('utf-8'))
+                        batch = []
+                part.write((''.join(batch) + self.tail).encode('utf-8'))
+        return buffer.getvalue()
+
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def get_template():
+    """Load the template package once per process"""
+    global _template
+    with _template_lock:
+        if _template is None:
+            _template = DocxTemplate.load()
+        return _template
+
+
+def build_docx_fast(transcription, meta):
+    return get_template().render(transcription, meta)
+
+
+def build_docx(transcription, meta):
+    """Build the Word export, falling back to python-docx if the fast writer fails
+
+    Set DOCX_WRITER=python-docx to always use the fallback.
+    """
+    with metrics.span('export', format='docx'):
+        if WRITER != 'python-docx':
+            try:
+                body = build_docx_fast(transcription, meta)
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+                logger.error(f"Fast DOCX writer failed, falling back to python-docx: {str(e)}")
+            else:
+                metrics.inc('yt_export_bytes_total', len(body), format='docx')
+                return body
+        body = build_docx_python(transcription, meta)
+        metrics.inc('yt_export_bytes_total', len(body), format='docx')
+        return body
+
+
+def write_template(path=TEMPLATE_PATH):
+    """Regenerate the template from the python-docx layout"""
+    meta = {field: token for field, token in PLACEHOLDERS.items()}
+    with open(path, 'wb') as fh:
+        fh.write(build_docx_python(CAPTIONS_PLACEHOLDER, meta))
+
+
+if __name__ == '__main__':
+    write_template()
+    print(f"wrote {TEMPLATE_PATH}")
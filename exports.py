@@ -0,0 +1,129 @@
+"""Streaming exporters for JSON, plain text, SRT and WebVTT downloads.
+
+Each exporter is a generator of utf-8 chunks of roughly CHUNK_SIZE bytes
+built from the transcript text or a cue iterator, so Flask can send it as a
+chunked response: the first bytes leave before the rest of a multi-hour
+transcript has been formatted, and no full copy of the output is held in
+memory. The Netlify functions, which cannot stream, join the same chunks.
+"""
+import json
+
+import metrics
+from text_cleaning import iter_paragraphs, slugify
+
+CHUNK_SIZE = 64 * 1024
+
+STREAM_CONTENT_TYPES = {
+    'json': 'application/json',
+    'txt': 'text/plain; charset=utf-8',
+    'srt': 'application/x-subrip; charset=utf-8',
+    'vtt': 'text/vtt; charset=utf-8',
+}
+
+# Formats that need cue timing rather than just the transcript text
+TIMED_FORMATS = ('srt', 'vtt')
+
+
+def export_filename(title, fmt):
+    """Download filename for an export, e.g. my_video.srt"""
+    return f"{slugify(title or 'youtube_captions')}.{fmt}"
+
+
+def content_disposition(title, fmt):
+    # slugify keeps only [a-z0-9_-], so the name never needs quoting
+    return f"attachment; filename={export_filename(title, fmt)}"
+
+
+def _encoded(pieces, chunk_size=CHUNK_SIZE):
+    """Coalesce small string pieces into utf-8 chunks of about chunk_size"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def _json_pieces(transcription, meta, chunk_size):
+    yield '{\n  "transcription": "'
+    # JSON string escaping is per character, so slices can be escaped separately
+    for start in range(0, len(transcription), chunk_size):
+        yield json.dumps(transcription[start:start + chunk_size], ensure_ascii=False)[1:-1]
+    yield '",\n  "metadata": '
+    yield json.dumps(meta, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+    yield '\n}'
+
+
+def _txt_pieces(transcription):
+    first = True
+    for paragraph in metrics.timed_iter(iter_paragraphs(transcription), 'paragraph_split'):
+        if not first:
+            yield '\n\n'
+        yield paragraph
+        first = False
+    yield '\n'
+
+
+def format_timestamp(seconds, separator):
+    """Format seconds as HH:MM:SS<separator>mmm (',' for SRT, '.' for WebVTT)"""
+    millis = int(round(max(seconds, 0) * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def _timed_cues(cues):
+    """Yield (start, end, text), filling gaps in timing from the neighbouring cue"""
+    previous_end = 0.0
+    for cue in cues:
+        start = previous_end if cue.start is None else cue.start
+        end = start if cue.end is None else max(cue.end, start)
+        previous_end = end
+        yield start, end, cue.text
+
+
+def _srt_pieces(cues):
+    for index, (start, end, text) in enumerate(_timed_cues(cues), 1):
+        yield f"{index}\n{format_timestamp(start, ',')} --> {format_timestamp(end, ',')}\n{text}\n\n"
+
+
+def _vtt_pieces(cues):
+    yield 'WEBVTT\n\n'
+    for start, end, text in _timed_cues(cues):
+        yield f"{format_timestamp(start, '.')} --> {format_timestamp(end, '.')}\n{text}\n\n"
+
+
+def iter_export(fmt, transcription, meta, cues=None, chunk_size=CHUNK_SIZE):
+    """Return a generator of utf-8 chunks for a streaming export format
+
+    cues is a CueList; SRT and WebVTT need one with timing and raise
+    ValueError otherwise. The check runs before the first chunk so callers
+    can still turn it into an error response.
+    """
+    if fmt == 'json':
+        return _metered(_encoded(_json_pieces(transcription, meta, chunk_size), chunk_size), fmt)
+    if fmt == 'txt':
+        return _metered(_encoded(_txt_pieces(transcription), chunk_size), fmt)
+    if fmt in TIMED_FORMATS:
+        if cues is None or not cues.timed():
+            raise ValueError('This transcript has no caption timing to export')
+        pieces = _srt_pieces(cues) if fmt == 'srt' else _vtt_pieces(cues)
+        return _metered(_encoded(pieces, chunk_size), fmt)
+    raise ValueError(f"Unsupported export format: {fmt}")
+
+
+def _metered(chunks, fmt):
+    """Record the time spent building chunks (not sending them) and the bytes produced"""
+    size = 0
+    try:
+        for chunk in metrics.timed_iter(chunks, 'export', format=fmt):
+            size += len(chunk)
+            yield chunk
+    finally:
+        metrics.inc('yt_export_bytes_total', size, format=fmt)
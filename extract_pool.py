@@ -0,0 +1,380 @@
+"""Supervised worker processes for yt-dlp extraction and caption downloads.
+
+yt-dlp runs arbitrary extractor code against pages it does not control. A
+hung extractor holds a web thread until the worker is killed, and a huge
+caption document bloats the web process for the rest of its life. With the
+pool enabled, those calls run in a small set of child processes instead,
+and the web process only waits on a pipe:
+
+* every task has a wall-clock limit; a process that runs past it is killed
+  and the caller gets ExtractionTimeout (504);
+* the child's resident memory is checked while a task runs; a process over
+  max_rss_mb is killed and the caller gets ExtractionKilled (502), as it
+  does when the process dies of anything else;
+* a process is replaced after max_tasks tasks, or when a task leaves it
+  over the memory limit;
+* a request that finds every process busy for `wait` seconds gets
+  ExtractionBusy (503) rather than queueing without bound.
+
+The errors are UpstreamErrors, so every route answers them the way it
+answers YouTube refusing a request. Tasks are named 'module:function' and
+looked up in the child, which runs the same code with the pool disabled.
+Processes are forked from a forkserver that has already imported the
+preload modules (yt-dlp included), so a replacement is ready in
+milliseconds; they are started on first use or by start().
+
+Each child publishes its own metrics (see metrics.py) after every task, and
+the spans it records are added to the caller's trace.
+"""
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+import metrics
+from upstream import UpstreamError
+
+logger = logging.getLogger(__name__)
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, OSError, ValueError):
+    PAGE_SIZE = 4096
+
+# Set in the child processes, where tasks run directly
+_in_worker = False
+
+
+class ExtractionTimeout(UpstreamError):
+    """The task ran past its wall-clock limit and its process was killed"""
+
+    status_code = 504
+
+
+class ExtractionKilled(UpstreamError):
+    """The task's process went over its memory limit or died"""
+
+    status_code = 502
+
+
+class ExtractionBusy(UpstreamError):
+    """Every extraction process stayed busy for longer than the pool's wait"""
+
+    status_code = 503
+
+
+class WorkerError(Exception):
+    """An exception raised by a task that could not be sent back as it was"""
+
+
+def rss_bytes(pid):
+    """Resident memory of a process, or None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/statm") as fh:
+            return int(fh.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _resolve(target):
+    module, _, name = target.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+def _portable(error):
+    """The exception to send back: UpstreamErrors and builtins as they are, others as WorkerError
+
+    Exceptions from yt-dlp carry tracebacks and would need yt-dlp imported in
+    the web process to unpickle.
+    """
+    if isinstance(error, UpstreamError) or type(error).__module__ == 'builtins':
+        return error
+    return WorkerError(str(error))
+
+
+def _worker_main(conn, preload):
+    """Child process loop: run (target, args, kwargs, trace) tasks until told to stop"""
+    global _in_worker
+    _in_worker = True
+    # Ctrl-C and gunicorn's shutdown signals are for the parent, which stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Already loaded when the forkserver could import them; otherwise loaded
+    # now rather than during the first task
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logger.error(f"Extraction process could not preload {module}: {str(e)}")
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        target, args, kwargs, trace = task
+        with metrics.collect_spans(trace) as spans:
+            try:
+                reply = (True, _resolve(target)(*args, **kwargs))
+            except Exception as e:
+                reply = (False, _portable(e))
+        metrics.REGISTRY.flush()
+        rss = rss_bytes(os.getpid())
+        try:
+            conn.send(reply + (spans, rss))
+        except Exception as e:
+            # The result could not be pickled
+            conn.send((False, WorkerError(f"Unsendable result from {target}: {str(e)}"), spans, rss))
+
+
+class _Worker:
+    """One child process and the parent's end of its pipe"""
+
+    def __init__(self, context, index, preload):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, preload), name=f"extract-{index}",
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+    def stop(self):
+        """Ask the process to exit after its current task; it is reaped later"""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.conn.close()
+
+
+class ExtractionPool:
+    """Bounded set of extraction processes shared by a web worker's threads"""
+
+    def __init__(self, processes=2, timeout=60.0, max_rss_mb=512, max_tasks=50, wait=30.0, preload=(),
+                 poll_interval=0.1):
+        self.processes = processes
+        self.timeout = timeout
+        self.max_rss = max_rss_mb * 1024 * 1024 if max_rss_mb else 0
+        self.max_tasks = max_tasks
+        self.wait = wait
+        self.preload = list(preload)
+        self.poll_interval = poll_interval
+        self._context = None
+        self._idle = []
+        self._busy = 0
+        self._retired = []
+        self._started = 0
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+        self._busy_seconds = 0.0
+        self._since = time.monotonic()
+        self._stats = {
+            'tasks': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'memory_kills': 0,
+            'crashes': 0,
+            'recycled': 0,
+            'rejected': 0,
+        }
+
+    @classmethod
+    def from_env(cls, preload=()):
+        """Create a pool configured from EXTRACT_* environment variables; 0 processes disables it"""
+        return cls(
+            processes=int(os.environ.get('EXTRACT_PROCESSES', 0)),
+            timeout=float(os.environ.get('EXTRACT_TIMEOUT', 60)),
+            max_rss_mb=int(os.environ.get('EXTRACT_MAX_RSS_MB', 512)),
+            max_tasks=int(os.environ.get('EXTRACT_MAX_TASKS', 50)),
+            wait=float(os.environ.get('EXTRACT_WAIT', 30)),
+            preload=preload,
+        )
+
+    @property
+    def enabled(self):
+        """Whether calls go to child processes; never inside one of them"""
+        return self.processes > 0 and not _in_worker
+
+    def _get_context(self):
+        # Called with the lock held
+        if self._context is None:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                self._context = multiprocessing.get_context('forkserver')
+                # Imported once in the server, then shared by every forked process
+                self._context.set_forkserver_preload(self.preload)
+            else:
+                self._context = multiprocessing.get_context('spawn')
+        return self._context
+
+    def _check_fork(self):
+        # Processes started before a fork belong to the parent
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._busy = 0
+            self._retired = []
+
+    def _reap(self):
+        # Called with the lock held
+        self._retired = [worker for worker in self._retired if not self._joined(worker)]
+
+    @staticmethod
+    def _joined(worker):
+        worker.process.join(0)
+        return worker.process.exitcode is not None
+
+    def _spawn(self):
+        with self._cond:
+            context = self._get_context()
+            self._started += 1
+            index = self._started
+        return _Worker(context, index, self.preload)
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.wait
+        with self._cond:
+            self._check_fork()
+            self._reap()
+            while True:
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.process.is_alive():
+                        self._busy += 1
+                        return worker
+                    self._stats['crashes'] += 1
+                    metrics.inc('yt_extract_pool_kills_total', reason='crash')
+                if self._busy < self.processes:
+                    self._busy += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['rejected'] += 1
+                    metrics.inc('yt_extract_pool_tasks_total', outcome='rejected')
+                    raise ExtractionBusy(f"All {self.processes} extraction processes are busy", retry_after=self.wait)
+                self._cond.wait(remaining)
+        try:
+            return self._spawn()
+        except Exception:
+            with self._cond:
+                self._busy -= 1
+                self._cond.notify()
+            raise
+
+    def _checkin(self, worker, keep):
+        with self._cond:
+            if os.getpid() != self._pid:
+                return
+            self._busy -= 1
+            if keep and (not self.max_tasks or worker.tasks < self.max_tasks):
+                self._idle.append(worker)
+            elif worker.process.is_alive():
+                # Worn out, over the memory limit after its task, or its reply was unreadable
+                self._stats['recycled'] += 1
+                metrics.inc('yt_extract_pool_recycled_total')
+                worker.stop()
+                self._retired.append(worker)
+            self._cond.notify()
+
+    def _kill(self, worker, reason):
+        logger.error(f"Killing extraction process {worker.process.pid}: {reason}")
+        with self._cond:
+            self._stats[{'timeout': 'timeouts', 'memory': 'memory_kills', 'crash': 'crashes'}[reason]] += 1
+        metrics.inc('yt_extract_pool_kills_total', reason=reason)
+        worker.kill()
+
+    def _wait_reply(self, worker, timeout):
+        """Return the child's reply; kills the process and raises if it overruns or dies"""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._kill(worker, 'timeout')
+                raise ExtractionTimeout(f"Extraction took longer than {timeout:g}s and was stopped")
+            try:
+                if worker.conn.poll(min(self.poll_interval, remaining)):
+                    return worker.conn.recv()
+            except (EOFError, OSError):
+                self._kill(worker, 'crash')
+                raise ExtractionKilled(f"Extraction process exited unexpectedly (code {worker.process.exitcode})")
+            rss = rss_bytes(worker.process.pid)
+            if self.max_rss and rss and rss > self.max_rss:
+                self._kill(worker, 'memory')
+                raise ExtractionKilled(f"Extraction used {rss // (1024 * 1024)} MB, over the "
+                                       f"{self.max_rss // (1024 * 1024)} MB limit, and was stopped")
+
+    def run(self, target, *args, timeout=None, **kwargs):
+        """Call target ('module:function') with args in an extraction process and return its result
+
+        Exceptions raised by the task are re-raised here. The pool itself
+        raises ExtractionTimeout, ExtractionKilled or ExtractionBusy.
+        """
+        with metrics.span('extract_queue'):
+            worker = self._checkout()
+        started = time.monotonic()
+        keep = False
+        try:
+            try:
+                worker.conn.send((target, args, kwargs, metrics.current_trace() is not None))
+            except OSError:
+                self._kill(worker, 'crash')
+                raise ExtractionKilled('Extraction process exited unexpectedly')
+            ok, value, spans, rss = self._wait_reply(worker, timeout or self.timeout)
+            worker.tasks += 1
+            # Memory a task leaves behind is not given back; start afresh instead
+            keep = not (self.max_rss and rss and rss > self.max_rss)
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._busy_seconds += elapsed
+                self._stats['tasks'] += 1
+            metrics.inc('yt_extract_pool_busy_seconds_total', elapsed)
+            self._checkin(worker, keep)
+        metrics.add_spans(spans)
+        metrics.inc('yt_extract_pool_tasks_total', outcome='ok' if ok else 'error')
+        if not ok:
+            with self._cond:
+                self._stats['errors'] += 1
+            raise value
+        return value
+
+    def start(self):
+        """Start every process now instead of on first use"""
+        if not self.enabled:
+            return
+        with self._cond:
+            self._check_fork()
+            missing = self.processes - self._busy - len(self._idle)
+        for _ in range(max(missing, 0)):
+            worker = self._spawn()
+            with self._cond:
+                self._idle.append(worker)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            busy_seconds = self._busy_seconds
+            if self.processes:
+                # Share of the pool's capacity spent on tasks since it was created
+                capacity = (time.monotonic() - self._since) * self.processes
+                stats['utilization'] = round(busy_seconds / capacity, 4) if capacity else 0.0
+            stats.update(enabled=self.enabled, processes=self.processes, busy=self._busy, idle=len(self._idle),
+                         started=self._started, busy_seconds=round(busy_seconds, 3))
+            pids = [worker.process.pid for worker in self._idle]
+        rss = [rss_bytes(pid) for pid in pids]
+        stats['idle_rss_mb'] = [round(value / (1024 * 1024), 1) for value in rss if value]
+        return stats
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+            worker.process.join(1)
@@ -0,0 +1,175 @@
+"""The yt-dlp work that can run in an extraction process (see extract_pool.py).
+
+Extraction processes are forked from a forkserver that has imported this
+module, so it holds only what the tasks need: the pooled YoutubeDL
+instances, the upstream scheduler and the caption download and parsing
+code. The caches, stores, caption source chain and Flask app stay in
+app.py, which calls these functions directly when the pool is off and
+names them as tasks ('extract_tasks:track_cues') when it is on.
+"""
+import itertools
+import logging
+import os
+import time
+import xml.etree.ElementTree as ET
+
+import metrics
+from caption_dedup import dedupe_rolling_cues
+from caption_stream import (STREAMING_FORMATS, iter_caption_cues, iter_chunks,
+                            iter_json3_cues, iter_vtt_cues, iter_xml_cues)
+from cues import CueList
+from text_cleaning import clean_caption_text
+from upstream import UpstreamScheduler
+from ydl_pool import YoutubeDLPool
+
+logger = logging.getLogger(__name__)
+
+# Counters and stage histograms shared by every worker and extraction process on the host (see metrics.py)
+metrics.REGISTRY.share(os.environ.get('METRICS_PATH', metrics.DEFAULT_PATH),
+                       flush_interval=float(os.environ.get('METRICS_FLUSH_INTERVAL', 5)))
+
+YDL_OPTS = {
+    'writesubtitles': True,
+    'writeautomaticsub': True,
+    'subtitleslangs': ['en', 'en-US', 'en-GB'],  # Prefer English
+    'skip_download': True,
+    'quiet': True,
+    'no_warnings': True,
+}
+# Warm YoutubeDL instances reused across requests (see ydl_pool.py); created by app.warm_up()
+ydl_pool = YoutubeDLPool.from_env(YDL_OPTS)
+# Host-wide rate limit, backoff and circuit breaker for YouTube (see upstream.py)
+upstream = UpstreamScheduler.from_env()
+# The parts of an extract_info result the app reads; the rest stays in the extraction process
+INFO_FIELDS = ('title', 'duration', 'uploader', 'subtitles', 'automatic_captions')
+# Cues per batch parsed off a caption download, and per /transcribe/stream event
+CUE_BATCH = 200
+
+
+def extract_info(url):
+    """One rate-limited yt-dlp extraction on a pooled instance"""
+    with ydl_pool.acquire() as ydl, metrics.span('extract_info'):
+        return upstream.call(ydl.extract_info, url, download=False)
+
+
+def extract_video_info(url):
+    """extract_info trimmed to INFO_FIELDS, so little has to be sent back from an extraction process"""
+    info = extract_info(url)
+    return {key: info[key] for key in INFO_FIELDS if key in info}
+
+
+def track_cues(caption_url, caption_ext, rolling):
+    """Download and parse a caption track on a pooled session, held until the body is read"""
+    with ydl_pool.acquire() as ydl:
+        return upstream.call(download_caption_cues, ydl, caption_url, caption_ext, rolling=rolling)
+
+
+def download_caption_cues(ydl, caption_url, format_type, rolling=False):
+    """Download a caption track and parse it into a CueList
+
+    rolling marks automatic captions, whose VTT cues repeat the previous
+    line and are deduplicated on the way through.
+    """
+    if format_type in STREAMING_FORMATS:
+        try:
+            cues = CueList()
+            for batch in iter_cue_batches(ydl.urlopen(caption_url), format_type, rolling):
+                cues.extend(batch)
+            return cues
+        except (ET.ParseError, ValueError) as e:
+            # Malformed documents get the forgiving whole-document parsers instead
+            logger.error(f"Streaming caption parse failed, re-reading whole file: {str(e)}")
+    return read_caption_cues(ydl, caption_url, format_type, rolling)
+
+
+def iter_cue_batches(response, format_type, rolling=False, batch_size=CUE_BATCH):
+    """Yield lists of cues from a caption download as the streaming parser completes them
+
+    Closes the response when done. Raises ET.ParseError or ValueError for a
+    malformed document, possibly after some batches have been yielded.
+    """
+    started = time.perf_counter()
+    # Time the consumer holds a batch (sending it to a client) is not parsing
+    held = 0.0
+    response = metrics.MeteredReader(response)
+    try:
+        cues = iter_caption_cues(iter_chunks(response), format_type)
+        if rolling and format_type == 'vtt':
+            cues = dedupe_rolling_cues(cues)
+        for batch in batched(cues, batch_size):
+            yielded = time.perf_counter()
+            yield batch
+            held += time.perf_counter() - yielded
+    finally:
+        response.close()
+        # Download and parse interleave: time blocked in read() is the fetch,
+        # the rest of the loop is parsing
+        metrics.inc('yt_caption_bytes_total', response.bytes)
+        metrics.record_span('caption_fetch', response.seconds, format=format_type)
+        metrics.record_span('parse', time.perf_counter() - started - response.seconds - held, format=format_type)
+
+
+def read_caption_cues(ydl, caption_url, format_type, rolling=False):
+    """Download a whole caption document and parse it with parse_caption_cues"""
+    with metrics.span('caption_fetch', format=format_type):
+        caption_bytes = ydl.urlopen(caption_url).read()
+    metrics.inc('yt_caption_bytes_total', len(caption_bytes))
+    with metrics.span('parse', format=format_type):
+        caption_content = caption_bytes.decode('utf-8', errors='ignore')
+        cues = parse_caption_cues(caption_content, format_type)
+        return CueList(dedupe_rolling_cues(cues)) if rolling and format_type == 'vtt' else cues
+
+
+def batched(iterable, size):
+    """Yield lists of up to size items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_caption_content(content, format_type):
+    """Parse caption content based on format type"""
+    return parse_caption_cues(content, format_type).text()
+
+
+def parse_caption_cues(content, format_type):
+    """Parse caption content into timed cues based on format type"""
+    try:
+        if format_type == 'vtt':
+            return parse_vtt_content(content)
+        elif format_type == 'json3':
+            return parse_json3_content(content)
+        elif format_type in ['ttml', 'srv3', 'srv2', 'srv1']:
+            return parse_xml_content(content)
+        else:
+            # Fallback: try to extract text from any format
+            return CueList.from_text(clean_caption_text(content))
+    except Exception as e:
+        logger.error(f"Error parsing caption content: {str(e)}")
+        return CueList.from_text(clean_caption_text(content))
+
+
+def parse_vtt_content(vtt_content):
+    """Parse WebVTT format captions"""
+    return CueList(iter_vtt_cues([vtt_content]))
+
+
+def parse_json3_content(json_content):
+    """Parse YouTube json3 automatic caption format"""
+    try:
+        return CueList(iter_json3_cues([json_content]))
+    except ValueError:
+        return CueList.from_text(clean_caption_text(json_content))
+
+
+def parse_xml_content(xml_content):
+    """Parse XML-based caption formats (TTML, SRV, etc.)"""
+    try:
+        return CueList(iter_xml_cues([xml_content]))
+    except ET.ParseError:
+        pass
+    # Malformed XML: strip the markup and keep whatever text is left
+    return CueList.from_text(clean_caption_text(xml_content))
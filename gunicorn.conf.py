@@ -0,0 +1,26 @@
+"""Gunicorn settings; `gunicorn app:app` reads this file from the project root.
+
+With preload_app the master imports the app, and warm_up() loads yt-dlp
+there too, before any worker is forked. Workers then start with every
+module already in memory (shared copy-on-write) instead of each importing
+it again, so a new or recycled worker is ready almost at once. Anything
+that must not cross a fork (YoutubeDL instances, sockets, threads) is
+created per worker: the pool is filled in post_worker_init, and the rest
+is created lazily on first use.
+
+Set GUNICORN_PRELOAD=0 to import the app in each worker instead.
+"""
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+
+def when_ready(server):
+    if preload_app:
+        import app
+        app.warm_up(instances=0)
+
+
+def post_worker_init(worker):
+    import app
+    app.warm_up()
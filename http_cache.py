@@ -0,0 +1,227 @@
+"""HTTP validators, Cache-Control and compression for transcript responses.
+
+Transcript responses and export downloads carry a strong ETag, a SHA-256 of
+what determines the body, so a client or CDN that sends it back in
+If-None-Match gets a 304 without the body (on GET and HEAD; other methods get 412). Bodies are compressed with brotli
+(when the brotli package is installed) or gzip, as Accept-Encoding allows.
+Compressed bytes are stored as artifacts of the transcript's handle (see
+transcript_handles.py), so every later hit for the same content is served
+without compressing again, by any worker on the host.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import sqlite3
+import zlib
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller bodies gain less than the Content-Encoding overhead
+MIN_SIZE = int(os.environ.get('HTTP_COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('HTTP_GZIP_LEVEL', 6))
+# Stored variants are compressed once, so a slower, denser setting pays off
+BROTLI_QUALITY = int(os.environ.get('HTTP_BROTLI_QUALITY', 9))
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+EXPORT_MAX_AGE = int(os.environ.get('HTTP_EXPORT_MAX_AGE', 86400))
+TRANSCRIPT_MAX_AGE = int(os.environ.get('HTTP_TRANSCRIPT_MAX_AGE', 300))
+
+# Cache-Control by method and route. Exports by handle never change (the
+# handle is a content hash); a video's transcript can, when manual captions
+# replace automatic ones, so GET /transcribe is cached only briefly and POST
+# responses are revalidated with their ETag every time.
+CACHE_CONTROL = {
+    'GET /transcribe': f"public, max-age={TRANSCRIPT_MAX_AGE}",
+    'POST /transcribe': 'private, no-cache',
+    'GET /download/<fmt>/<handle>': f"public, max-age={EXPORT_MAX_AGE}, immutable",
+    'POST /download/<fmt>': 'private, no-cache',
+    'POST /download/docx': 'private, no-cache',
+    'GET /search': 'public, max-age=60',
+    'GET /': 'no-cache',
+}
+# Errors, job status, stats and metrics must never be reused
+NO_STORE = 'no-store'
+
+
+def cache_control(method, rule, status):
+    """Cache-Control for a response to method on the given route"""
+    if status not in (200, 304):
+        return NO_STORE
+    # A HEAD answers with the headers of the GET it stands for
+    if method == 'HEAD':
+        method = 'GET'
+    return CACHE_CONTROL.get(f"{method} {rule}", NO_STORE)
+
+
+def etag(*parts):
+    """Strong ETag: a SHA-256 over the parts (str or bytes)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def export_etag(fmt, handle=None, body=b''):
+    """ETag of an export by handle, which never changes (the handle is a content
+    hash), or of one built from a posted transcript body"""
+    return etag('export', handle, fmt) if handle else etag(fmt, body or b'')
+
+
+def export_validators(fmt, handle=None, body=b''):
+    """ETag and Cache-Control of an export, for servers without route tables"""
+    tag = export_etag(fmt, handle, body)
+    if handle:
+        return {'ETag': tag, 'Cache-Control': cache_control('GET', '/download/<fmt>/<handle>', 200)}
+    return {'ETag': tag, 'Cache-Control': cache_control('POST', '/download/<fmt>', 200)}
+
+
+def encoded_etag(tag, encoding):
+    """The ETag of one encoding of a body, e.g. "abc...-gzip" """
+    return f'{tag[:-1]}-{encoding}"' if encoding else tag
+
+
+def etag_matches(if_none_match, tag):
+    """True if an If-None-Match header names tag, in any content encoding"""
+    if not if_none_match:
+        return False
+    base = tag.strip('"')
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        # If-None-Match uses the weak comparison
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate.strip('"').split('-', 1)[0] == base:
+            return True
+    return False
+
+
+def precondition_status(method, if_none_match, tag):
+    """The status If-None-Match calls for: 304 for GET and HEAD, 412 for any
+    other method (RFC 9110 13.1.2), or None when it does not name tag"""
+    if not etag_matches(if_none_match, tag):
+        return None
+    return 304 if method in ('GET', 'HEAD') else 412
+
+
+def negotiate(accept_encoding):
+    """The best encoding Accept-Encoding allows ('br' or 'gzip'), or None"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        weight = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+    for encoding in ENCODINGS:
+        if weights.get(encoding, weights.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    with metrics.span('compress'):
+        if encoding == 'br':
+            return brotli.compress(body, quality=BROTLI_QUALITY)
+        # mtime=0 keeps the output, and so its ETag, the same on every build
+        return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+def iter_compress(chunks, encoding):
+    """Compress a stream of byte chunks as they are produced"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            out = compressor.process(chunk)
+            if out:
+                yield out
+        yield compressor.finish()
+        return
+    # wbits=31 writes the gzip header and trailer
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def variant_name(name, tag, encoding):
+    """Artifact name of a stored compressed body, tied to the ETag it encodes"""
+    digest = tag.strip('"')[:16]
+    return f"{name}.{digest}.{encoding}"
+
+
+def choose_encoding(size, accept_encoding):
+    """The encoding for a body of size bytes, or None to send it as it is"""
+    return negotiate(accept_encoding) if size >= MIN_SIZE else None
+
+
+def stored_variant(store, handle, name, tag, encoding):
+    """Return a compressed body stored for handle, or None"""
+    try:
+        body = store.get_artifact(handle, variant_name(name, tag, encoding))
+    except sqlite3.Error as e:
+        logger.error(f"Compressed variant read failed: {str(e)}")
+        return None
+    metrics.inc('yt_cache_requests_total', cache='compressed', result='hit' if body is not None else 'miss')
+    return body
+
+
+def store_variant(store, handle, name, tag, encoding, body):
+    """Compress body and store it for handle; return the compressed bytes"""
+    compressed = compress(body, encoding)
+    if store is not None and handle:
+        store.put_artifact(handle, variant_name(name, tag, encoding), compressed)
+    return compressed
+
+
+def encode(body, tag, encoding, store=None, handle=None, name=None):
+    """Return body in encoding (None = as it is)
+
+    With a handle store, the compressed bytes are kept as an artifact of
+    handle and reused for later requests with the same ETag.
+    """
+    if encoding is None:
+        return body
+    if store is not None and handle:
+        stored = stored_variant(store, handle, name, tag, encoding)
+        if stored is not None:
+            return stored
+    return store_variant(store, handle, name, tag, encoding, body)
+
+
+def validator_headers(tag, encoding=None, vary=True):
+    """ETag and Vary for one encoding of a body; a 304 sends just these
+
+    vary is False for bodies that are never compressed, such as DOCX.
+    """
+    headers = {'ETag': encoded_etag(tag, encoding)}
+    if vary:
+        headers['Vary'] = 'Accept-Encoding'
+    return headers
+
+
+def representation_headers(tag, encoding=None, vary=True):
+    """validator_headers plus the Content-Encoding of the body"""
+    headers = validator_headers(tag, encoding, vary)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return headers
@@ -0,0 +1,168 @@
+"""Asynchronous extraction jobs with pluggable local state stores.
+
+POST /jobs hands the extraction to a JobQueue thread pool and returns a job
+ID immediately, so a web worker is not tied up for the whole YouTube round
+trip. Job state lives in a JobStore: MemoryJobStore for a single process or
+tests, SQLiteJobStore when several gunicorn workers must see each other's
+jobs (a poll may land on a different worker than the submit).
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cues import json_default
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class MemoryJobStore:
+    """Job state kept in a dict; visible only to the current process"""
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id, url):
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            self._jobs[job_id] = {
+                'id': job_id,
+                'url': url,
+                'status': PENDING,
+                'result': None,
+                'error': None,
+                'created_at': now,
+                'updated_at': now,
+            }
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields, updated_at=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _purge(self, now):
+        if not self.ttl:
+            return
+        for job_id in [j for j, job in self._jobs.items() if now - job['updated_at'] > self.ttl]:
+            del self._jobs[job_id]
+
+
+class SQLiteJobStore:
+    """Job state kept in a SQLite file shared by all workers on the host"""
+
+    def __init__(self, path=None, ttl=3600):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'yt_jobs.sqlite3')
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY,'
+                ' url TEXT NOT NULL,'
+                ' status TEXT NOT NULL,'
+                ' result TEXT,'
+                ' error TEXT,'
+                ' created_at REAL NOT NULL,'
+                ' updated_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def create(self, job_id, url):
+        now = time.time()
+        with self._connect() as conn:
+            if self.ttl:
+                conn.execute('DELETE FROM jobs WHERE updated_at < ?', (now - self.ttl,))
+            conn.execute(
+                'INSERT INTO jobs (id, url, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (job_id, url, PENDING, now, now)
+            )
+
+    def update(self, job_id, **fields):
+        if 'result' in fields:
+            fields['result'] = json.dumps(fields['result'], ensure_ascii=False, default=json_default)
+        fields['updated_at'] = time.time()
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job['result'] is not None:
+            job['result'] = json.loads(job['result'])
+        return job
+
+
+def store_from_env():
+    """Pick the job store named by JOB_STORE ('memory' or 'sqlite')"""
+    ttl = int(os.environ.get('JOB_TTL', 3600))
+    if os.environ.get('JOB_STORE', 'sqlite') == 'memory':
+        return MemoryJobStore(ttl=ttl)
+    return SQLiteJobStore(os.environ.get('JOB_STORE_PATH'), ttl=ttl)
+
+
+class JobQueue:
+    """Run extraction jobs on a bounded thread pool and record their state"""
+
+    def __init__(self, extract, store, max_workers=4):
+        self.extract = extract
+        self.store = store
+        self.max_workers = max_workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self):
+        # Created lazily so that the pool's threads belong to the forked worker
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+            return self._pool
+
+    def submit(self, url):
+        """Queue an extraction and return its job ID"""
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id, url)
+        self._executor().submit(self._run, job_id, url)
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def _run(self, job_id, url):
+        self.store.update(job_id, status=RUNNING)
+        try:
+            result = self.extract(url)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            self.store.update(job_id, status=FAILED, error=f'Caption extraction failed: {str(e)}')
+            return
+        if result is None:
+            self.store.update(job_id, status=FAILED, error='No closed captions found for this video.')
+        else:
+            self.store.update(job_id, status=DONE, result=result)
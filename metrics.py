@@ -0,0 +1,351 @@
+"""Stage timings, counters and Prometheus text exposition.
+
+Code marks the stages of a request with span() (or record_span() when the
+time is measured some other way), and counts events such as cache hits,
+upstream errors and bytes fetched with inc(). Spans land in one histogram,
+yt_stage_duration_seconds, labelled by stage.
+
+Every process keeps its own registry. Under gunicorn each worker would
+report only its own numbers, so once share() is called the registry is
+periodically copied into a SQLite file as one snapshot per process, and
+render() sums the snapshots of every worker on the host. Counters from
+workers that have exited stay in the total, the way Prometheus expects.
+
+With tracing on, a request's spans are also collected, from whichever thread
+runs them, and logged as one JSON line when the request ends.
+"""
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger('trace')
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'yt_metrics.sqlite3')
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Snapshots from processes that have been silent this long are dropped
+SNAPSHOT_TTL = 86400
+
+DEFINITIONS = {
+    'yt_stage_duration_seconds': ('histogram', 'Time spent in each stage of extraction and export'),
+    'yt_stage_errors_total': ('counter', 'Stages that ended with an exception'),
+    'yt_http_request_duration_seconds': ('histogram', 'HTTP request time, including streamed bodies'),
+    'yt_http_requests_total': ('counter', 'HTTP requests by endpoint and status'),
+    'yt_cache_requests_total': ('counter', 'Transcript and compressed-response cache lookups by result'),
+    'yt_upstream_calls_total': ('counter', 'Calls made through the upstream scheduler'),
+    'yt_upstream_errors_total': ('counter', 'Rate-limited, transient and rejected upstream calls'),
+    'yt_caption_bytes_total': ('counter', 'Caption bytes downloaded from YouTube'),
+    'yt_caption_source_total': ('counter', 'Caption source attempts by outcome'),
+    'yt_export_bytes_total': ('counter', 'Export bytes produced by format'),
+    'yt_extract_pool_tasks_total': ('counter', 'Extraction pool tasks by outcome'),
+    'yt_extract_pool_kills_total': ('counter', 'Extraction processes killed, by reason'),
+    'yt_extract_pool_recycled_total': ('counter', 'Extraction processes replaced after max tasks or memory growth'),
+    'yt_extract_pool_busy_seconds_total': ('counter', 'Time extraction processes spent on tasks'),
+}
+
+_trace = contextvars.ContextVar('trace', default=None)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Counters and fixed-bucket histograms for one process"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._token = uuid.uuid4().hex
+        self.path = ''
+        self.flush_interval = 5.0
+        self._dirty = False
+        self._flusher = None
+
+    def _check_fork(self):
+        # A forked worker starts from zero under its own snapshot row
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._token = uuid.uuid4().hex
+            self._counters = {}
+            self._histograms = {}
+            self._flusher = None
+
+    def inc(self, name, amount=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._check_fork()
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._touch()
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._check_fork()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+            self._touch()
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), list(values)] for (name, labels), values in self._histograms.items()],
+            }
+
+    # Sharing between workers
+
+    def share(self, path=DEFAULT_PATH, flush_interval=5.0):
+        """Publish this process's snapshot to a SQLite file read by render()"""
+        self.path = path
+        self.flush_interval = flush_interval
+        if not path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS snapshots ('
+                    ' token TEXT PRIMARY KEY,'
+                    ' pid INTEGER NOT NULL,'
+                    ' updated_at REAL NOT NULL,'
+                    ' snapshot TEXT NOT NULL)'
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Metrics will be per-process; cannot use {path}: {str(e)}")
+            self.path = ''
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _touch(self):
+        # Called with the lock held
+        self._dirty = True
+        if self.path and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while pid == self._pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write this process's snapshot if anything changed since the last write"""
+        if not self.path or not self._dirty:
+            return
+        self._dirty = False
+        snapshot = self.snapshot()
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO snapshots (token, pid, updated_at, snapshot) VALUES (?, ?, ?, ?)',
+                             (self._token, self._pid, now, json.dumps(snapshot)))
+                conn.execute('DELETE FROM snapshots WHERE updated_at < ?', (now - SNAPSHOT_TTL,))
+        except sqlite3.Error as e:
+            self._dirty = True
+            logger.error(f"Error writing metrics snapshot: {str(e)}")
+
+    def _snapshots(self):
+        if not self.path:
+            return [self.snapshot()]
+        self.flush()
+        try:
+            with self._connect() as conn:
+                rows = conn.execute('SELECT token, snapshot FROM snapshots').fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading metrics snapshots: {str(e)}")
+            return [self.snapshot()]
+        snapshots = [json.loads(snapshot) for token, snapshot in rows if token != self._token]
+        # This process's own numbers come from memory, not from its last flush
+        return snapshots + [self.snapshot()]
+
+    def render(self):
+        """Prometheus text exposition of every worker's counters and histograms"""
+        counters = {}
+        histograms = {}
+        for snapshot in self._snapshots():
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                merged = histograms.get(key)
+                histograms[key] = values if merged is None else [a + b for a, b in zip(merged, values)]
+
+        series = {}
+        for (name, labels), value in counters.items():
+            series.setdefault(name, []).append([f"{name}{_format_labels(labels)} {_format_value(value)}"])
+        for (name, labels), values in histograms.items():
+            lines = []
+            for bound, count in zip(self.buckets, values):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', repr(bound))])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(values[-2])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+            series.setdefault(name, []).append(lines)
+
+        out = []
+        for name in sorted(series):
+            kind, help_text = DEFINITIONS.get(name, ('untyped', name))
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            for lines in sorted(series[name]):
+                out.extend(lines)
+        return '\n'.join(out) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def inc(name, amount=1, **labels):
+    REGISTRY.inc(name, amount, **labels)
+
+
+def record_span(stage, seconds, error=False, **labels):
+    """Record a stage measured elsewhere, in the histogram and the current trace"""
+    REGISTRY.observe('yt_stage_duration_seconds', seconds, stage=stage, **labels)
+    if error:
+        REGISTRY.inc('yt_stage_errors_total', stage=stage, **labels)
+    trace = _trace.get()
+    if trace is not None:
+        entry = {'stage': stage, 'ms': round(seconds * 1000, 3)}
+        entry.update(labels)
+        if error:
+            entry['error'] = True
+        trace['spans'].append(entry)
+
+
+@contextmanager
+def span(stage, **labels):
+    """Time the with block as one stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        record_span(stage, time.perf_counter() - start, error=True, **labels)
+        raise
+    record_span(stage, time.perf_counter() - start, **labels)
+
+
+def timed_iter(iterable, stage, **labels):
+    """Yield from iterable, recording only the time spent producing items as one span
+
+    Suits generators interleaved with other work, such as paragraph splitting
+    inside a DOCX build, where a with block would time the consumer too.
+    """
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                return
+            elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        record_span(stage, elapsed, **labels)
+
+
+class MeteredReader:
+    """File-like wrapper that adds up the bytes read and the time spent waiting on read()"""
+
+    def __init__(self, response):
+        self._response = response
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def read(self, amt=None):
+        start = time.perf_counter()
+        data = self._response.read() if amt is None else self._response.read(amt)
+        self.seconds += time.perf_counter() - start
+        self.bytes += len(data)
+        return data
+
+    def close(self):
+        self._response.close()
+
+
+def start_trace(**fields):
+    """Begin collecting spans for the current request; returns a token for end_trace"""
+    return _trace.set({'id': uuid.uuid4().hex[:16], 'start': time.perf_counter(), 'spans': [], **fields})
+
+
+def current_trace():
+    return _trace.get()
+
+
+def end_trace(token, **fields):
+    """Log the current trace as one JSON line and stop collecting"""
+    trace = _trace.get()
+    _trace.reset(token)
+    if trace is None:
+        return
+    trace.update(fields)
+    trace['ms'] = round((time.perf_counter() - trace.pop('start')) * 1000, 3)
+    trace_logger.info(json.dumps(trace, default=str))
+
+
+def add_spans(spans):
+    """Append spans recorded elsewhere (e.g. in an extraction process) to the current trace"""
+    trace = _trace.get()
+    if trace is not None and spans:
+        trace['spans'].extend(spans)
+
+
+@contextmanager
+def collect_spans(enabled=True):
+    """Collect the spans of the with block into the yielded list, without logging a trace"""
+    spans = []
+    if not enabled:
+        yield spans
+        return
+    token = _trace.set({'spans': spans})
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+
+def propagate(fn):
+    """Wrap fn to run in a copy of the caller's context, so spans reach the caller's trace"""
+    context = contextvars.copy_context()
+    # A Context can only be entered by one thread at a time, so each call runs in its own copy
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
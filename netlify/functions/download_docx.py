@@ -1,52 +1,47 @@
 import json
-import io
 import base64
+import logging
+import os
+import sys
 
-def response_bytes(data: bytes, filename: str, mimetype: str):
+# Shared modules live at the repository root (see included_files in netlify.toml)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import http_cache
+from docx_export import build_docx
+from exports import content_disposition
+
+logger = logging.getLogger(__name__)
+
+def response_bytes(data: bytes, disposition: str, mimetype: str, validators: dict):
     return {
         "statusCode": 200,
         "headers": {
             "Content-Type": mimetype,
-            "Content-Disposition": f"attachment; filename={filename}"
+            "Content-Disposition": disposition,
+            **validators
         },
         "isBase64Encoded": True,
         "body": base64.b64encode(data).decode('ascii')
     }
 
-def split_into_paragraphs(text: str):
-    import re
-    parts = re.split(r"\n\n+|(?<=[.!?])\s+(?=[A-Z])", text or '')
-    return [p.strip() for p in parts if p.strip()]
+def export_meta(data):
+    return {
+        'title': data.get('title',''),
+        'duration': data.get('duration',''),
+        'uploader': data.get('uploader',''),
+        'language': data.get('language',''),
+        'caption_type': data.get('caption_type',''),
+    }
 
 def handler(event, context):
     try:
-        from docx import Document
-        from docx.shared import Pt
+        validators = http_cache.export_validators('docx', body=event.get('body'))
+        # Exports are POSTed, and RFC 9110 allows a 304 only for GET and HEAD
+        if http_cache.precondition_status(event.get('httpMethod'), (event.get('headers') or {}).get('if-none-match'), validators['ETag']):
+            return {"statusCode": 412, "headers": {"Content-Type":"application/json"}, "body": json.dumps({"error":"If-None-Match matches the current response"})}
         data = json.loads(event.get('body') or '{}')
-        transcription = data.get('transcription','')
-        title = data.get('title','YouTube Captions')
-        duration = data.get('duration','')
-        uploader = data.get('uploader','')
-        language = data.get('language','')
-        caption_type = data.get('caption_type','')
-
-        doc = Document()
-        h = doc.add_heading(title, level=0)
-        h.style.font.size = Pt(18)
-        meta = doc.add_paragraph()
-        meta.add_run(f"Uploader: {uploader}\n").bold = True
-        meta.add_run(f"Duration: {duration}\n").bold = True
-        meta.add_run(f"Language: {language} | Type: {caption_type}\n").bold = True
-        doc.add_paragraph("")
-        doc.add_heading('Captions', level=1)
-        for p in split_into_paragraphs(transcription):
-            doc.add_paragraph(p)
-        buf = io.BytesIO()
-        doc.save(buf)
-        buf.seek(0)
-        safe = ''.join(c if c.isalnum() or c=='_' else '_' for c in (title or 'youtube_captions').lower())
-        return response_bytes(buf.getvalue(), f"{safe}.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+        content = build_docx(data.get('transcription',''), export_meta(data))
+        return response_bytes(content, content_disposition(data.get('title'), 'docx'), "application/vnd.openxmlformats-officedocument.wordprocessingml.document", validators)
     except Exception as e:
+        logger.error(f"Error generating DOCX: {str(e)}")
         return {"statusCode": 500, "headers": {"Content-Type":"application/json"}, "body": json.dumps({"error":"Failed to generate DOCX"})}
-
-
@@ -0,0 +1,45 @@
+import json
+import logging
+import os
+import sys
+
+# Shared modules live at the repository root (see included_files in netlify.toml)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import http_cache
+from exports import STREAM_CONTENT_TYPES, content_disposition, iter_export
+from cues import CueList
+
+logger = logging.getLogger(__name__)
+
+def error(message, status):
+    return {"statusCode": status, "headers": {"Content-Type":"application/json"}, "body": json.dumps({"error": message})}
+
+def handler(event, context):
+    """TXT, SRT and VTT exports of a posted transcript"""
+    params = event.get('queryStringParameters') or {}
+    fmt = params.get('format', '')
+    if fmt not in STREAM_CONTENT_TYPES:
+        return error(f"Unsupported download format: {fmt}", 404)
+    validators = http_cache.export_validators(fmt, body=event.get('body'))
+    # Exports are POSTed, and RFC 9110 allows a 304 only for GET and HEAD
+    if http_cache.precondition_status(event.get('httpMethod'), (event.get('headers') or {}).get('if-none-match'), validators['ETag']):
+        return error("If-None-Match matches the current response", 412)
+    try:
+        data = json.loads(event.get('body') or '{}')
+        meta = {k: data.get(k,'') for k in ('title','duration','uploader','language','caption_type')}
+        try:
+            chunks = iter_export(fmt, data.get('transcription',''), meta, CueList.coerce(data.get('cues')))
+        except ValueError as e:
+            return error(str(e), 400)
+        return {
+            "statusCode": 200,
+            "headers": {
+                "Content-Type": STREAM_CONTENT_TYPES[fmt],
+                "Content-Disposition": content_disposition(data.get('title'), fmt),
+                **validators
+            },
+            "body": b''.join(chunks).decode('utf-8')
+        }
+    except Exception as e:
+        logger.error(f"Error generating {fmt.upper()}: {str(e)}")
+        return error(f"Failed to generate {fmt.upper()}", 500)
@@ -1,35 +1,42 @@
 import json
-import base64
+import logging
+import os
+import sys
 
-def response_bytes(data: bytes, filename: str, mimetype: str):
+# Shared modules live at the repository root (see included_files in netlify.toml)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import http_cache
+from exports import content_disposition, iter_export
+
+logger = logging.getLogger(__name__)
+
+def export_meta(data):
     return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": mimetype,
-            "Content-Disposition": f"attachment; filename={filename}"
-        },
-        "isBase64Encoded": True,
-        "body": base64.b64encode(data).decode('ascii')
+        'title': data.get('title',''),
+        'duration': data.get('duration',''),
+        'uploader': data.get('uploader',''),
+        'language': data.get('language',''),
+        'caption_type': data.get('caption_type',''),
     }
 
 def handler(event, context):
     try:
+        validators = http_cache.export_validators('json', body=event.get('body'))
+        # Exports are POSTed, and RFC 9110 allows a 304 only for GET and HEAD
+        if http_cache.precondition_status(event.get('httpMethod'), (event.get('headers') or {}).get('if-none-match'), validators['ETag']):
+            return {"statusCode": 412, "headers": {"Content-Type":"application/json"}, "body": json.dumps({"error":"If-None-Match matches the current response"})}
         data = json.loads(event.get('body') or '{}')
-        payload = {
-            'transcription': data.get('transcription',''),
-            'metadata': {
-                'title': data.get('title',''),
-                'duration': data.get('duration',''),
-                'uploader': data.get('uploader',''),
-                'language': data.get('language',''),
-                'caption_type': data.get('caption_type',''),
-            }
+        content = b''.join(iter_export('json', data.get('transcription',''), export_meta(data)))
+        # Text bodies go out as-is; base64 would add a third to the response
+        return {
+            "statusCode": 200,
+            "headers": {
+                "Content-Type": "application/json",
+                "Content-Disposition": content_disposition(data.get('title'), 'json'),
+                **validators
+            },
+            "body": content.decode('utf-8')
         }
-        content = json.dumps(payload, ensure_ascii=False, indent=2).encode('utf-8')
-        title = (data.get('title') or 'youtube_captions').lower()
-        safe = ''.join(c if c.isalnum() or c=='_' else '_' for c in title)
-        return response_bytes(content, f"{safe}.json", "application/json")
     except Exception as e:
+        logger.error(f"Error generating JSON: {str(e)}")
         return {"statusCode": 500, "headers": {"Content-Type":"application/json"}, "body": json.dumps({"error":"Failed to generate JSON"})}
-
-
@@ -1,149 +1,173 @@
 import json
+import logging
+import math
 import os
-import re
-import yt_dlp
-from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
-import re as _re
+import sys
+import xml.etree.ElementTree as ET
+
+# Shared modules live at the repository root (see included_files in netlify.toml)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import http_cache
+from transcript_cache import TranscriptCache
+from ydl_pool import YoutubeDLPool
+from upstream import UpstreamError, UpstreamScheduler
+from caption_sources import RACE, TranscriptApiSource, YtDlpSource, build_caption_sources
+from youtube_urls import canonical_url, extract_video_id
+from caption_stream import STREAMING_FORMATS, iter_caption_cues, iter_chunks
+from cues import CueList
+from caption_dedup import dedupe_rolling_cues
+from text_cleaning import clean_caption_text
+
+logger = logging.getLogger(__name__)
+
+transcript_cache = TranscriptCache.from_env()
+
+# Warm containers keep module state, so the pooled YoutubeDL outlives one invocation
+ydl_pool = YoutubeDLPool.from_env({
+    'writesubtitles': True,
+    'writeautomaticsub': True,
+    'subtitleslangs': ['en','en-US','en-GB'],
+    'skip_download': True,
+    'quiet': True,
+    'no_warnings': True,
+})
+
+# Rate limit, backoff and circuit breaker around every call to YouTube
+upstream = UpstreamScheduler.from_env()
 
 def response(body, status=200, headers=None):
-    base = {"Content-Type": "application/json"}
+    base = {"Content-Type": "application/json", "Cache-Control": http_cache.NO_STORE}
     if headers:
         base.update(headers)
     return {"statusCode": status, "headers": base, "body": json.dumps(body)}
 
-def is_valid_youtube_url(url: str) -> bool:
-    return any(d in url for d in ['youtube.com', 'youtu.be', 'www.youtube.com', 'm.youtube.com'])
-
-def parse_vtt(vtt: str) -> str:
-    out = []
-    for line in vtt.split('\n'):
-        line = line.strip()
-        if not line or line.startswith('WEBVTT') or line.startswith('NOTE') or '-->' in line or line.isdigit() or line.startswith('STYLE') or line.startswith('::cue'):
-            continue
-        line = re.sub(r'<[^>]+>', '', line)
-        line = re.sub(r'&[a-zA-Z]+;', ' ', line)
-        if line:
-            out.append(line)
-    return ' '.join(out)
-
-def parse_xml(xml: str) -> str:
-    text = re.sub(r'<[^>]+>', ' ', xml)
-    text = re.sub(r'&[a-zA-Z]+;', ' ', text)
-    return re.sub(r'\s+', ' ', text).strip()
-
-def parse_json3(s: str) -> str:
-    s = s.lstrip().removeprefix(")]}'").lstrip()
-    data = json.loads(s)
-    parts = []
-    for ev in data.get('events', []):
-        for seg in (ev.get('segs') or []):
-            t = seg.get('utf8', '')
-            if t:
-                parts.append(t)
-    joined = ''.join(parts).replace('\n', ' ')
-    return re.sub(r'\s+', ' ', joined).strip()
+def fmt_dur(s):
+    if not s: return "Unknown Duration"
+    h=s//3600; m=(s%3600)//60; sec=s%60
+    return f"{h:02d}:{m:02d}:{sec:02d}" if h>0 else f"{m:02d}:{sec:02d}"
+
+def fetch_info(url):
+    with ydl_pool.acquire() as ydl:
+        return upstream.call(ydl.extract_info, url, download=False)
+
+def download_cues(caption_url, ext, rolling):
+    with ydl_pool.acquire() as ydl:
+        if ext in STREAMING_FORMATS:
+            resp = upstream.call(ydl.urlopen, caption_url)
+            try:
+                cues = iter_caption_cues(iter_chunks(resp), ext)
+                if ext == 'vtt' and rolling:
+                    cues = dedupe_rolling_cues(cues)
+                return CueList(cues)
+            except (ET.ParseError, ValueError) as e:
+                # Malformed documents are read again and cleaned as plain text
+                logger.error(f"Streaming caption parse failed, re-reading whole file: {str(e)}")
+            finally:
+                resp.close()
+        resp = upstream.call(ydl.urlopen, caption_url)
+        try:
+            return CueList.from_text(clean_caption_text(resp.read().decode('utf-8','ignore')))
+        finally:
+            resp.close()
+
+# The transcript API and yt-dlp race each other; the first good transcript wins
+caption_sources = build_caption_sources(download_cues, upstream,
+                                        default_order=(TranscriptApiSource.name, YtDlpSource.name),
+                                        default_mode=RACE)
+
+def transcript_response(result, event, include_cues=False):
+    """Transcript JSON with an ETag; 304 (GET) or 412 (POST) when If-None-Match already names it
+
+    With include_cues, timed cues are added as parallel start/end/text
+    arrays, as the Flask app does, for the SRT and VTT downloads.
+
+    Netlify compresses function responses at its edge, so the body goes out as is.
+    There is no download handle: each function has its own /tmp, so the
+    download functions could never find a handle stored here.
+    """
+    payload = {
+        'transcription': result['text'],
+        'title': result['title'],
+        'duration': result['duration'],
+        'uploader': result['uploader'],
+        'language': result['language'],
+        'caption_type': result['type'],
+        'success': True
+    }
+    if include_cues:
+        cues = CueList.coerce(result.get('cues'))
+        payload['cues'] = cues.to_json() if cues is not None else None
+    body = json.dumps(payload)
+    tag = http_cache.etag(body)
+    headers = {
+        "Content-Type": "application/json",
+        "ETag": tag,
+        "Cache-Control": http_cache.cache_control(event.get('httpMethod') or 'POST', '/transcribe', 200),
+    }
+    precondition = http_cache.precondition_status(event.get('httpMethod'), (event.get('headers') or {}).get('if-none-match'), tag)
+    if precondition == 304:
+        return {"statusCode": 304, "headers": headers, "body": ""}
+    if precondition == 412:
+        return response({"error": "If-None-Match matches the current response"}, 412)
+    return {"statusCode": 200, "headers": headers, "body": body}
+
+def warm_up():
+    """Load yt-dlp and the transcript API and create a pooled YoutubeDL
+
+    Both are imported lazily, so a cold invocation that hits the cache skips
+    them; a scheduled ping to ?warm=1 pays for them ahead of real traffic.
+    """
+    ydl_pool.warm(int(os.environ.get('YTDL_POOL_WARM', 1)))
+    import youtube_transcript_api  # noqa: F401
 
 def handler(event, context):
     try:
-        data = json.loads(event.get('body') or '{}')
+        params = event.get('queryStringParameters') or {}
+        if params.get('warm'):
+            warm_up()
+            return response({"warm": True})
+        # GET /transcribe?url=... is the form a CDN can cache
+        data = params if event.get('httpMethod') == 'GET' else json.loads(event.get('body') or '{}')
         url = (data.get('url') or '').strip()
+        include_cues = data.get('include_cues') not in (None, False, '', '0', 'false')
         if not url:
             return response({"error": "No URL provided"}, 400)
-        if not is_valid_youtube_url(url):
+        vid = extract_video_id(url)
+        if not vid:
             return response({"error": "Invalid YouTube URL"}, 400)
+        url = canonical_url(vid)
+
+        cached = transcript_cache.get(vid)
+        if cached:
+            return transcript_response(cached, event, include_cues)
 
-        # Fast path: try official YouTubeTranscriptApi (no download, works when captions are allowed)
+        # One yt-dlp extraction runs alongside the sources and supplies metadata
+        captions, info_future = caption_sources.fetch(vid, lambda: fetch_info(url))
+        if not captions:
+            return response({"error":"No closed captions found for this video."}, 404)
         try:
-            vid = None
-            m = _re.search(r"(?:v=|/)([0-9A-Za-z_-]{11})", url)
-            if m:
-                vid = m.group(1)
-            if vid:
-                s = YouTubeTranscriptApi.get_transcript(vid, languages=['en','en-US','en-GB'])
-                text = ' '.join([i['text'] for i in s if i.get('text')])
-                text = _re.sub(r'\s+', ' ', text).strip()
-                # Minimal video info with yt-dlp for title/duration/uploader
-                with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                def fmt_dur(x):
-                    if not x: return 'Unknown Duration'
-                    h=x//3600; m=(x%3600)//60; se=x%60
-                    return f"{h:02d}:{m:02d}:{se:02d}" if h>0 else f"{m:02d}:{se:02d}"
-                return response({
-                    'transcription': text,
-                    'title': info.get('title','Unknown Title'),
-                    'duration': fmt_dur(info.get('duration',0)),
-                    'uploader': info.get('uploader','Unknown'),
-                    'language': 'en',
-                    'caption_type': 'Manual/Auto (API)'
-                })
-        except (TranscriptsDisabled, NoTranscriptFound):
-            pass
-
-        ydl_opts = {
-            'writesubtitles': True,
-            'writeautomaticsub': True,
-            'subtitleslangs': ['en','en-US','en-GB'],
-            'skip_download': True,
-            'quiet': True,
-            'no_warnings': True,
+            info = info_future.result()
+        except Exception:
+            # Captions from the transcript API are still worth returning
+            info = {}
+
+        cues = captions['cues']
+        result = {
+            "text": cues.text(),
+            "cues": cues,
+            "title": info.get('title','Unknown Title'),
+            "duration": fmt_dur(info.get('duration',0)),
+            "uploader": info.get('uploader','Unknown'),
+            "language": captions['language'],
+            "type": captions['type'],
+            "format": captions['format'],
+            "source": captions['source']
         }
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            subtitles = info.get('subtitles', {})
-            auto = info.get('automatic_captions', {})
-
-            selected = None
-            lang = None
-            ctype = None
-            for L in ['en','en-US','en-GB']:
-                if L in subtitles:
-                    selected = subtitles[L]; lang=L; ctype='Manual'; break
-            if not selected:
-                for L in ['en','en-US','en-GB']:
-                    if L in auto:
-                        selected = auto[L]; lang=L; ctype='Automatic'; break
-            if not selected:
-                if subtitles:
-                    lang = list(subtitles.keys())[0]; selected=subtitles[lang]; ctype='Manual'
-                elif auto:
-                    lang = list(auto.keys())[0]; selected=auto[lang]; ctype='Automatic'
-
-            if not selected:
-                return response({"error":"No closed captions found for this video."}, 404)
-
-            preferred = ['json3','vtt','ttml','srv3','srv2','srv1']
-            fmt = None
-            for f in selected:
-                if f.get('ext') in preferred:
-                    fmt = f; break
-            if not fmt:
-                fmt = selected[0]
-
-            content = ydl.urlopen(fmt['url']).read().decode('utf-8','ignore')
-            ext = fmt.get('ext','')
-            if ext=='json3':
-                text = parse_json3(content)
-            elif ext=='vtt':
-                text = parse_vtt(content)
-            else:
-                text = parse_xml(content)
-
-            def fmt_dur(s):
-                if not s: return "Unknown Duration"
-                h=s//3600; m=(s%3600)//60; sec=s%60
-                return f"{h:02d}:{m:02d}:{sec:02d}" if h>0 else f"{m:02d}:{sec:02d}"
-
-            return response({
-                "transcription": text,
-                "title": info.get('title','Unknown Title'),
-                "duration": fmt_dur(info.get('duration',0)),
-                "uploader": info.get('uploader','Unknown'),
-                "language": lang,
-                "caption_type": ctype,
-                "success": True
-            })
+        transcript_cache.set(vid, result)
+        return transcript_response(result, event, include_cues)
+    except UpstreamError as e:
+        headers = {"Retry-After": str(math.ceil(e.retry_after))} if e.retry_after else None
+        return response({"error": str(e)}, e.status_code, headers)
     except Exception as e:
         return response({"error": f"Caption extraction failed: {str(e)}"}, 500)
 
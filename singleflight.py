@@ -0,0 +1,101 @@
+"""Coalesce concurrent calls for the same key into one execution.
+
+When a link goes viral many requests for the same video arrive at once.
+SingleFlight lets the first caller run the upstream extraction while the
+others wait for and share its result (or its exception). Coalescing is per
+process; the transcript cache covers repeats across workers.
+
+AsyncSingleFlight does the same for coroutines on one event loop.
+"""
+import threading
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run at most one in-flight call per key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'leaders': 0, 'shared': 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Call fn for key, or wait for the call already running for key"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats['shared'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats['leaders'] += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self):
+        """Return leader/shared counters and the number of calls in flight"""
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+class AsyncSingleFlight:
+    """Run at most one in-flight coroutine per key on the running event loop"""
+
+    def __init__(self):
+        self._calls = {}
+        self._stats = {'leaders': 0, 'shared': 0}
+
+    async def do(self, key, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) for key, or the call already running for key
+
+        The call runs as its own task, so a caller that goes away (a client
+        disconnect cancels it) does not cancel the extraction the others share.
+        """
+        # Imported here: the WSGI app never needs asyncio
+        import asyncio
+
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn(*args, **kwargs))
+            task.add_done_callback(lambda done: self._finished(key, done))
+            self._stats['leaders'] += 1
+        else:
+            self._stats['shared'] += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller has gone
+            task.exception()
+
+    def stats(self):
+        """Return leader/shared counters and the number of calls in flight"""
+        return dict(self._stats, in_flight=len(self._calls))
@@ -5,6 +5,7 @@ class YouTubeTranscriber {
         this.initializeElements();
         this.attachEventListeners();
         this.currentTranscription = '';
+        this.currentHandle = null;
     }
 
     initializeElements() {
@@ -87,8 +88,26 @@ class YouTubeTranscriber {
     }
 
     isValidYouTubeUrl(url) {
-        const youtubeDomains = ['youtube.com', 'youtu.be', 'www.youtube.com', 'm.youtube.com'];
-        return youtubeDomains.some(domain => url.includes(domain));
+        // Mirrors youtube_urls.extract_video_id on the server
+        let parsed;
+        try {
+            parsed = new URL(url.includes('://') ? url : `https://${url}`);
+        } catch (error) {
+            return false;
+        }
+        const host = parsed.hostname.toLowerCase();
+        const segments = parsed.pathname.split('/').filter(Boolean);
+        let videoId = null;
+        if (host === 'youtu.be' || host === 'www.youtu.be') {
+            videoId = segments[0];
+        } else if (/^((www|m|music)\.)?youtube\.com$|^(www\.)?youtube-nocookie\.com$/.test(host)) {
+            if (!segments.length || segments[0] === 'watch') {
+                videoId = parsed.searchParams.get('v');
+            } else if (['shorts', 'embed', 'live', 'v', 'e'].includes(segments[0])) {
+                videoId = segments[1];
+            }
+        }
+        return /^[0-9A-Za-z_-]{11}$/.test(videoId || '');
     }
 
     async handleExtractCaptions() {
@@ -116,7 +135,11 @@ class YouTubeTranscriber {
     async extractCaptions(url) {
         // Simulate progress updates
         this.updateProgress(10, 'Validating YouTube URL...');
-        
+
+        if (await this.streamCaptions(url)) {
+            return;
+        }
+
         this.updateProgress(50, 'Fetching closed captions...');
         const data = await this.apiPostJson('transcribe', { url });
 
@@ -126,9 +149,65 @@ class YouTubeTranscriber {
 
         setTimeout(() => {
             this.showResults(data);
+            this.transcribeBtn.disabled = false;
         }, 500);
     }
 
+    streamCaptions(url) {
+        // Renders the transcript from /transcribe/stream as it arrives. Resolves
+        // false when the stream is unavailable (e.g. on Netlify, or an older
+        // server) so the caller falls back to POST /transcribe.
+        if (typeof EventSource === 'undefined') {
+            return Promise.resolve(false);
+        }
+        const [{ url: endpoint }] = this.getApiEndpoints(`transcribe/stream?url=${encodeURIComponent(url)}`);
+
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(endpoint);
+            const parse = (event) => JSON.parse(event.data);
+
+            this.updateProgress(50, 'Fetching closed captions...');
+
+            source.addEventListener('metadata', (event) => {
+                this.showResults({ ...parse(event), transcription: '' });
+                this.transcriptionText.textContent = '';
+                this.transcriptionContainer.style.display = 'block';
+            });
+            source.addEventListener('cues', (event) => this.appendTranscription(parse(event).text));
+            source.addEventListener('done', (event) => {
+                source.close();
+                // Only now can another extraction start; showResults ran at metadata
+                this.transcribeBtn.disabled = false;
+                const done = parse(event);
+                // The caption language is only known once a source has answered
+                this.showCaptionInfo(done);
+                this.currentHandle = done.handle || null;
+                if (!this.currentTranscription) {
+                    this.transcriptionText.textContent = '(No captions found)';
+                }
+                resolve(true);
+            });
+            source.addEventListener('error', (event) => {
+                // EventSource reconnects on its own; every error ends this request
+                source.close();
+                if (event.data) {
+                    reject(new Error(parse(event).error));
+                } else {
+                    resolve(false);
+                }
+            });
+        });
+    }
+
+    appendTranscription(text) {
+        if (!text) {
+            return;
+        }
+        const chunk = this.currentTranscription ? ` ${text}` : text;
+        this.currentTranscription += chunk;
+        this.transcriptionText.appendChild(document.createTextNode(chunk));
+    }
+
     showLoading() {
         this.hideAllSections();
         this.loadingSection.style.display = 'block';
@@ -144,7 +223,8 @@ class YouTubeTranscriber {
     showResults(data) {
         this.hideAllSections();
         this.resultsSection.style.display = 'block';
-        this.transcribeBtn.disabled = false;
+
+        this.currentHandle = data.handle || null;
 
         // Update video info
         this.videoTitle.textContent = data.title || 'Unknown Title';
@@ -157,7 +237,18 @@ class YouTubeTranscriber {
             this.videoUploader.style.display = 'none';
         }
 
-        // Update caption info
+        this.showCaptionInfo(data);
+
+        // Update transcription
+        this.currentTranscription = data.transcription || '';
+        this.transcriptionText.textContent = this.currentTranscription || '(No captions found)';
+        this.transcriptionContainer.style.display = this.currentTranscription ? 'block' : 'none';
+
+        // Scroll to results
+        this.resultsSection.scrollIntoView({ behavior: 'smooth' });
+    }
+
+    showCaptionInfo(data) {
         if (data.language) {
             this.captionLanguage.innerHTML = `<i class="fas fa-language"></i> ${data.language.toUpperCase()}`;
             this.captionLanguage.style.display = 'flex';
@@ -171,14 +262,6 @@ class YouTubeTranscriber {
         } else {
             this.captionType.style.display = 'none';
         }
-
-        // Update transcription
-        this.currentTranscription = data.transcription || '';
-        this.transcriptionText.textContent = this.currentTranscription || '(No captions found)';
-        this.transcriptionContainer.style.display = this.currentTranscription ? 'block' : 'none';
-
-        // Scroll to results
-        this.resultsSection.scrollIntoView({ behavior: 'smooth' });
     }
 
     showError(message) {
@@ -250,7 +333,7 @@ class YouTubeTranscriber {
         };
 
         try {
-            const res = await this.apiPostForFile('download/json', payload);
+            const res = await this.fetchExport('json', payload);
 
             const blob = await res.blob();
             const url = URL.createObjectURL(blob);
@@ -279,7 +362,7 @@ class YouTubeTranscriber {
         };
 
         try {
-            const res = await this.apiPostForFile('download/docx', payload);
+            const res = await this.fetchExport('docx', payload);
 
             const blob = await res.blob();
             const url = URL.createObjectURL(blob);
@@ -413,18 +496,34 @@ class YouTubeTranscriber {
     }
 
     async apiPostForFile(path, payload) {
+        return this.apiFetchForFile(path, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(payload)
+        });
+    }
+
+    async fetchExport(format, payload) {
+        // Prefer the server-side copy from /transcribe; fall back to sending the text
+        if (this.currentHandle) {
+            try {
+                return await this.apiFetchForFile(`download/${format}/${this.currentHandle}`, { method: 'GET' });
+            } catch (error) {
+                this.currentHandle = null;
+            }
+        }
+        return this.apiPostForFile(`download/${format}`, payload);
+    }
+
+    async apiFetchForFile(path, init) {
         const endpoints = this.getApiEndpoints(path);
         let lastError = null;
 
         for (const { url, allowFallback } of endpoints) {
             try {
-                const response = await fetch(url, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(payload)
-                });
+                const response = await fetch(url, init);
 
                 const contentType = response.headers.get('content-type') || '';
                 const isJson = contentType.includes('application/json');
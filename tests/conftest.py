@@ -0,0 +1,56 @@
+"""Shared fixtures: the Flask app with yt-dlp replaced by the benchmark stub.
+
+State lives in a temporary directory and extraction runs in-process, so
+the tests need no network access and leave nothing behind.
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+STATE_DIR = tempfile.mkdtemp(prefix='yt-script-tests-')
+os.environ.update(
+    TRANSCRIPT_CACHE_PATH='',
+    TRANSCRIPT_HANDLE_PATH=os.path.join(STATE_DIR, 'handles.sqlite3'),
+    TRANSCRIPT_INDEX_PATH=os.path.join(STATE_DIR, 'index.sqlite3'),
+    UPSTREAM_STATE_PATH='',
+    JOB_STORE='memory',
+    EXTRACT_PROCESSES='0',
+    # The transcript API would go to the network
+    CAPTION_SOURCES='yt_dlp',
+)
+
+from run_benchmarks import FakeYoutubeDL, load_fixture  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    FakeYoutubeDL.fixture = load_fixture('small', 'vtt')
+    FakeYoutubeDL.fmt = 'vtt'
+    with mock.patch('yt_dlp.YoutubeDL', FakeYoutubeDL):
+        import app
+        yield app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture(scope='session')
+def netlify_function(app_module):
+    """Import a Netlify function module by name, with the same yt-dlp stub"""
+    def load(name):
+        path = os.path.join(ROOT, 'netlify', 'functions', f"{name}.py")
+        spec = importlib.util.spec_from_file_location(f"netlify_{name}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    return load
@@ -0,0 +1,71 @@
+"""Batch expansion of playlists and the NDJSON batch endpoint"""
+import json
+
+from batch import expand_urls, iter_batch_results, transcription_payload
+from cues import Cue, CueList
+
+PLAYLIST = 'https://www.youtube.com/playlist?list=PL123'
+CHANNEL = 'https://www.youtube.com/@bench'
+LISTINGS = {
+    PLAYLIST: {'entries': [{'id': 'aaaaaaaaaaa'}, None, {'id': 'bbbbbbbbbbb'},
+                           {'id': 'ccccccccccc', 'ie_key': 'YoutubeTab', 'url': 'nested'}]},
+    CHANNEL: {'entries': [{'url': PLAYLIST, 'ie_key': 'YoutubeTab'}, {'id': 'ddddddddddd'}]},
+    'nested': {'entries': [{'id': 'eeeeeeeeeee'}]},
+}
+
+
+def list_entries(url):
+    if url not in LISTINGS:
+        raise ValueError('This playlist does not exist')
+    return LISTINGS[url]
+
+
+def test_expand_urls_flattens_and_dedupes():
+    videos, errors = expand_urls(['https://youtu.be/aaaaaaaaaaa', CHANNEL, '', 'https://example.com/x',
+                                  'https://www.youtube.com/playlist?list=missing'], list_entries)
+    assert [video_id for video_id, _ in videos] == ['aaaaaaaaaaa', 'bbbbbbbbbbb', 'eeeeeeeeeee', 'ddddddddddd']
+    assert videos[0][1] == 'https://www.youtube.com/watch?v=aaaaaaaaaaa'
+    assert [message for _, message in errors] == [
+        'Invalid YouTube URL', 'Playlist expansion failed: This playlist does not exist']
+
+
+def test_expand_urls_respects_the_limit():
+    videos, _ = expand_urls([PLAYLIST], list_entries, limit=2)
+    assert len(videos) == 2
+
+
+def test_batch_results_report_each_video():
+    def extract(url):
+        if url.endswith('bbbbbbbbbbb'):
+            raise RuntimeError('boom')
+        if url.endswith('eeeeeeeeeee'):
+            return None
+        return {'text': url[-11:], 'title': 'T'}
+
+    items = list(iter_batch_results([PLAYLIST, 'not a url'], extract, list_entries, max_workers=2))
+    assert items[0] == {'url': 'not a url', 'success': False, 'error': 'Invalid YouTube URL'}
+    by_id = {item['video_id']: item for item in items[1:]}
+    assert sorted(item['index'] for item in items[1:]) == [0, 1, 2]
+    assert by_id['aaaaaaaaaaa']['transcription'] == 'aaaaaaaaaaa'
+    assert by_id['bbbbbbbbbbb']['error'] == 'Caption extraction failed: boom'
+    assert by_id['eeeeeeeeeee']['error'] == 'No closed captions found for this video.'
+
+
+def test_transcription_payload_cues():
+    captions = {'text': 'hi', 'cues': CueList([Cue(0.0, 1.0, 'hi')]), 'type': 'Manual'}
+    assert 'cues' not in transcription_payload(captions)
+    payload = transcription_payload(captions, include_cues=True)
+    assert payload['cues'] == {'start': [0.0], 'end': [1.0], 'text': ['hi']}
+    assert (payload['caption_type'], payload['uploader']) == ('Manual', 'Unknown')
+
+
+def test_batch_endpoint_streams_ndjson(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'fetch_playlist_info', list_entries)
+    response = client.post('/transcribe/batch', json={'url': 'https://youtu.be/batchroute1', 'urls': ['nested']})
+    assert response.mimetype == 'application/x-ndjson'
+    items = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [item['success'] for item in items] == [False, True]
+    assert items[1]['title'] == 'Benchmark Fixture'
+    assert client.post('/transcribe/batch', json={}).status_code == 400
+    assert client.post('/transcribe/batch', json={'urls': ['https://youtu.be/batchroute1'],
+                                                  'limit': 'lots'}).status_code == 400
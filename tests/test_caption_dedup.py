@@ -0,0 +1,29 @@
+"""Rolling-caption deduplication"""
+from caption_dedup import dedupe_rolling_cues
+from cues import Cue
+
+
+def texts(cues, **kwargs):
+    return [(cue.start, cue.text) for cue in dedupe_rolling_cues(cues, **kwargs)]
+
+
+def test_overlap_with_previous_cue_is_removed():
+    cues = [Cue(0, 2, 'the quick brown'), Cue(2, 4, 'quick brown fox jumps'), Cue(4, 6, 'fox jumps over')]
+    assert texts(cues) == [(0, 'the quick brown'), (2, 'fox jumps'), (4, 'over')]
+
+
+def test_pure_repeats_and_empty_cues_are_dropped():
+    cues = [Cue(0, 1, 'hello world'), Cue(1, 2, '  '), Cue(2, 3, 'hello world'), Cue(3, 4, 'world')]
+    assert texts(cues) == [(0, 'hello world')]
+
+
+def test_only_a_prefix_matching_the_tail_counts():
+    # "world" appears earlier but the new cue does not start with the tail
+    cues = [Cue(0, 1, 'hello world again'), Cue(1, 2, 'world peace')]
+    assert texts(cues) == [(0, 'hello world again'), (1, 'world peace')]
+
+
+def test_overlap_is_bounded_by_max_overlap():
+    cues = [Cue(0, 1, 'a b c d'), Cue(1, 2, 'c d e')]
+    assert texts(cues, max_overlap=1) == [(0, 'a b c d'), (1, 'c d e')]
+    assert texts(cues, max_overlap=2) == [(0, 'a b c d'), (1, 'e')]
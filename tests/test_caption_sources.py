@@ -0,0 +1,127 @@
+"""Caption track selection and the caption-source chain"""
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from caption_sources import (FALLBACK, MIN_SAMPLES, RACE, CaptionRequest, CaptionSourceChain, YtDlpSource,
+                             parse_languages, select_caption_track, select_caption_tracks)
+from cues import Cue, CueList
+from upstream import RateLimited
+
+INFO = {
+    'subtitles': {'de': [{'ext': 'vtt', 'url': 'de.vtt'}, {'ext': 'json3', 'url': 'de.json3'}]},
+    'automatic_captions': {'en': [{'ext': 'srv1', 'url': 'en.srv1'}, {'ext': 'vtt', 'url': 'en.vtt'}],
+                           'fr': [{'ext': 'ttml', 'url': 'fr.ttml'}]},
+}
+CUES = CueList([Cue(0.0, 1.0, 'hello')])
+
+
+class Source:
+    """A caption source that answers after an optional delay, or raises"""
+
+    def __init__(self, name, result=None, error=None, delay=0, timeout=5.0):
+        self.name = name
+        self.result = result
+        self.error = error
+        self.delay = delay
+        self.timeout = timeout
+        self.calls = 0
+
+    def fetch(self, request):
+        self.calls += 1
+        if self.delay:
+            threading.Event().wait(self.delay)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def captions(language='en'):
+    return {'cues': CUES, 'language': language, 'type': 'Manual', 'format': 'test'}
+
+
+def test_parse_languages():
+    assert parse_languages('de, pt-BR,de') == ['de', 'pt-BR']
+    assert parse_languages(['en']) == ['en']
+    assert parse_languages('') is None
+    for bad in ('en;drop', ['x' * 20], 5):
+        with pytest.raises(ValueError):
+            parse_languages(bad)
+
+
+def test_select_caption_track():
+    # Automatic English wins over manual German only because English is preferred
+    assert select_caption_track(INFO, ['en']) == ({'ext': 'vtt', 'url': 'en.vtt'}, 'en', 'Automatic')
+    assert select_caption_track(INFO, ['de-AT']) == ({'ext': 'json3', 'url': 'de.json3'}, 'de', 'Manual')
+    assert select_caption_track(INFO, ['ja']) == ({'ext': 'json3', 'url': 'de.json3'}, 'de', 'Manual')
+    assert select_caption_track(INFO, ['ja'], fallback_any=False) is None
+
+
+def test_select_caption_tracks():
+    assert [track[1:] for track in select_caption_tracks(INFO)] == [('de', 'Manual')]
+    assert [track[1:] for track in select_caption_tracks(INFO, ['fr', 'de', 'de-DE'])] == [
+        ('fr', 'Automatic'), ('de', 'Manual')]
+
+
+def test_ytdlp_source_downloads_the_selected_track():
+    downloads = []
+    source = YtDlpSource(lambda url, ext, rolling: downloads.append((url, ext, rolling)) or CUES)
+    info = Future()
+    info.set_result(INFO)
+    result = source.fetch(CaptionRequest('vid', info, ['fr']))
+    assert downloads == [('fr.ttml', 'ttml', True)]
+    assert (result['language'], result['type'], result['format']) == ('fr', 'Automatic', 'ttml')
+    assert source.fetch(CaptionRequest('vid', info, ['ja'])) is None
+
+
+def test_fallback_moves_past_errors_and_empty_results():
+    broken = Source('broken', error=ValueError('boom'))
+    empty = Source('empty', result={'cues': CueList()})
+    good = Source('good', result=captions())
+    chain = CaptionSourceChain([broken, empty, good], mode=FALLBACK, adaptive=False)
+    result, info = chain.fetch('vid', lambda: {'title': 't'})
+    assert result['source'] == 'good'
+    assert info.result() == {'title': 't'}
+    stats = chain.stats()['sources']
+    assert (stats['broken']['errors'], stats['empty']['empty'], stats['good']['successes']) == (1, 1, 1)
+
+
+def test_fallback_skips_a_source_past_its_timeout():
+    slow = Source('slow', result=captions('de'), delay=0.5, timeout=0.05)
+    good = Source('good', result=captions())
+    chain = CaptionSourceChain([slow, good], adaptive=False)
+    result, _ = chain.fetch('vid', dict)
+    assert result['source'] == 'good'
+
+
+def test_race_takes_the_first_good_answer():
+    slow = Source('slow', result=captions('de'), delay=0.3)
+    fast = Source('fast', result=captions())
+    chain = CaptionSourceChain([slow, fast], mode=RACE, adaptive=False)
+    result, _ = chain.fetch('vid', dict)
+    assert result['source'] == 'fast'
+
+
+def test_upstream_errors_surface_when_nothing_succeeds():
+    chain = CaptionSourceChain([Source('limited', error=RateLimited('slow down', retry_after=5)),
+                                Source('empty')], adaptive=False)
+    with pytest.raises(RateLimited):
+        chain.fetch('vid', dict)
+    assert CaptionSourceChain([Source('empty')]).fetch('vid', dict)[0] is None
+
+
+def test_adaptive_order_follows_success_rate():
+    flaky = Source('flaky', error=ValueError('boom'))
+    steady = Source('steady', result=captions())
+    chain = CaptionSourceChain([flaky, steady])
+    for _ in range(MIN_SAMPLES):
+        chain.fetch('vid', dict)
+    assert chain.stats()['order'] == ['steady', 'flaky']
+    chain.fetch('vid', dict)
+    assert (flaky.calls, steady.calls) == (MIN_SAMPLES, MIN_SAMPLES + 1)
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        CaptionSourceChain([], mode='parallel')
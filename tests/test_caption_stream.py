@@ -0,0 +1,94 @@
+"""Streaming caption parsers, on the recorded fixtures and small samples"""
+import io
+
+import pytest
+
+from caption_dedup import dedupe_rolling_cues
+from caption_stream import iter_caption_cues, iter_chunks, iter_vtt_cues
+from make_fixtures import SIZES, caption_lines
+from run_benchmarks import load_fixture
+
+
+def fixture_cues(fmt, size='small'):
+    return list(iter_caption_cues(iter_chunks(io.BytesIO(load_fixture(size, fmt)), chunk_size=997), fmt))
+
+
+def spoken_text(size='small'):
+    return ' '.join(' '.join(words) for _, _, words in caption_lines(SIZES[size], seed=SIZES[size]))
+
+
+def test_vtt_space_line_does_not_end_a_cue():
+    sample = ('WEBVTT\n\n'
+              '00:00:00.030 --> 00:00:02.869 align:start position:0%\n'
+              ' \n'
+              'hello<00:00:00.560><c> world</c>\n'
+              '\n'
+              '00:00:02.869 --> 00:00:02.879 align:start position:0%\n'
+              'hello world\n'
+              ' \n'
+              '\n')
+    cues = list(iter_vtt_cues([sample]))
+    assert [(cue.start, cue.text) for cue in cues] == [(0.03, 'hello world'), (2.869, 'hello world')]
+
+
+def test_vtt_fixture_keeps_first_cue():
+    first = fixture_cues('vtt')[0]
+    _, _, words = caption_lines(SIZES['small'], seed=SIZES['small'])[0]
+    assert first.start == 0.0
+    assert first.text == ' '.join(words)
+
+
+def test_vtt_fixture_dedupes_to_spoken_words():
+    cues = dedupe_rolling_cues(fixture_cues('vtt'))
+    assert ' '.join(cue.text for cue in cues) == spoken_text()
+
+
+def test_srv1_double_escaped_markup_is_stripped():
+    sample = ('<?xml version="1.0" encoding="utf-8" ?><transcript>'
+              '<text start="1.5" dur="2">&amp;lt;font color=&amp;quot;#E5E5E5&amp;quot;&amp;gt;hello&amp;lt;/font&amp;gt;'
+              ' rock &amp;amp; roll</text></transcript>')
+    cues = list(iter_caption_cues([sample], 'srv1'))
+    assert [(cue.start, cue.end, cue.text) for cue in cues] == [(1.5, 3.5, 'hello rock & roll')]
+
+
+def test_fixture_formats_parse_to_the_spoken_lines():
+    lines = caption_lines(SIZES['small'], seed=SIZES['small'])
+    for fmt in ('json3', 'srv3', 'ttml'):
+        cues = fixture_cues(fmt)
+        assert len(cues) == len(lines), fmt
+        assert ' '.join(cue.text for cue in cues) == spoken_text(), fmt
+        assert (cues[1].start, cues[1].end) == (lines[1][0], lines[1][1]), fmt
+
+
+def test_json3_prefix_and_split_events():
+    sample = (")]}'\n{\"wireMagic\": \"pb3\", \"events\": ["
+              '{"tStartMs": 0, "dDurationMs": 1500, "segs": [{"utf8": "café "}, {"utf8": "au lait"}]},'
+              '{"tStartMs": 1500, "segs": [{"utf8": "\\n"}]},'
+              '{"tStartMs": 2000, "dDurationMs": 500, "segs": [{"utf8": "fin"}]}]}').encode('utf-8')
+    # One byte at a time splits both the events and the multi-byte character
+    chunks = [sample[i:i + 1] for i in range(len(sample))]
+    cues = list(iter_caption_cues(chunks, 'json3'))
+    assert [(cue.start, cue.end, cue.text) for cue in cues] == [(0.0, 1.5, 'café au lait'), (2.0, 2.5, 'fin')]
+
+
+def test_ttml_clock_values_and_line_breaks():
+    sample = ('<tt xmlns="http://www.w3.org/ns/ttml"><body><div>'
+              '<p begin="00:00:01.000" end="00:00:02.500">one<br/>two</p>'
+              '<p begin="3s" dur="500ms">three</p>'
+              '</div></body></tt>')
+    cues = list(iter_caption_cues([sample], 'ttml'))
+    assert [(cue.start, cue.end, cue.text) for cue in cues] == [(1.0, 2.5, 'one two'), (3.0, 3.5, 'three')]
+
+
+def test_vtt_skips_headers_notes_and_identifiers():
+    sample = ('WEBVTT\nKind: captions\n\nNOTE a comment\n\n'
+              'cue-1\n01:02.500 --> 01:04.000\n<b>first</b> line\nsecond line\n\n'
+              '1:00:00,000 --> 1:00:01,000\nlast\n')
+    cues = list(iter_vtt_cues([sample]))
+    assert [(cue.start, cue.end, cue.text) for cue in cues] == [
+        (62.5, 64.0, 'first line second line'), (3600.0, 3601.0, 'last')]
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        iter_caption_cues([''], 'sbv')
@@ -0,0 +1,43 @@
+"""If-None-Match: 304 on GET, 412 on POST (RFC 9110 13.1.2)"""
+URL = 'https://youtu.be/abcdefghijk'
+
+
+def test_get_transcribe_answers_304(client):
+    first = client.get('/transcribe', query_string={'url': URL})
+    assert first.status_code == 200
+    again = client.get('/transcribe', query_string={'url': URL}, headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+
+
+def test_post_transcribe_with_matching_etag_answers_412(client):
+    first = client.post('/transcribe', json={'url': URL})
+    assert first.status_code == 200
+    again = client.post('/transcribe', json={'url': URL}, headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 412
+    assert again.headers['Cache-Control'] == 'no-store'
+
+
+def test_post_transcribe_with_other_etag_answers_200(client):
+    response = client.post('/transcribe', json={'url': URL}, headers={'If-None-Match': '"0123456789abcdef"'})
+    assert response.status_code == 200
+
+
+def test_post_download_with_matching_etag_answers_412(client):
+    payload = {'transcription': 'hello world', 'title': 'Test'}
+    first = client.post('/download/txt', json=payload)
+    assert first.status_code == 200
+    for path in ('/download/txt', '/download/docx'):
+        tag = client.post(path, json=payload).headers['ETag']
+        again = client.post(path, json=payload, headers={'If-None-Match': tag})
+        assert again.status_code == 412, path
+
+
+def test_head_transcribe_uses_get_cache_policy(client):
+    get = client.get('/transcribe', query_string={'url': URL})
+    head = client.head('/transcribe', query_string={'url': URL})
+    assert head.status_code == 200
+    assert head.headers['Cache-Control'] == get.headers['Cache-Control'] != 'no-store'
+    again = client.head('/transcribe', query_string={'url': URL}, headers={'If-None-Match': get.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['Cache-Control'] == get.headers['Cache-Control']
@@ -0,0 +1,48 @@
+"""Word exports: the template writer against the python-docx layout"""
+import io
+import zipfile
+
+import docx
+
+import docx_export
+
+META = {'title': 'Rock & <Roll>', 'uploader': 'bench', 'duration': '00:01:00', 'language': 'en',
+        'caption_type': 'Manual'}
+TRANSCRIPTION = 'First sentence. Second one\x0b here!\n\nThird & last <para>'
+
+
+def paragraphs(body):
+    return [paragraph.text for paragraph in docx.Document(io.BytesIO(body)).paragraphs]
+
+
+def test_fast_writer_matches_python_docx():
+    fast = docx_export.build_docx_fast(TRANSCRIPTION, META)
+    assert paragraphs(fast) == paragraphs(docx_export.build_docx_python(TRANSCRIPTION, META))
+    assert paragraphs(fast)[0] == 'Rock & <Roll>'
+    assert paragraphs(fast)[-3:] == ['First sentence.', 'Second one here!', 'Third & last <para>']
+    assert zipfile.ZipFile(io.BytesIO(fast)).testzip() is None
+
+
+def test_fast_writer_batches_long_transcripts():
+    transcription = ' '.join(f'Sentence {i}.' for i in range(docx_export.PARAGRAPH_BATCH * 2 + 5))
+    body = docx_export.build_docx(transcription, {})
+    texts = paragraphs(body)
+    assert texts[0] == docx_export.DEFAULT_TITLE
+    assert texts[-1] == f'Sentence {docx_export.PARAGRAPH_BATCH * 2 + 4}.'
+
+
+def test_falls_back_to_python_docx(monkeypatch, caplog):
+    def broken(*args, **kwargs):
+        raise OSError('template missing')
+    monkeypatch.setattr(docx_export, 'build_docx_fast', broken)
+    body = docx_export.build_docx(TRANSCRIPTION, META)
+    assert paragraphs(body)[0] == 'Rock & <Roll>'
+    assert 'falling back to python-docx' in caplog.text
+
+
+def test_download_docx_route(client, app_module):
+    response = client.post('/download/docx', json=dict(META, transcription=TRANSCRIPTION))
+    assert response.status_code == 200
+    assert response.mimetype == app_module.DOCX_MIMETYPE
+    assert 'filename=rock_roll.docx' in response.headers['Content-Disposition']
+    assert paragraphs(response.get_data())[-1] == 'Third & last <para>'
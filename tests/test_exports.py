@@ -0,0 +1,97 @@
+"""Export downloads: content types and bodies"""
+import gzip
+import json
+
+import pytest
+
+import http_cache
+from cues import Cue, CueList
+from exports import (CHUNK_SIZE, STREAM_CONTENT_TYPES, TIMED_FORMATS, content_disposition, export_filename,
+                     format_timestamp, iter_export)
+
+
+def test_send_export_uses_the_format_content_type(app_module):
+    meta = {'title': 'Test'}
+    with app_module.app.test_request_context():
+        docx = app_module.send_export(b'PK', 'docx', meta, '"tag"')
+        txt = app_module.send_export(b'hello', 'txt', meta, '"tag"')
+    assert docx.mimetype == app_module.DOCX_MIMETYPE
+    assert txt.headers['Content-Type'] == 'text/plain; charset=utf-8'
+    assert txt.headers['Content-Disposition'].endswith('.txt')
+
+
+META = {'title': 'Test', 'duration': '00:01:00', 'uploader': 'bench', 'language': 'en', 'caption_type': 'Manual'}
+CUES = CueList([Cue(0.0, 1.25, 'Hello there.'), Cue(1.25, None, 'General Kenobi!'), Cue(3661.5, 3662.0, 'café')])
+
+
+def export(fmt, transcription='', cues=None, chunk_size=CHUNK_SIZE):
+    return b''.join(iter_export(fmt, transcription, META, cues, chunk_size=chunk_size)).decode('utf-8')
+
+
+def test_txt_puts_sentences_in_paragraphs():
+    assert export('txt', 'One. Two is here.\n\nthree') == 'One.\n\nTwo is here.\n\nthree\n'
+
+
+def test_json_escapes_and_chunks_the_transcription():
+    transcription = 'say "hi"\n' * 50 + 'naïve ✓'
+    whole = export('json', transcription)
+    assert json.loads(whole) == {'transcription': transcription, 'metadata': META}
+    assert export('json', transcription, chunk_size=7) == whole
+
+
+def test_srt_and_vtt_from_cues():
+    assert export('srt', cues=CUES) == (
+        '1\n00:00:00,000 --> 00:00:01,250\nHello there.\n\n'
+        '2\n00:00:01,250 --> 00:00:01,250\nGeneral Kenobi!\n\n'
+        '3\n01:01:01,500 --> 01:01:02,000\ncafé\n\n')
+    assert export('vtt', cues=CUES).startswith('WEBVTT\n\n00:00:00.000 --> 00:00:01.250\nHello there.\n\n')
+
+
+def test_timed_formats_need_cue_timing():
+    for fmt in TIMED_FORMATS:
+        with pytest.raises(ValueError):
+            iter_export(fmt, 'text', META, None)
+        with pytest.raises(ValueError):
+            iter_export(fmt, 'text', META, CueList.from_text('text'))
+    with pytest.raises(ValueError):
+        iter_export('pdf', 'text', META)
+
+
+def test_chunks_hold_whole_characters():
+    chunks = list(iter_export('txt', 'é' * 5000, META, chunk_size=1000))
+    assert len(chunks) > 1
+    assert all(chunk.decode('utf-8') for chunk in chunks)
+
+
+def test_filenames_are_slugged():
+    assert export_filename('My Video: Part 2!', 'srt') == 'my_video_part_2.srt'
+    assert export_filename('', 'txt') == 'youtube_captions.txt'
+    assert content_disposition('???', 'vtt') == 'attachment; filename=file.vtt'
+
+
+def test_format_timestamp_rounds_and_clamps():
+    assert format_timestamp(59.9996, ',') == '00:01:00,000'
+    assert format_timestamp(-1, '.') == '00:00:00.000'
+
+
+def test_download_by_handle_streams_each_format(client):
+    handle = client.post('/transcribe', json={'url': 'https://youtu.be/exporttest1', 'include_cues': True}).get_json()['handle']
+    for fmt in ('txt', 'json', 'srt', 'vtt'):
+        response = client.get(f'/download/{fmt}/{handle}')
+        assert response.status_code == 200, fmt
+        assert response.headers['Content-Type'] == STREAM_CONTENT_TYPES[fmt]
+        assert response.is_streamed
+        assert response.get_data()
+    assert client.get(f'/download/pdf/{handle}').status_code == 404
+    assert client.get('/download/txt/' + '0' * 32).status_code == 404
+
+
+def test_compressed_export_is_stored_with_the_handle(client, app_module):
+    handle = client.post('/transcribe', json={'url': 'https://youtu.be/exporttest2'}).get_json()['handle']
+    plain = client.get(f'/download/txt/{handle}').get_data()
+    first = client.get(f'/download/txt/{handle}', headers={'Accept-Encoding': 'gzip'})
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(first.get_data()) == plain
+    tag = http_cache.export_etag('txt', handle)
+    stored = app_module.transcript_handles.get_artifact(handle, http_cache.variant_name('txt', tag, 'gzip'))
+    assert stored == first.get_data()
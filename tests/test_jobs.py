@@ -0,0 +1,87 @@
+"""Asynchronous jobs: stores, queue and the /jobs routes"""
+import threading
+import time
+
+import pytest
+
+import jobs
+from cues import Cue, CueList
+from jobs import DONE, FAILED, PENDING, RUNNING, JobQueue, MemoryJobStore, SQLiteJobStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / 'jobs.sqlite3'))
+
+
+def wait_for(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in (DONE, FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def test_store_round_trip(store):
+    store.create('job1', 'https://youtu.be/abcdefghijk')
+    assert store.get('job1')['status'] == PENDING
+    result = {'text': 'hi', 'cues': CueList([Cue(0.0, 1.0, 'hi')])}
+    store.update('job1', status=DONE, result=result)
+    job = store.get('job1')
+    assert job['status'] == DONE
+    assert CueList.coerce(job['result']['cues']).text() == 'hi'
+    assert store.get('missing') is None
+
+
+def test_expired_jobs_are_purged_on_create(store, monkeypatch):
+    store.ttl = 1
+    now = time.time()
+    monkeypatch.setattr(jobs, 'time', type('Clock', (), {'time': staticmethod(lambda: now - 10)}))
+    store.create('old', 'u')
+    monkeypatch.undo()
+    store.create('new', 'u')
+    assert store.get('old') is None
+    assert store.get('new') is not None
+
+
+def test_queue_runs_jobs_and_records_outcomes(store):
+    started = threading.Event()
+    release = threading.Event()
+
+    def extract(url):
+        started.set()
+        release.wait(5)
+        if url == 'boom':
+            raise ValueError('bad video')
+        return None if url == 'none' else {'text': url}
+
+    queue = JobQueue(extract, store, max_workers=1)
+    job_id = queue.submit('ok')
+    started.wait(5)
+    assert queue.get(job_id)['status'] == RUNNING
+    failed, empty = queue.submit('boom'), queue.submit('none')
+    release.set()
+    assert wait_for(queue, job_id)['result'] == {'text': 'ok'}
+    assert wait_for(queue, failed)['error'] == 'Caption extraction failed: bad video'
+    assert wait_for(queue, empty)['error'] == 'No closed captions found for this video.'
+
+
+def test_jobs_routes(client):
+    response = client.post('/jobs', json={'url': 'https://youtu.be/jobroute001'})
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    deadline = time.monotonic() + 5
+    while True:
+        job = client.get(f'/jobs/{job_id}').get_json()
+        if job['status'] not in (PENDING, RUNNING) or time.monotonic() > deadline:
+            break
+        time.sleep(0.01)
+    assert job['status'] == DONE
+    assert job['result']['title'] == 'Benchmark Fixture'
+    assert client.get('/jobs/unknown').status_code == 404
+    assert client.post('/jobs', json={'url': 'https://example.com/'}).status_code == 400
+    assert client.post('/jobs', json={}).status_code == 400
@@ -0,0 +1,50 @@
+"""Netlify functions, called the way Netlify invokes them"""
+import json
+
+
+def test_transcribe_include_cues_feeds_srt_export(netlify_function):
+    transcribe = netlify_function('transcribe')
+    download_export = netlify_function('download_export')
+    event = {'httpMethod': 'POST', 'body': json.dumps({'url': 'https://youtu.be/netlifycue1', 'include_cues': True})}
+    response = transcribe.handler(event, None)
+    assert response['statusCode'] == 200
+    data = json.loads(response['body'])
+    assert data['cues']['start'][0] == 0.0
+
+    export = download_export.handler({'httpMethod': 'POST', 'queryStringParameters': {'format': 'srt'},
+                                       'body': json.dumps(data)}, None)
+    assert export['statusCode'] == 200
+    assert export['body'].startswith('1\n00:00:00,000 --> ')
+
+
+def test_transcribe_omits_cues_by_default(netlify_function):
+    transcribe = netlify_function('transcribe')
+    response = transcribe.handler({'httpMethod': 'GET', 'queryStringParameters': {'url': 'https://youtu.be/netlifycue2'}},
+                                  None)
+    assert response['statusCode'] == 200
+    assert 'cues' not in json.loads(response['body'])
+    assert 'handle' not in json.loads(response['body'])
+
+
+def test_transcribe_falls_back_on_malformed_xml(netlify_function, monkeypatch):
+    from run_benchmarks import FakeYoutubeDL
+    monkeypatch.setattr(FakeYoutubeDL, 'fmt', 'srv1')
+    monkeypatch.setattr(FakeYoutubeDL, 'fixture', b'<transcript><text start="0">hello & world</text>')
+    transcribe = netlify_function('transcribe')
+    response = transcribe.handler({'httpMethod': 'POST', 'body': json.dumps({'url': 'https://youtu.be/netlifybad1'})},
+                                  None)
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['transcription'] == 'hello & world'
+
+
+def test_download_failures_are_logged(netlify_function, caplog):
+    event = {'httpMethod': 'POST', 'body': '{not json'}
+    for name in ('download_docx', 'download_json'):
+        caplog.clear()
+        response = netlify_function(name).handler(event, None)
+        assert response['statusCode'] == 500, name
+        assert 'Error generating' in caplog.text, name
+    caplog.clear()
+    response = netlify_function('download_export').handler({**event, 'queryStringParameters': {'format': 'txt'}}, None)
+    assert response['statusCode'] == 500
+    assert 'Error generating TXT' in caplog.text
@@ -0,0 +1,35 @@
+"""Transcript search index: which transcripts get indexed, and under what"""
+
+
+def search(client, app_module, query):
+    app_module.transcript_index.flush()
+    response = client.get('/search', query_string={'q': query, 'limit': 100})
+    assert response.status_code == 200
+    return [(result['video_id'], result['language']) for result in response.get_json()['results']]
+
+
+def first_word(response):
+    return response.get_json()['transcription'].split()[0]
+
+
+def test_transcript_with_language_list_is_searchable(client, app_module):
+    response = client.post('/transcribe', json={'url': 'https://youtu.be/searchlang1', 'languages': ['en']})
+    assert response.status_code == 200
+    assert ('searchlang1', 'en') in search(client, app_module, first_word(response))
+
+
+def test_all_tracks_are_searchable(client, app_module):
+    response = client.post('/transcribe', json={'url': 'https://youtu.be/searchall01', 'languages': ['en'],
+                                                'all_tracks': True})
+    assert response.status_code == 200
+    word = response.get_json()['tracks'][0]['transcription'].split()[0]
+    assert ('searchall01', 'en') in search(client, app_module, word)
+
+
+def test_languages_of_one_video_are_indexed_separately(app_module):
+    index = app_module.transcript_index
+    for language, text in (('en', 'hello kubernetes'), ('de', 'hallo kubernetes')):
+        index.add('searchmulti', {'text': text, 'language': language, 'type': 'Manual'})
+    index.flush()
+    found = {(result['video_id'], result['language']) for result in index.search('kubernetes')}
+    assert {('searchmulti', 'en'), ('searchmulti', 'de')} <= found
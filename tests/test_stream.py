@@ -0,0 +1,29 @@
+"""/transcribe/stream: events and YoutubeDL pool use"""
+import json
+
+
+def events(messages):
+    for message in messages:
+        if message.startswith('event: '):
+            name, data = message.split('\n', 1)
+            yield name[len('event: '):], json.loads(data[len('data: '):])
+
+
+def test_stream_releases_pooled_instance_while_sending(app_module):
+    # A slow client must not hold a YoutubeDL instance out of the pool
+    in_use = []
+    for message in app_module.iter_transcript_events('streamtest1'):
+        if message.startswith('event: cues'):
+            in_use.append(app_module.ydl_pool.stats()['in_use'])
+    assert in_use and set(in_use) == {0}
+    assert message.startswith('event: done')
+
+
+def test_stream_goes_through_caption_sources(app_module):
+    before = app_module.caption_sources.stats()['sources']['yt_dlp']['successes']
+    received = list(events(app_module.iter_transcript_events('streamtest2')))
+    assert received[0] == ('metadata', {'title': 'Benchmark Fixture', 'duration': '03:00:00', 'uploader': 'bench'})
+    name, done = received[-1]
+    assert name == 'done'
+    assert (done['language'], done['caption_type']) == ('en', 'Automatic')
+    assert app_module.caption_sources.stats()['sources']['yt_dlp']['successes'] == before + 1
@@ -0,0 +1,97 @@
+"""Transcript cache tiers and download handles"""
+import time
+
+from cues import Cue, CueList
+from transcript_cache import TranscriptCache, cache_key
+from transcript_handles import TranscriptHandleStore, export_fields, transcript_handle
+
+CAPTIONS = {'text': 'hello world', 'title': 'T', 'duration': '00:00:02', 'uploader': 'u',
+            'language': 'en', 'type': 'Manual'}
+
+
+def test_memory_tier_is_lru():
+    cache = TranscriptCache(path='', max_memory_items=2)
+    cache.set('a', {'text': 'a'})
+    cache.set('b', {'text': 'b'})
+    assert cache.get('a') == {'text': 'a'}
+    cache.set('c', {'text': 'c'})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'text': 'a'}
+    stats = cache.stats()
+    assert (stats['memory_hits'], stats['misses'], stats['evictions'], stats['memory_items']) == (2, 1, 1, 2)
+
+
+def test_keys_include_language_and_caption_type():
+    cache = TranscriptCache(path='')
+    cache.set('vid', {'text': 'en'}, 'en', 'Manual')
+    assert cache.get('vid', 'en', 'Automatic') is None
+    assert cache.get('vid', 'en', 'Manual') == {'text': 'en'}
+    assert cache_key('vid') == 'vid::'
+
+
+def test_disk_tier_is_shared_and_keeps_cues(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    value = dict(CAPTIONS, cues=CueList([Cue(0.0, 1.0, 'hello'), Cue(1.0, 2.0, 'world')]))
+    TranscriptCache(path=path).set('vid', value)
+    other = TranscriptCache(path=path)
+    hit = other.get('vid')
+    assert hit['text'] == 'hello world'
+    assert CueList.coerce(hit['cues']).to_json() == value['cues'].to_json()
+    assert other.stats()['disk_hits'] == 1
+    assert other.get('vid') == hit
+    assert other.stats()['memory_hits'] == 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = TranscriptCache(path=str(tmp_path / 'cache.sqlite3'), ttl=1)
+    cache.set('vid', {'text': 'old'})
+    for key, (created_at, value) in list(cache._memory.items()):
+        cache._memory[key] = (created_at - 10, value)
+    with cache._connect() as conn:
+        conn.execute('UPDATE transcripts SET created_at = created_at - 10')
+    assert cache.get('vid') is None
+    assert cache.stats()['expired'] == 2
+
+
+def test_disk_tier_is_pruned_to_size(tmp_path):
+    cache = TranscriptCache(path=str(tmp_path / 'cache.sqlite3'), max_disk_items=2)
+    for video_id in 'abc':
+        cache.set(video_id, {'text': video_id})
+        time.sleep(0.001)
+    assert cache.stats()['disk_items'] == 2
+
+
+def test_handles_are_content_hashes(tmp_path):
+    store = TranscriptHandleStore(path=str(tmp_path / 'handles.sqlite3'))
+    handle = store.put(CAPTIONS)
+    assert handle == transcript_handle(dict(CAPTIONS)) == store.put(dict(CAPTIONS))
+    assert handle != transcript_handle(dict(CAPTIONS, text='hello there'))
+    assert store.get(handle) == CAPTIONS
+    assert store.get('0' * 24) is None
+    assert export_fields(CAPTIONS)['caption_type'] == 'Manual'
+
+
+def test_artifacts_expire_with_their_handle(tmp_path):
+    store = TranscriptHandleStore(path=str(tmp_path / 'handles.sqlite3'), ttl=60)
+    handle = store.put(CAPTIONS)
+    store.put_artifact(handle, 'docx', b'PK\x03\x04')
+    assert store.get_artifact(handle, 'docx') == b'PK\x03\x04'
+    assert store.get_artifact(handle, 'txt') is None
+    with store._connect() as conn:
+        conn.execute('UPDATE handles SET created_at = created_at - 120')
+        conn.execute('UPDATE artifacts SET created_at = created_at - 120')
+    assert store.get(handle) is None
+    assert store.get_artifact(handle, 'docx') is None
+    # Putting the transcript again revives it without a new handle
+    assert store.put(CAPTIONS) == handle
+    assert store.get(handle) == CAPTIONS
+
+
+def test_second_transcribe_is_a_cache_hit(client, app_module):
+    url = 'https://www.youtube.com/watch?v=cachetest01'
+    first = client.post('/transcribe', json={'url': url}).get_json()
+    hits = app_module.transcript_cache.stats()['memory_hits']
+    again = client.post('/transcribe', json={'url': 'https://youtu.be/cachetest01'}).get_json()
+    assert again == first
+    assert app_module.transcript_cache.stats()['memory_hits'] == hits + 1
+    assert app_module.transcript_handles.get(first['handle'])['text'] == first['transcription']
@@ -0,0 +1,114 @@
+"""Upstream scheduler: token bucket, retries and circuit breaker on a fake clock"""
+import pytest
+
+from upstream import RATE_LIMITED, TRANSIENT, RateLimited, UpstreamScheduler, UpstreamUnavailable, classify
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class HTTPError(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f'HTTP Error {status}')
+        self.response = type('Response', (), {'status_code': status,
+                                               'headers': {'Retry-After': retry_after} if retry_after else {}})()
+
+
+def scheduler(clock, path='', **kwargs):
+    kwargs.setdefault('backoff_base', 0.1)
+    return UpstreamScheduler(name='test', path=path, sleep=clock.sleep, clock=clock, **kwargs)
+
+
+def failing(*errors):
+    """A callable that raises each error in turn, then returns 'ok'"""
+    errors = list(errors)
+
+    def fn():
+        if errors:
+            raise errors.pop(0)
+        return 'ok'
+    return fn
+
+
+def test_classify():
+    assert classify(HTTPError(429)) == RATE_LIMITED
+    assert classify(Exception('ERROR: Sign in to confirm you\'re not a bot')) == RATE_LIMITED
+    assert classify(HTTPError(503)) == TRANSIENT
+    assert classify(ConnectionError('boom')) == TRANSIENT
+    assert classify(Exception('The read operation timed out')) == TRANSIENT
+    assert classify(Exception('Private video')) is None
+
+
+def test_bucket_throttles_to_the_rate():
+    clock = Clock()
+    upstream = scheduler(clock, rate=2.0, burst=2)
+    for _ in range(4):
+        assert upstream.call(lambda: 'ok') == 'ok'
+    assert clock.slept == [0.5, 0.5]
+    assert upstream.stats()['throttled_wait_s'] == 1.0
+
+
+def test_wait_beyond_max_wait_is_rejected():
+    clock = Clock()
+    upstream = scheduler(clock, rate=0.01, burst=1, max_wait=5)
+    upstream.call(lambda: 'ok')
+    with pytest.raises(RateLimited) as info:
+        upstream.call(lambda: 'ok')
+    assert info.value.retry_after == pytest.approx(100)
+    assert upstream.stats()['rejected'] == 1
+
+
+def test_transient_errors_are_retried_with_backoff():
+    clock = Clock()
+    upstream = scheduler(clock, max_attempts=3)
+    assert upstream.call(failing(HTTPError(503), ConnectionError('reset'))) == 'ok'
+    stats = upstream.stats()
+    assert (stats['retries'], stats['transient_errors'], stats['consecutive_failures']) == (2, 2, 0)
+    assert len(clock.slept) == 2 and all(0 <= delay <= 0.4 for delay in clock.slept)
+
+
+def test_final_errors_are_not_retried():
+    clock = Clock()
+    upstream = scheduler(clock)
+    with pytest.raises(ValueError):
+        upstream.call(failing(ValueError('Private video')))
+    assert upstream.stats()['retries'] == 0
+
+
+def test_rate_limit_pauses_the_shared_bucket(tmp_path):
+    clock = Clock()
+    path = str(tmp_path / 'upstream.sqlite3')
+    upstream = scheduler(clock, path, max_attempts=1, rate_limit_pause=30)
+    with pytest.raises(RateLimited) as info:
+        upstream.call(failing(HTTPError(429, retry_after='12')))
+    assert info.value.retry_after == 12.0
+    # Another worker on the same state file waits out the pause too
+    other = scheduler(clock, path, max_wait=60)
+    assert other.stats()['paused_for_s'] == 12.0
+    assert other.call(lambda: 'ok') == 'ok'
+    assert clock.slept == [12.0]
+
+
+def test_circuit_opens_and_a_probe_closes_it():
+    clock = Clock()
+    upstream = scheduler(clock, max_attempts=1, breaker_threshold=2, breaker_cooldown=30)
+    for _ in range(2):
+        with pytest.raises(UpstreamUnavailable):
+            upstream.call(failing(HTTPError(500)))
+    assert upstream.stats()['circuit'] == 'open'
+    with pytest.raises(UpstreamUnavailable) as info:
+        upstream.call(lambda: 'ok')
+    assert info.value.retry_after == 30
+    clock.now += 31
+    assert upstream.call(lambda: 'ok') == 'ok'
+    assert upstream.stats()['circuit'] == 'closed'
@@ -0,0 +1,45 @@
+"""YouTube URL shapes and their canonical video ID"""
+import pytest
+
+from youtube_urls import canonical_url, extract_video_id, is_youtube_url
+
+VIDEO_ID = 'dQw4w9WgXcQ'
+
+
+@pytest.mark.parametrize('url', [
+    f'https://www.youtube.com/watch?v={VIDEO_ID}',
+    f'https://www.youtube.com/watch?feature=share&v={VIDEO_ID}&t=42s',
+    f'http://m.youtube.com/watch?v={VIDEO_ID}',
+    f'https://music.youtube.com/watch?v={VIDEO_ID}&list=RDAMVM',
+    f'youtube.com/watch?v={VIDEO_ID}',
+    f'https://youtu.be/{VIDEO_ID}?si=abc',
+    f'  https://YOUTU.BE/{VIDEO_ID}  ',
+    f'https://www.youtube.com/shorts/{VIDEO_ID}',
+    f'https://www.youtube.com/embed/{VIDEO_ID}?start=10',
+    f'https://www.youtube-nocookie.com/embed/{VIDEO_ID}',
+    f'https://www.youtube.com/live/{VIDEO_ID}',
+    f'https://www.youtube.com/v/{VIDEO_ID}',
+])
+def test_known_shapes_give_the_video_id(url):
+    assert is_youtube_url(url)
+    assert extract_video_id(url) == VIDEO_ID
+
+
+@pytest.mark.parametrize('url', [
+    '',
+    None,
+    f'https://vimeo.com/{VIDEO_ID}',
+    f'https://notyoutube.com/watch?v={VIDEO_ID}',
+    'https://www.youtube.com/watch?v=short',
+    'https://www.youtube.com/channel/UC1234567890',
+    'https://youtu.be/',
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ!',
+])
+def test_other_urls_have_no_video_id(url):
+    assert extract_video_id(url) is None
+
+
+def test_canonical_url_round_trips():
+    assert canonical_url(VIDEO_ID) == f'https://www.youtube.com/watch?v={VIDEO_ID}'
+    assert extract_video_id(canonical_url(VIDEO_ID)) == VIDEO_ID
+    assert not is_youtube_url('https://example.com/watch?v=dQw4w9WgXcQ')
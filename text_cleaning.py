@@ -0,0 +1,84 @@
+"""Text cleaning shared by the parsers, exporters and Netlify functions.
+
+Cleaning is one precompiled regex pass that turns markup, cue timing lines
+and WEBVTT/NOTE headers into separators, followed by C-level work only:
+entities are decoded with html.unescape (so &amp; becomes "&" rather than a
+blank) and only when an "&" is present, and whitespace is collapsed with
+str.split. That replaces the chain of six or seven full-document re.sub
+calls the parsers used to run, and per-line cleaning skips the regex
+entirely for lines without markup.
+"""
+import html
+import re
+
+# Caption markup that carries no transcript text. Runs are matched as one
+# unit so a word wrapped in <00:00:01.000><c>...</c> costs a single replacement
+DOCUMENT_NOISE_RE = re.compile(
+    r'(?:<[^>]*>|^[^\n]*-->[^\n]*|WEBVTT[^\n]*|NOTE[^\n]*|\d\d:\d\d:\d\d[.,]\d\d\d)+',
+    re.MULTILINE
+)
+# XML documents carry none of the VTT markers, so only tag runs need matching
+TAG_RUN_RE = re.compile(r'(?:<[^>]*>)+')
+TAG_RE = re.compile(r'<[^>]*>')
+VTT_MARKERS = ('-->', 'WEBVTT', 'NOTE')
+PARAGRAPH_RE = re.compile(r"\n\n+|(?<=[.!?])\s+(?=[A-Z])")
+SLUG_STRIP_RE = re.compile(r"[^a-z0-9\-\_\s]")
+SLUG_SPACE_RE = re.compile(r"\s+")
+
+
+def clean_caption_text(content):
+    """Fallback cleaner for any caption format"""
+    vtt_like = any(marker in content for marker in VTT_MARKERS)
+    text = (DOCUMENT_NOISE_RE if vtt_like else TAG_RUN_RE).sub(' ', content)
+    if '&' in text:
+        text = html.unescape(text)
+        # Escaped markup (srv1's &lt;font&gt;) only becomes tags once decoded
+        if '<' in text:
+            text = TAG_RUN_RE.sub(' ', text)
+    return ' '.join(text.split())
+
+
+def clean_cue_text(text):
+    """Strip inline markup, decode entities and collapse whitespace in cue text
+
+    Inline tags such as <c> or <00:00:01.000> vanish without adding a space.
+    Tags that were entity-escaped are stripped once decoded.
+    """
+    if '<' in text:
+        text = TAG_RE.sub('', text)
+    if '&' in text:
+        text = html.unescape(text)
+        if '<' in text:
+            text = TAG_RE.sub('', text)
+    return ' '.join(text.split())
+
+
+def collapse_whitespace(text):
+    return ' '.join(text.split())
+
+
+def iter_paragraphs(text):
+    """Lazily yield the paragraphs split_into_paragraphs would return"""
+    start = 0
+    for match in PARAGRAPH_RE.finditer(text or ''):
+        paragraph = text[start:match.start()].strip()
+        if paragraph:
+            yield paragraph
+        start = match.end()
+    paragraph = (text or '')[start:].strip()
+    if paragraph:
+        yield paragraph
+
+
+def split_into_paragraphs(text):
+    """Split a transcript on blank lines or sentence boundaries for readability"""
+    if not text:
+        return []
+    return list(iter_paragraphs(text))
+
+
+def slugify(value):
+    value = (value or '').lower()
+    value = SLUG_STRIP_RE.sub('', value)
+    value = SLUG_SPACE_RE.sub('_', value).strip('_')
+    return value or 'file'
@@ -0,0 +1,202 @@
+"""Two-tier transcript cache: an in-process LRU in front of a SQLite file.
+
+Entries are keyed on the canonical YouTube video ID plus the caption
+language and caption type, and hold the parsed transcript together with the
+video metadata. The SQLite tier is shared by every gunicorn worker on the
+host and survives worker restarts; the memory tier saves the disk round trip
+for the hottest videos.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from cues import json_default
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'yt_transcript_cache.sqlite3')
+
+
+def cache_key(video_id, language='', caption_type=''):
+    """Build the cache key for a video/language/caption-type combination"""
+    return f"{video_id}:{language or ''}:{caption_type or ''}"
+
+
+class TranscriptCache:
+    """LRU memory cache backed by an optional on-disk SQLite store"""
+
+    def __init__(self, path=DEFAULT_PATH, ttl=86400, max_memory_items=256, max_disk_items=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'evictions': 0,
+            'expired': 0,
+        }
+        if self.path:
+            self._init_db()
+
+    @classmethod
+    def from_env(cls):
+        """Create a cache configured from TRANSCRIPT_CACHE_* environment variables"""
+        return cls(
+            path=os.environ.get('TRANSCRIPT_CACHE_PATH', DEFAULT_PATH),
+            ttl=int(os.environ.get('TRANSCRIPT_CACHE_TTL', 86400)),
+            max_memory_items=int(os.environ.get('TRANSCRIPT_CACHE_MEMORY_ITEMS', 256)),
+            max_disk_items=int(os.environ.get('TRANSCRIPT_CACHE_DISK_ITEMS', 10000)),
+        )
+
+    def _connect(self):
+        # A short-lived connection per operation keeps the cache safe to use
+        # from threads and from workers forked after the cache was created
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _init_db(self):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS transcripts ('
+                    ' key TEXT PRIMARY KEY,'
+                    ' value TEXT NOT NULL,'
+                    ' created_at REAL NOT NULL,'
+                    ' accessed_at REAL NOT NULL)'
+                )
+                conn.execute('CREATE INDEX IF NOT EXISTS transcripts_accessed ON transcripts (accessed_at)')
+        except sqlite3.Error as e:
+            logger.error(f"Disabling on-disk transcript cache at {self.path}: {str(e)}")
+            self.path = None
+
+    def _expired(self, created_at, now):
+        return bool(self.ttl) and now - created_at > self.ttl
+
+    def _remember(self, key, created_at, value):
+        """Insert into the memory tier, evicting the least recently used entry"""
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def get(self, video_id, language='', caption_type=''):
+        """Return the cached transcript dict, or None on a miss"""
+        key = cache_key(video_id, language, caption_type)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    metrics.inc('yt_cache_requests_total', cache='transcript', result='memory_hit')
+                    return dict(value)
+                del self._memory[key]
+                self._stats['expired'] += 1
+
+        value = self._disk_get(key, now)
+
+        with self._lock:
+            if value is None:
+                self._stats['misses'] += 1
+                metrics.inc('yt_cache_requests_total', cache='transcript', result='miss')
+                return None
+            self._stats['disk_hits'] += 1
+            metrics.inc('yt_cache_requests_total', cache='transcript', result='disk_hit')
+            self._remember(key, value[0], value[1])
+            return dict(value[1])
+
+    def _disk_get(self, key, now):
+        if not self.path:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT value, created_at FROM transcripts WHERE key = ?', (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if self._expired(row[1], now):
+                    conn.execute('DELETE FROM transcripts WHERE key = ?', (key,))
+                    with self._lock:
+                        self._stats['expired'] += 1
+                    return None
+                conn.execute('UPDATE transcripts SET accessed_at = ? WHERE key = ?', (now, key))
+                return row[1], json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Transcript cache read failed: {str(e)}")
+            return None
+
+    def set(self, video_id, value, language='', caption_type=''):
+        """Store a transcript dict in both tiers"""
+        key = cache_key(video_id, language, caption_type)
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, now, dict(value))
+            self._stats['sets'] += 1
+
+        if not self.path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO transcripts (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)',
+                    (key, json.dumps(value, ensure_ascii=False, default=json_default), now, now)
+                )
+                self._prune(conn, now)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.error(f"Transcript cache write failed: {str(e)}")
+
+    def _prune(self, conn, now):
+        """Drop expired rows and the least recently used rows over the size limit"""
+        if self.ttl:
+            conn.execute('DELETE FROM transcripts WHERE created_at < ?', (now - self.ttl,))
+        if self.max_disk_items:
+            cursor = conn.execute(
+                'DELETE FROM transcripts WHERE key IN ('
+                ' SELECT key FROM transcripts ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_disk_items,)
+            )
+            if cursor.rowcount > 0:
+                with self._lock:
+                    self._stats['evictions'] += cursor.rowcount
+
+    def clear(self):
+        """Empty both tiers"""
+        with self._lock:
+            self._memory.clear()
+        if self.path:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM transcripts')
+
+    def stats(self):
+        """Return hit/miss counters and current tier sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_items'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        stats['disk_items'] = 0
+        if self.path:
+            try:
+                with self._connect() as conn:
+                    stats['disk_items'] = conn.execute('SELECT COUNT(*) FROM transcripts').fetchone()[0]
+            except sqlite3.Error:
+                pass
+        return stats
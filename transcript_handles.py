@@ -0,0 +1,140 @@
+"""Short-lived server-side transcript handles and cached export artifacts.
+
+/transcribe stores the transcript it just produced under a handle and
+returns that handle, so downloads can be requested with
+GET /download/<format>/<handle> instead of POSTing megabytes of text back.
+Built artifacts are kept per (handle, format), so repeat downloads of the
+same export are served without rebuilding.
+
+Handles are content hashes: the same transcript always gets the same handle,
+so artifacts are shared by everyone who extracted that video. State lives
+in SQLite so any gunicorn worker on the host can serve any handle.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+from cues import json_default
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'yt_transcript_handles.sqlite3')
+
+# Fields that identify a transcript; cues are derived from the same track
+HANDLE_FIELDS = ('text', 'title', 'duration', 'uploader', 'language', 'type')
+
+
+def transcript_handle(captions_data):
+    """Return the content-hash handle for a captions dict"""
+    digest = hashlib.sha256()
+    for field in HANDLE_FIELDS:
+        digest.update(str(captions_data.get(field, '')).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:24]
+
+
+def export_fields(captions_data):
+    """Shape a stored transcript like a download request body"""
+    return {
+        'transcription': captions_data.get('text', ''),
+        'title': captions_data.get('title', ''),
+        'duration': captions_data.get('duration', ''),
+        'uploader': captions_data.get('uploader', ''),
+        'language': captions_data.get('language', ''),
+        'caption_type': captions_data.get('type', ''),
+    }
+
+
+class TranscriptHandleStore:
+    """SQLite-backed transcripts and export artifacts with a shared TTL"""
+
+    def __init__(self, path=DEFAULT_PATH, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS handles ('
+                ' handle TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' created_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS artifacts ('
+                ' handle TEXT NOT NULL,'
+                ' format TEXT NOT NULL,'
+                ' body BLOB NOT NULL,'
+                ' created_at REAL NOT NULL,'
+                ' PRIMARY KEY (handle, format))'
+            )
+
+    @classmethod
+    def from_env(cls):
+        """Create a store configured from TRANSCRIPT_HANDLE_* environment variables"""
+        return cls(
+            path=os.environ.get('TRANSCRIPT_HANDLE_PATH') or DEFAULT_PATH,
+            ttl=int(os.environ.get('TRANSCRIPT_HANDLE_TTL', 3600)),
+        )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def put(self, captions_data):
+        """Store a transcript and return its handle (refreshing its lifetime)"""
+        handle = transcript_handle(captions_data)
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                updated = conn.execute('UPDATE handles SET created_at = ? WHERE handle = ?', (now, handle))
+                if not updated.rowcount:
+                    conn.execute(
+                        'INSERT INTO handles (handle, value, created_at) VALUES (?, ?, ?)',
+                        (handle, json.dumps(captions_data, ensure_ascii=False, default=json_default), now)
+                    )
+                conn.execute('UPDATE artifacts SET created_at = ? WHERE handle = ?', (now, handle))
+                self._prune(conn, now)
+        except sqlite3.Error as e:
+            logger.error(f"Transcript handle write failed: {str(e)}")
+            return None
+        return handle
+
+    def get(self, handle):
+        """Return the stored captions dict for a handle, or None if unknown or expired"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT value FROM handles WHERE handle = ? AND created_at >= ?',
+                (handle, self._cutoff())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_artifact(self, handle, fmt):
+        """Return cached export bytes for (handle, format), or None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT body FROM artifacts WHERE handle = ? AND format = ? AND created_at >= ?',
+                (handle, fmt, self._cutoff())
+            ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def put_artifact(self, handle, fmt, body):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO artifacts (handle, format, body, created_at) VALUES (?, ?, ?, ?)',
+                    (handle, fmt, sqlite3.Binary(body), time.time())
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Artifact cache write failed: {str(e)}")
+
+    def _cutoff(self):
+        return time.time() - self.ttl if self.ttl else 0
+
+    def _prune(self, conn, now):
+        if self.ttl:
+            conn.execute('DELETE FROM handles WHERE created_at < ?', (now - self.ttl,))
+            conn.execute('DELETE FROM artifacts WHERE created_at < ?', (now - self.ttl,))
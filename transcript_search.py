@@ -0,0 +1,323 @@
+"""Full-text search over transcripts this host has already extracted.
+
+Transcripts are split into passages of a few hundred characters, each
+carrying the start/end time of its first and last cue where timing is
+known, and stored in a SQLite FTS5 table next to a row of video metadata.
+Each caption language of a video is indexed on its own.
+
+Indexing stays off the request path: add() only queues the transcript in
+memory, and a background thread writes queued transcripts in batches, one
+transaction per batch, whenever batch_size are waiting or flush_interval
+seconds have passed. A transcript whose content hash is already indexed is
+skipped, so repeat requests for a cached video cost one lookup. The index
+file is shared by every worker on the host, like the transcript cache.
+"""
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+from cues import CueList
+from transcript_handles import transcript_handle
+from youtube_urls import canonical_url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'yt_transcript_index.sqlite3')
+PASSAGE_CHARS = 400
+SNIPPET_TOKENS = 16
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+# Bumped when the tables change; an older index is dropped and refills as
+# transcripts are served again
+SCHEMA_VERSION = 2
+
+
+def iter_passages(cues, text):
+    """Yield (start, end, text) passages of roughly PASSAGE_CHARS characters
+
+    Timed cues are grouped whole so every passage has a timestamp; untimed
+    transcripts are cut at word boundaries with no timing.
+    """
+    if cues is not None and cues.timed():
+        start = end = None
+        pieces = []
+        size = 0
+        for cue in cues:
+            if not pieces:
+                start = cue.start
+            pieces.append(cue.text)
+            size += len(cue.text) + 1
+            end = cue.end if cue.end is not None else cue.start
+            if size >= PASSAGE_CHARS:
+                yield start, end, ' '.join(pieces)
+                pieces, size = [], 0
+        if pieces:
+            yield start, end, ' '.join(pieces)
+        return
+
+    position = 0
+    while position < len(text):
+        cut = text.rfind(' ', position, position + PASSAGE_CHARS) if len(text) - position > PASSAGE_CHARS else -1
+        stop = cut if cut > position else min(position + PASSAGE_CHARS, len(text))
+        passage = text[position:stop].strip()
+        if passage:
+            yield None, None, passage
+        position = stop + 1 if cut > position else stop
+
+
+def match_query(query):
+    """Turn free text into an FTS5 query: every word must appear, a trailing * keeps prefix search"""
+    terms = []
+    for match in TERM_RE.finditer(query):
+        prefix = query[match.end():match.end() + 1] == '*'
+        terms.append(f'"{match.group()}"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+def format_timestamp(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+
+class TranscriptIndex:
+    """SQLite FTS5 passage index fed by a batching background writer"""
+
+    def __init__(self, path=DEFAULT_PATH, batch_size=50, flush_interval=2.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._writer = None
+        self._pid = os.getpid()
+        self._stats = {
+            'queued': 0,
+            'indexed': 0,
+            'unchanged': 0,
+            'batches': 0,
+            'errors': 0,
+        }
+        if self.path:
+            self._init_db()
+
+    @classmethod
+    def from_env(cls):
+        """Create an index configured from TRANSCRIPT_INDEX_* environment variables"""
+        return cls(
+            path=os.environ.get('TRANSCRIPT_INDEX_PATH', DEFAULT_PATH),
+            batch_size=int(os.environ.get('TRANSCRIPT_INDEX_BATCH', 50)),
+            flush_interval=float(os.environ.get('TRANSCRIPT_INDEX_INTERVAL', 2)),
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _init_db(self):
+        try:
+            with self._connect() as conn:
+                if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+                    # The first index left user_version at 0 and kept one transcript
+                    # per video, without a language column; it goes straight to 2
+                    # by dropping both tables, which refill as transcripts are served
+                    conn.execute('DROP TABLE IF EXISTS videos')
+                    conn.execute('DROP TABLE IF EXISTS passages')
+                    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS videos ('
+                    ' video_id TEXT NOT NULL,'
+                    ' language TEXT NOT NULL,'
+                    ' content_hash TEXT NOT NULL,'
+                    ' title TEXT,'
+                    ' uploader TEXT,'
+                    ' duration TEXT,'
+                    ' caption_type TEXT,'
+                    ' first_row INTEGER NOT NULL,'
+                    ' last_row INTEGER NOT NULL,'
+                    ' indexed_at REAL NOT NULL,'
+                    ' PRIMARY KEY (video_id, language))'
+                )
+                conn.execute(
+                    'CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5('
+                    ' text, video_id UNINDEXED, language UNINDEXED, start UNINDEXED, end UNINDEXED,'
+                    " tokenize = 'unicode61 remove_diacritics 2')"
+                )
+        except sqlite3.Error as e:
+            # Most often a Python built against a SQLite without FTS5
+            logger.error(f"Disabling transcript search index at {self.path}: {str(e)}")
+            self.path = ''
+
+    def add(self, video_id, captions_data):
+        """Queue a transcript for indexing under its video and language; returns immediately"""
+        if not self.path or not video_id or not captions_data:
+            return
+        with self._cond:
+            if self._pid != os.getpid():
+                # The writer thread and its queue stayed behind in the parent
+                self._pid = os.getpid()
+                self._pending = {}
+                self._writer = None
+            self._pending[(video_id, captions_data.get('language') or '')] = captions_data
+            self._stats['queued'] += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='transcript-index', daemon=True)
+                self._writer.start()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                if len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                batch, self._pending = self._pending, {}
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Write everything queued so far from the calling thread"""
+        with self._cond:
+            batch, self._pending = self._pending, {}
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        indexed = unchanged = 0
+        try:
+            with self._connect() as conn:
+                # Take the write lock up front so workers cannot hand out the same rowids
+                conn.execute('BEGIN IMMEDIATE')
+                for (video_id, language), captions_data in batch.items():
+                    content_hash = transcript_handle(captions_data)
+                    row = conn.execute('SELECT content_hash, first_row, last_row FROM videos'
+                                       ' WHERE video_id = ? AND language = ?', (video_id, language)).fetchone()
+                    if row and row[0] == content_hash:
+                        unchanged += 1
+                        continue
+                    if row:
+                        # Passages of one track sit in a contiguous rowid range; video_id is
+                        # not indexed in an FTS table, so deleting by it would scan everything
+                        conn.execute('DELETE FROM passages WHERE rowid BETWEEN ? AND ?', (row[1], row[2]))
+                    # Safe only under the BEGIN IMMEDIATE above: no other writer can take the
+                    # same range in between. A range freed below the top is never reused, so
+                    # rowids only grow; the holes cost nothing in an FTS table
+                    first_row = conn.execute('SELECT COALESCE(MAX(rowid), 0) + 1 FROM passages').fetchone()[0]
+                    cues = CueList.coerce(captions_data.get('cues'))
+                    passages = iter_passages(cues, captions_data.get('text') or '')
+                    rows = [(first_row + i, text, video_id, language, start, end)
+                            for i, (start, end, text) in enumerate(passages)]
+                    conn.executemany('INSERT INTO passages (rowid, text, video_id, language, start, end)'
+                                     ' VALUES (?, ?, ?, ?, ?, ?)', rows)
+                    conn.execute(
+                        'INSERT OR REPLACE INTO videos (video_id, language, content_hash, title, uploader,'
+                        ' duration, caption_type, first_row, last_row, indexed_at)'
+                        ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (video_id, language, content_hash, captions_data.get('title'), captions_data.get('uploader'),
+                         captions_data.get('duration'), captions_data.get('type'), first_row,
+                         first_row + len(rows) - 1, time.time())
+                    )
+                    indexed += 1
+        except sqlite3.Error as e:
+            logger.error(f"Transcript index write failed for {len(batch)} videos: {str(e)}")
+            with self._cond:
+                self._stats['errors'] += 1
+            return
+        with self._cond:
+            self._stats['indexed'] += indexed
+            self._stats['unchanged'] += unchanged
+            self._stats['batches'] += 1
+
+    def search(self, query, limit=20, per_video=3):
+        """Return transcripts matching query, best first, each with up to per_video snippets
+
+        A video indexed in several languages can appear once per language;
+        limit counts these transcripts. Matched terms are wrapped in [ ] in the snippets. Raises ValueError
+        when the query has no searchable words.
+        """
+        expression = match_query(query)
+        if not expression:
+            raise ValueError('Search query has no searchable words')
+        if not self.path:
+            return []
+        with self._connect() as conn:
+            # Rank every hit cheaply first; snippets are only built for the rows returned
+            rows = conn.execute(
+                'WITH hits AS ('
+                '  SELECT rowid AS id, video_id, language, start, end, bm25(passages) AS rank'
+                '  FROM passages WHERE passages MATCH ?'
+                '), ranked AS ('
+                '  SELECT *, ROW_NUMBER() OVER (PARTITION BY video_id, language ORDER BY rank) AS n,'
+                '  MIN(rank) OVER (PARTITION BY video_id, language) AS best,'
+                '  COUNT(*) OVER (PARTITION BY video_id, language) AS matches FROM hits'
+                ') '
+                'SELECT id, video_id, language, start, end, matches FROM ranked'
+                ' WHERE n <= ? ORDER BY best, video_id, language, n',
+                (expression, per_video)
+            )
+            hits = []
+            tracks = []
+            for row in rows:
+                if row[1:3] not in tracks:
+                    if len(tracks) >= limit:
+                        break
+                    tracks.append(row[1:3])
+                hits.append(row)
+            if not hits:
+                return []
+            marks = ','.join('?' * len(hits))
+            snippets = dict(conn.execute(
+                f"SELECT rowid, snippet(passages, 0, '[', ']', '…', {SNIPPET_TOKENS}) FROM passages"
+                f" WHERE passages MATCH ? AND rowid IN ({marks})",
+                [expression, *(hit[0] for hit in hits)]
+            ))
+            video_ids = sorted({video_id for video_id, _ in tracks})
+            details = {row[:2]: row[2:] for row in conn.execute(
+                'SELECT video_id, language, title, uploader, duration, caption_type FROM videos'
+                f" WHERE video_id IN ({','.join('?' * len(video_ids))})",
+                video_ids
+            )}
+
+        results = {}
+        for row_id, video_id, language, start, end, matches in hits:
+            result = results.get((video_id, language))
+            if result is None:
+                title, uploader, duration, caption_type = details.get((video_id, language), (None,) * 4)
+                result = results[(video_id, language)] = {
+                    'video_id': video_id,
+                    'url': canonical_url(video_id),
+                    'title': title,
+                    'uploader': uploader,
+                    'duration': duration,
+                    'language': language,
+                    'caption_type': caption_type,
+                    'matches': matches,
+                    'snippets': [],
+                }
+            hit = {'text': snippets.get(row_id), 'start': start, 'end': end}
+            if start is not None:
+                hit['timestamp'] = format_timestamp(start)
+                hit['url'] = f"{canonical_url(video_id)}&t={int(start)}s"
+            result['snippets'].append(hit)
+        return list(results.values())
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        if self.path:
+            try:
+                with self._connect() as conn:
+                    stats['videos'] = conn.execute('SELECT COUNT(*) FROM videos').fetchone()[0]
+            except sqlite3.Error as e:
+                logger.error(f"Error reading transcript index stats: {str(e)}")
+        return stats
@@ -0,0 +1,375 @@
+"""Rate-limit-aware scheduling for calls to YouTube.
+
+Every yt-dlp extraction, caption download and transcript API lookup goes
+through an UpstreamScheduler, which
+
+* takes a token from a bucket shared by all gunicorn workers on the host,
+  so the host as a whole stays under UPSTREAM_RATE requests per second;
+* retries rate-limited and transient failures with exponential backoff and
+  full jitter, honouring Retry-After;
+* on a 429 or bot-check page pauses the shared bucket, so the other workers
+  back off too instead of piling on;
+* opens a shared circuit breaker after repeated failures and rejects calls
+  until a single probe succeeds again.
+
+acall() does the same for coroutines in the ASGI server (see asgi.py).
+
+Bucket and breaker state live in one SQLite row per upstream, updated under
+BEGIN IMMEDIATE so concurrent workers see a consistent view. With an empty
+UPSTREAM_STATE_PATH the state is an in-memory database private to the
+process. Callers get RateLimited or UpstreamUnavailable, both carrying a
+retry_after hint, instead of a generic failure.
+"""
+import logging
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'yt_upstream.sqlite3')
+
+RATE_LIMIT_RE = re.compile(r'HTTP Error 429|Too Many Requests|confirm you.re not a bot|unusual traffic', re.IGNORECASE)
+TRANSIENT_RE = re.compile(r'HTTP Error 5\d\d|timed out|Connection (?:reset|refused|aborted)|Remote end closed',
+                          re.IGNORECASE)
+
+RATE_LIMITED = 'rate_limited'
+TRANSIENT = 'transient'
+
+
+class UpstreamError(Exception):
+    """YouTube could not be reached or refused the request; retry after retry_after seconds"""
+
+    status_code = 503
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimited(UpstreamError):
+    status_code = 429
+
+
+class UpstreamUnavailable(UpstreamError):
+    status_code = 503
+
+
+def _status_code(exc):
+    response = getattr(exc, 'response', None)
+    code = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+    return code if isinstance(code, int) else None
+
+
+def _retry_after(exc):
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(exc):
+    """Return RATE_LIMITED, TRANSIENT or None (a definitive answer such as a private video)"""
+    if exc.__class__.__name__ == 'TooManyRequests':
+        return RATE_LIMITED
+    code = _status_code(exc)
+    if code == 429:
+        return RATE_LIMITED
+    if code is not None and code >= 500:
+        return TRANSIENT
+    message = str(exc)
+    if RATE_LIMIT_RE.search(message):
+        return RATE_LIMITED
+    if TRANSIENT_RE.search(message) or isinstance(exc, (ConnectionError, TimeoutError)):
+        return TRANSIENT
+    return None
+
+
+class UpstreamScheduler:
+    """Shared token bucket, backoff and circuit breaker for one upstream"""
+
+    def __init__(self, name='youtube', path=DEFAULT_PATH, rate=5.0, burst=10, max_wait=10.0,
+                 max_attempts=3, backoff_base=0.5, backoff_max=8.0, rate_limit_pause=30.0,
+                 breaker_threshold=5, breaker_cooldown=30.0, sleep=time.sleep, clock=time.time):
+        self.name = name
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limit_pause = rate_limit_pause
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.sleep = sleep
+        self.clock = clock
+        self._memory = None
+        self._memory_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'retries': 0,
+            'rate_limited': 0,
+            'transient_errors': 0,
+            'throttled_wait_s': 0.0,
+            'rejected': 0,
+        }
+        with self._transaction() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS upstreams ('
+                ' name TEXT PRIMARY KEY,'
+                ' tokens REAL NOT NULL,'
+                ' updated_at REAL NOT NULL,'
+                ' paused_until REAL NOT NULL DEFAULT 0,'
+                ' failures INTEGER NOT NULL DEFAULT 0,'
+                ' opened_until REAL NOT NULL DEFAULT 0)'
+            )
+            conn.execute(
+                'INSERT OR IGNORE INTO upstreams (name, tokens, updated_at) VALUES (?, ?, ?)',
+                (name, float(burst), self.clock())
+            )
+
+    @classmethod
+    def from_env(cls, name='youtube'):
+        """Create a scheduler configured from UPSTREAM_* environment variables"""
+        return cls(
+            name=name,
+            path=os.environ.get('UPSTREAM_STATE_PATH', DEFAULT_PATH),
+            rate=float(os.environ.get('UPSTREAM_RATE', 5)),
+            burst=int(os.environ.get('UPSTREAM_BURST', 10)),
+            max_wait=float(os.environ.get('UPSTREAM_MAX_WAIT', 10)),
+            max_attempts=int(os.environ.get('UPSTREAM_MAX_ATTEMPTS', 3)),
+            backoff_base=float(os.environ.get('UPSTREAM_BACKOFF_BASE', 0.5)),
+            backoff_max=float(os.environ.get('UPSTREAM_BACKOFF_MAX', 8)),
+            rate_limit_pause=float(os.environ.get('UPSTREAM_RATE_LIMIT_PAUSE', 30)),
+            breaker_threshold=int(os.environ.get('UPSTREAM_BREAKER_THRESHOLD', 5)),
+            breaker_cooldown=float(os.environ.get('UPSTREAM_BREAKER_COOLDOWN', 30)),
+        )
+
+    def _transaction(self):
+        return _Transaction(self)
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _reserve(self):
+        """Take a token or report how long to wait: returns (wait, circuit_open)"""
+        with self._transaction() as conn:
+            # Read the clock under the write lock, or a stale timestamp could roll
+            # updated_at backwards and credit the same interval twice
+            now = self.clock()
+            tokens, updated_at, paused_until, failures, opened_until = conn.execute(
+                'SELECT tokens, updated_at, paused_until, failures, opened_until FROM upstreams WHERE name = ?',
+                (self.name,)
+            ).fetchone()
+            if opened_until > now:
+                return opened_until - now, True
+            tokens = min(float(self.burst), tokens + max(now - updated_at, 0) * self.rate)
+            if paused_until > now:
+                wait = paused_until - now
+            elif tokens >= 1 or not self.rate:
+                tokens -= 1
+                wait = 0.0
+                if opened_until:
+                    # Half-open: this caller probes, everyone else stays out until it reports back
+                    opened_until = now + self.breaker_cooldown
+            else:
+                wait = (1 - tokens) / self.rate
+            conn.execute('UPDATE upstreams SET tokens = ?, updated_at = ?, opened_until = ? WHERE name = ?',
+                         (tokens, now, opened_until, self.name))
+        return wait, False
+
+    def _admit(self, wait, circuit_open, waited):
+        """True when a token was granted; raises when the call must be rejected"""
+        if circuit_open:
+            self._count('rejected')
+            metrics.inc('yt_upstream_errors_total', upstream=self.name, kind='circuit_open')
+            raise UpstreamUnavailable('YouTube is temporarily unavailable; please retry shortly.',
+                                      retry_after=wait)
+        if not wait:
+            if waited:
+                self._count('throttled_wait_s', waited)
+            return True
+        if waited + wait > self.max_wait:
+            self._count('rejected')
+            metrics.inc('yt_upstream_errors_total', upstream=self.name, kind='throttled')
+            raise RateLimited('Too many requests to YouTube right now; please retry shortly.',
+                              retry_after=wait)
+        return False
+
+    def _acquire(self):
+        waited = 0.0
+        while True:
+            wait, circuit_open = self._reserve()
+            if self._admit(wait, circuit_open, waited):
+                return
+            self.sleep(wait)
+            waited += wait
+
+    async def _acquire_async(self):
+        # Imported here: the WSGI app never needs asyncio
+        import asyncio
+
+        waited = 0.0
+        while True:
+            # The SQLite transaction can block on other workers, so it runs off the event loop
+            wait, circuit_open = await asyncio.to_thread(self._reserve)
+            if self._admit(wait, circuit_open, waited):
+                return
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def _record(self, failed, pause=0.0):
+        with self._transaction() as conn:
+            now = self.clock()
+            if not failed:
+                conn.execute('UPDATE upstreams SET failures = 0, opened_until = 0 WHERE name = ?', (self.name,))
+                return
+            failures = conn.execute('SELECT failures FROM upstreams WHERE name = ?',
+                                    (self.name,)).fetchone()[0] + 1
+            opened_until = now + self.breaker_cooldown if failures >= self.breaker_threshold else 0
+            if opened_until:
+                logger.warning(f"Opening {self.name} circuit for {self.breaker_cooldown}s after {failures} failures")
+            conn.execute(
+                'UPDATE upstreams SET failures = ?, opened_until = ?, paused_until = MAX(paused_until, ?)'
+                ' WHERE name = ?',
+                (failures, opened_until, now + pause if pause else 0, self.name)
+            )
+
+    def backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, never shorter than Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0)
+
+    def _failed(self, exc, attempt):
+        """Book a failed attempt: returns seconds to wait before retrying, None if exc is final
+
+        Raises RateLimited or UpstreamUnavailable once the attempts are used up.
+        """
+        kind = classify(exc)
+        if kind is None:
+            # YouTube answered (private video, no captions...): upstream is healthy
+            self._record(failed=False)
+            return None
+        retry_after = _retry_after(exc)
+        metrics.inc('yt_upstream_errors_total', upstream=self.name, kind=kind)
+        if kind == RATE_LIMITED:
+            self._count('rate_limited')
+            pause = retry_after or self.rate_limit_pause
+            logger.warning(f"{self.name} rate limited us; pausing all workers for {pause}s: {str(exc)}")
+            self._record(failed=True, pause=pause)
+        else:
+            self._count('transient_errors')
+            self._record(failed=True)
+        if attempt + 1 >= self.max_attempts:
+            error_class = RateLimited if kind == RATE_LIMITED else UpstreamUnavailable
+            raise error_class(
+                'YouTube is rate limiting requests; please retry shortly.' if kind == RATE_LIMITED
+                else f'YouTube request failed: {str(exc)}',
+                retry_after=retry_after or (self.rate_limit_pause if kind == RATE_LIMITED else None)
+            ) from exc
+        self._count('retries')
+        # Rate-limited retries wait on the shared pause in _acquire instead
+        return self.backoff(attempt, retry_after) if kind == TRANSIENT else 0.0
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn under the rate limit, retrying rate-limited and transient failures"""
+        self._count('calls')
+        metrics.inc('yt_upstream_calls_total', upstream=self.name)
+        for attempt in range(self.max_attempts):
+            self._acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._failed(e, attempt)
+                if delay is None:
+                    raise
+                if delay:
+                    self.sleep(delay)
+            else:
+                self._record(failed=False)
+                return result
+
+    async def acall(self, fn, *args, **kwargs):
+        """call() for a coroutine function, waiting with asyncio.sleep instead of blocking"""
+        import asyncio
+
+        self._count('calls')
+        metrics.inc('yt_upstream_calls_total', upstream=self.name)
+        for attempt in range(self.max_attempts):
+            await self._acquire_async()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = await asyncio.to_thread(self._failed, e, attempt)
+                if delay is None:
+                    raise
+                if delay:
+                    await asyncio.sleep(delay)
+            else:
+                await asyncio.to_thread(self._record, False)
+                return result
+
+    def state(self):
+        with self._transaction() as conn:
+            tokens, updated_at, paused_until, failures, opened_until = conn.execute(
+                'SELECT tokens, updated_at, paused_until, failures, opened_until FROM upstreams WHERE name = ?',
+                (self.name,)
+            ).fetchone()
+        now = self.clock()
+        return {
+            'tokens': round(min(float(self.burst), tokens + max(now - updated_at, 0) * self.rate), 2),
+            'paused_for_s': round(max(paused_until - now, 0), 2),
+            'consecutive_failures': failures,
+            'circuit': 'open' if opened_until > now else ('half-open' if opened_until else 'closed'),
+        }
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['throttled_wait_s'] = round(stats['throttled_wait_s'], 3)
+        stats.update(self.state())
+        return stats
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT on a fresh connection (or the shared in-memory one)"""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.conn = None
+        self.locked = False
+
+    def __enter__(self):
+        scheduler = self.scheduler
+        if scheduler.path:
+            self.conn = sqlite3.connect(scheduler.path, timeout=5, isolation_level=None)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+        else:
+            scheduler._memory_lock.acquire()
+            self.locked = True
+            if scheduler._memory is None:
+                scheduler._memory = sqlite3.connect(':memory:', isolation_level=None, check_same_thread=False)
+            self.conn = scheduler._memory
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            if self.locked:
+                self.scheduler._memory_lock.release()
+            else:
+                self.conn.close()
+        return False
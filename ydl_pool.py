@@ -0,0 +1,252 @@
+"""Per-process pool of reusable YoutubeDL instances with keep-alive HTTP sessions.
+
+Creating a YoutubeDL per request throws away its cookie jar, its extractor
+instances and its HTTP state, so every extraction pays for setup and fresh
+TLS handshakes again. The pool keeps up to `size` warm instances and hands
+each one to a single thread at a time (YoutubeDL is not thread-safe).
+
+Caption tracks are fetched through a requests.Session paired with each
+instance, which keeps connections to the caption hosts alive between
+requests; yt-dlp's own urllib handler closes them after every download.
+The session shares the instance's cookie jar and default headers.
+
+Instances are recycled after max_uses extractions or max_age seconds, are
+dropped after max_idle seconds unused (the server will have closed their
+connections) and are discarded whenever an extraction through them raises.
+
+yt-dlp and requests are imported with the first instance (or by warm()),
+not with this module, so a process that only serves cached transcripts
+never pays for them.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class _CaptionResponse:
+    """File-like caption body that hands its connection back for reuse on close"""
+
+    def __init__(self, response):
+        self._response = response
+        self._finished = False
+
+    def read(self, amt=None):
+        data = self._response.raw.read(amt, decode_content=True)
+        if not data:
+            self._finished = True
+        return data
+
+    def close(self):
+        if self._finished:
+            self._response.raw.release_conn()
+        else:
+            # A partly read body would poison the connection, so drop it
+            self._response.close()
+
+
+class PooledYoutubeDL:
+    """A YoutubeDL instance plus the keep-alive session used for its downloads"""
+
+    def __init__(self, opts, timeout=30):
+        import requests
+        import yt_dlp
+
+        self.ydl = yt_dlp.YoutubeDL(opts)
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(self.ydl.params.get('http_headers') or {})
+        cookiejar = getattr(self.ydl, 'cookiejar', None)
+        if cookiejar is not None:
+            self.session.cookies = cookiejar
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+
+    def extract_info(self, url, download=False):
+        return self.ydl.extract_info(url, download=download)
+
+    def extract_flat(self, url):
+        """List a playlist or channel without loading each video's page"""
+        params = self.ydl.params
+        previous = params.get('extract_flat')
+        params['extract_flat'] = 'in_playlist'
+        try:
+            return self.ydl.extract_info(url, download=False)
+        finally:
+            params['extract_flat'] = previous
+
+    def urlopen(self, url):
+        """Open a caption URL; non-HTTP URLs go through yt-dlp itself"""
+        if not url.startswith(('http://', 'https://')):
+            return self.ydl.urlopen(url)
+        response = self.session.get(url, stream=True, timeout=self.timeout)
+        response.raise_for_status()
+        return _CaptionResponse(response)
+
+    def close(self):
+        self.session.close()
+        self.ydl.close()
+
+
+class YoutubeDLPool:
+    """Bounded pool of PooledYoutubeDL instances shared by a worker's threads"""
+
+    def __init__(self, opts, size=4, max_uses=100, max_age=1800, max_idle=300, wait=30):
+        self.opts = dict(opts)
+        self.size = size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.wait = wait
+        self._idle = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'recycled': 0,
+            'discarded': 0,
+            'overflow': 0,
+        }
+
+    @classmethod
+    def from_env(cls, opts):
+        """Create a pool configured from YTDL_POOL_* environment variables"""
+        return cls(
+            opts,
+            size=int(os.environ.get('YTDL_POOL_SIZE', 4)),
+            max_uses=int(os.environ.get('YTDL_POOL_MAX_USES', 100)),
+            max_age=int(os.environ.get('YTDL_POOL_MAX_AGE', 1800)),
+            max_idle=int(os.environ.get('YTDL_POOL_MAX_IDLE', 300)),
+            wait=float(os.environ.get('YTDL_POOL_WAIT', 30)),
+        )
+
+    def _check_fork(self):
+        # Instances (and their sockets) created before a fork belong to the parent
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._in_use = 0
+
+    def _healthy(self, entry, now):
+        if self.max_uses and entry.uses >= self.max_uses:
+            return False
+        if self.max_age and now - entry.created_at > self.max_age:
+            return False
+        return not (self.max_idle and now - entry.last_used > self.max_idle)
+
+    def _create(self):
+        entry = PooledYoutubeDL(self.opts)
+        with self._cond:
+            self._stats['created'] += 1
+        return entry
+
+    def _close(self, entry):
+        try:
+            entry.close()
+        except Exception as e:
+            logger.error(f"Error closing pooled YoutubeDL: {str(e)}")
+
+    def _checkout(self):
+        """Return (entry, pooled); pooled is False for an overflow instance"""
+        deadline = time.monotonic() + self.wait
+        stale = []
+        try:
+            with self._cond:
+                self._check_fork()
+                while True:
+                    now = time.monotonic()
+                    while self._idle:
+                        entry = self._idle.pop()
+                        if self._healthy(entry, now):
+                            self._in_use += 1
+                            self._stats['reused'] += 1
+                            return entry, True
+                        stale.append(entry)
+                        self._stats['recycled'] += 1
+                    if self._in_use < self.size:
+                        self._in_use += 1
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats['overflow'] += 1
+                        logger.warning(f"YoutubeDL pool exhausted after {self.wait}s; using a temporary instance")
+                        return self._create(), False
+                    self._cond.wait(remaining)
+        finally:
+            for entry in stale:
+                self._close(entry)
+
+        try:
+            return self._create(), True
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def _checkin(self, entry, keep):
+        entry.uses += 1
+        entry.last_used = time.monotonic()
+        with self._cond:
+            if os.getpid() == self._pid:
+                self._in_use -= 1
+                if keep and self._healthy(entry, entry.last_used):
+                    self._idle.append(entry)
+                    entry = None
+                elif keep:
+                    self._stats['recycled'] += 1
+                else:
+                    self._stats['discarded'] += 1
+                self._cond.notify()
+        if entry is not None:
+            self._close(entry)
+
+    @contextmanager
+    def acquire(self):
+        """Check out an instance for the duration of a with block"""
+        entry, pooled = self._checkout()
+        if not pooled:
+            try:
+                yield entry
+            finally:
+                self._close(entry)
+            return
+        try:
+            yield entry
+        except BaseException:
+            self._checkin(entry, keep=False)
+            raise
+        self._checkin(entry, keep=True)
+
+    def warm(self, count=1):
+        """Import yt-dlp and create up to count idle instances ahead of the first request"""
+        import requests  # noqa: F401
+        import yt_dlp  # noqa: F401
+
+        with self._cond:
+            self._check_fork()
+            missing = min(count, self.size - self._in_use) - len(self._idle)
+        for _ in range(max(missing, 0)):
+            entry = self._create()
+            with self._cond:
+                self._idle.append(entry)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._in_use
+            stats['size'] = self.size
+        return stats
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for entry in idle:
+            self._close(entry)
@@ -0,0 +1,69 @@
+"""Canonicalize the many shapes of YouTube links down to a video ID.
+
+Watch pages, youtu.be short links, shorts, embeds, live pages and the
+mobile/music domains all name the same video, so everything that keys work
+on a video (the transcript cache, request coalescing) goes through here.
+"""
+import re
+from urllib.parse import parse_qs, urlsplit
+
+VIDEO_ID_RE = re.compile(r'^[0-9A-Za-z_-]{11}$')
+
+YOUTUBE_HOSTS = {
+    'youtube.com',
+    'www.youtube.com',
+    'm.youtube.com',
+    'music.youtube.com',
+    'youtube-nocookie.com',
+    'www.youtube-nocookie.com',
+}
+SHORT_HOSTS = {'youtu.be', 'www.youtu.be'}
+
+# Path prefixes whose next segment is the video ID, e.g. /shorts/<id>
+ID_PATH_PREFIXES = {'shorts', 'embed', 'live', 'v', 'e'}
+
+
+def _split(url):
+    url = (url or '').strip()
+    if not url:
+        return None
+    if '://' not in url:
+        url = f"https://{url}"
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    return parts, (parts.hostname or '').lower()
+
+
+def is_youtube_url(url):
+    """Check whether a URL points at a YouTube host"""
+    split = _split(url)
+    return bool(split) and (split[1] in YOUTUBE_HOSTS or split[1] in SHORT_HOSTS)
+
+
+def extract_video_id(url):
+    """Return the canonical 11-character video ID for a YouTube URL, or None"""
+    split = _split(url)
+    if not split:
+        return None
+    parts, host = split
+    segments = [s for s in parts.path.split('/') if s]
+
+    candidate = None
+    if host in SHORT_HOSTS:
+        candidate = segments[0] if segments else None
+    elif host in YOUTUBE_HOSTS:
+        if segments[:1] == ['watch'] or not segments:
+            candidate = (parse_qs(parts.query).get('v') or [None])[0]
+        elif len(segments) >= 2 and segments[0] in ID_PATH_PREFIXES:
+            candidate = segments[1]
+
+    if candidate and VIDEO_ID_RE.match(candidate):
+        return candidate
+    return None
+
+
+def canonical_url(video_id):
+    """Build the canonical watch URL for a video ID"""
+    return f"https://www.youtube.com/watch?v={video_id}"